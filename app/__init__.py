@@ -9,8 +9,60 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
     app.config['TMDB_API_KEY'] = os.environ.get('TMDB_API_KEY', '')
     app.config['MEDIA_DIR'] = os.environ.get('MEDIA_DIR', '/media')
+    app.config['DATA_DIR'] = os.environ.get('DATA_DIR', '/data')
+    app.config['LIBRARY_DIR'] = os.environ.get('LIBRARY_DIR', '')
+    app.config['ORGANIZE_WORKERS'] = int(os.environ.get('ORGANIZE_WORKERS', 4))
+    app.config['ORGANIZE_VERIFY'] = os.environ.get('ORGANIZE_VERIFY', 'true').lower() in ('1', 'true', 'yes')
+    app.config['SCAN_INDEX'] = os.environ.get('SCAN_INDEX', 'true').lower() in ('1', 'true', 'yes')
+    app.config['SCAN_CONCURRENCY'] = os.environ.get('SCAN_CONCURRENCY', 'auto').lower()
+    app.config['BLOCKING_THREADS'] = int(os.environ.get('BLOCKING_THREADS', 32))
+    app.config['SCAN_WORKERS'] = int(os.environ.get('SCAN_WORKERS', 16))
+    app.config['SCAN_MOUNT_CONCURRENCY'] = int(os.environ.get('SCAN_MOUNT_CONCURRENCY', 8))
+    app.config['SCAN_RESULTS_TTL'] = int(os.environ.get('SCAN_RESULTS_TTL', 3600))
+    app.config['BROWSE_CACHE_TTL'] = float(os.environ.get('BROWSE_CACHE_TTL', 30))
+    app.config['BROWSE_PAGE_SIZE'] = int(os.environ.get('BROWSE_PAGE_SIZE', 500))
+    app.config['COMPRESSION'] = os.environ.get('COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['STATIC_MAX_AGE'] = int(os.environ.get('STATIC_MAX_AGE', 365 * 86400))
+    app.config['TMDB_BASE_URL'] = os.environ.get('TMDB_BASE_URL', '')
+    app.config['MUSICBRAINZ_BASE_URL'] = os.environ.get('MUSICBRAINZ_BASE_URL', '')
+    app.config['TMDB_OFFLINE_INDEX'] = os.environ.get(
+        'TMDB_OFFLINE_INDEX', os.path.join(app.config['DATA_DIR'], 'tmdb_index.db'))
+    app.config['METADATA_CACHE'] = os.environ.get('METADATA_CACHE', 'true').lower() in ('1', 'true', 'yes')
+    app.config['METADATA_CACHE_TTL'] = int(os.environ.get('METADATA_CACHE_TTL', 7 * 86400))
+    app.config['METADATA_CACHE_NEGATIVE_TTL'] = int(os.environ.get('METADATA_CACHE_NEGATIVE_TTL', 3600))
+    app.config['METADATA_CACHE_SIZE'] = int(os.environ.get('METADATA_CACHE_SIZE', 100000))
+    app.config['HTTP_POOL_SIZE'] = int(os.environ.get('HTTP_POOL_SIZE', 10))
+    app.config['HTTP_CONNECT_TIMEOUT'] = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+    app.config['HTTP_READ_TIMEOUT'] = float(os.environ.get('HTTP_READ_TIMEOUT', 30))
+    app.config['UPSTREAM_CONCURRENCY'] = int(os.environ.get('UPSTREAM_CONCURRENCY', 10))
+    app.config['HTTP_RETRIES'] = int(os.environ.get('HTTP_RETRIES', 3))
+    app.config['HTTP_RETRY_BACKOFF'] = float(os.environ.get('HTTP_RETRY_BACKOFF', 0.5))
+    app.config['SINGLEFLIGHT'] = os.environ.get('SINGLEFLIGHT', 'true').lower() in ('1', 'true', 'yes')
+    app.config['MATCH_WORKERS'] = int(os.environ.get('MATCH_WORKERS', 8))
+    app.config['MUSICBRAINZ_RATE'] = float(os.environ.get('MUSICBRAINZ_RATE', 1.0))
+    app.config['MUSICBRAINZ_QUEUE_DEADLINE'] = float(os.environ.get('MUSICBRAINZ_QUEUE_DEADLINE', 30))
+    app.config['AUTO_ACCEPT_SCORE'] = float(os.environ.get('AUTO_ACCEPT_SCORE', 0.9))
+    app.config['AUTO_ACCEPT_MARGIN'] = float(os.environ.get('AUTO_ACCEPT_MARGIN', 0.05))
+    app.config['MATCH_JOB_RETENTION'] = int(os.environ.get('MATCH_JOB_RETENTION', 86400))
+    app.config['MATCH_MEMORY'] = os.environ.get('MATCH_MEMORY', 'true').lower() in ('1', 'true', 'yes')
+    app.config['WATCH_ENABLED'] = os.environ.get('WATCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    app.config['WATCH_DIRS'] = [d.strip() for d in os.environ.get('WATCH_DIRS', '').split(',') if d.strip()]
+    app.config['WATCH_MODE'] = os.environ.get('WATCH_MODE', 'auto')
+    app.config['WATCH_BACKEND'] = os.environ.get('WATCH_BACKEND', 'auto')
+    app.config['WATCH_SETTLE'] = float(os.environ.get('WATCH_SETTLE', 5))
+    app.config['WATCH_POLL_INTERVAL'] = float(os.environ.get('WATCH_POLL_INTERVAL', 10))
+    app.config['METRICS'] = os.environ.get('METRICS', 'true').lower() in ('1', 'true', 'yes')
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.config['DATA_DIR'], 'metrics'))
+
+    from . import blocking, metrics
+    metrics.REGISTRY.configure(app.config['METRICS_DIR'], enabled=app.config['METRICS'])
+    blocking.configure(app.config['BLOCKING_THREADS'])
 
     from . import routes
     app.register_blueprint(routes.bp)
 
+    if app.config['WATCH_ENABLED']:
+        routes.start_watcher(app)
+
     return app
@@ -0,0 +1,95 @@
+"""
+Media Renamer - Blocking Work
+Keeps filesystem and SQLite work off the event loop when serving with gevent
+"""
+
+import contextvars
+import itertools
+
+# Threads each gevent hub runs blocking calls on (gevent's default is 10)
+THREADS = 32
+
+_gevent = None
+_checked = False
+
+
+def _patched_gevent():
+    """Return the gevent module if this process is monkey-patched by it, else None."""
+    global _gevent, _checked
+
+    if not _checked:
+        try:
+            from gevent import monkey
+        except ImportError:
+            monkey = None
+        if monkey is not None and monkey.is_module_patched('threading'):
+            import gevent
+            import gevent.hub
+            gevent.hub.Hub.threadpool_size = THREADS
+            _gevent = gevent
+        _checked = True
+    return _gevent
+
+
+def configure(threads=THREADS):
+    """Set how many threads each hub uses for blocking calls. Call before serving."""
+    global THREADS, _checked
+
+    THREADS = threads
+    _checked = False
+    _patched_gevent()
+
+
+def call(func, *args):
+    """
+    Return func(*args). Under gevent it runs on a real thread from the
+    hub's threadpool, in a copy of the caller's context (so the app and
+    request are still current), and only the calling greenlet waits; with
+    threads it is simply called.
+    """
+    gevent = _patched_gevent()
+    if gevent is None:
+        return func(*args)
+    return gevent.get_hub().threadpool.apply(contextvars.copy_context().run, (func, *args))
+
+
+def iterate(iterable, batch=64):
+    """
+    Yield the items of iterable. Under gevent the iterable is advanced
+    `batch` items at a time on a thread of its own, always the same one,
+    so a long scan or batch rename never holds up the event loop and any
+    greenlets it starts itself stay on one hub. Closing this generator
+    closes the iterable on that thread.
+    """
+    gevent = _patched_gevent()
+    if gevent is None:
+        yield from iterable
+        return
+
+    from gevent.threadpool import ThreadPool
+
+    pool = ThreadPool(1)
+    context = contextvars.copy_context()
+    iterator = None
+
+    def take():
+        nonlocal iterator
+        if iterator is None:
+            iterator = iter(iterable)
+        return list(itertools.islice(iterator, batch))
+
+    def close():
+        if iterator is not None and hasattr(iterator, 'close'):
+            iterator.close()
+
+    try:
+        while True:
+            items = pool.apply(context.run, (take,))
+            if not items:
+                return
+            yield from items
+    finally:
+        try:
+            pool.apply(context.run, (close,))
+        finally:
+            pool.kill()
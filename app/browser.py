@@ -0,0 +1,156 @@
+"""
+Media Renamer - Directory Browser
+Fast, cached directory listings with media counts computed in the background
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import blocking, renamer
+
+
+def list_subdirectories(path):
+    """
+    Return [(name, path)] for the subdirectories of path, sorted by name.
+    Uses os.scandir so entry types come from the directory itself (d_type)
+    and only symlinks or filesystems without d_type need a stat.
+    """
+    items = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    items.append((entry.name, entry.path))
+            except OSError:
+                continue
+    items.sort()
+    return items
+
+
+class ListingCache:
+    """
+    Short-lived LRU cache of directory listings keyed by path and mtime.
+
+    A listing is reused while the directory's mtime is unchanged and it is
+    younger than `ttl`, so navigating back and forth costs one stat per
+    directory instead of a full listing. The TTL bounds staleness on
+    network filesystems with coarse or cached mtimes.
+    """
+
+    def __init__(self, ttl=30, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def listing(self, path):
+        """Return the cached or fresh subdirectory listing of path. Raises OSError."""
+        return self.stamped_listing(path)[1]
+
+    def stamped_listing(self, path):
+        """Return (mtime_ns, listing): the listing and the directory mtime it is for."""
+        mtime_ns = os.stat(path).st_mtime_ns
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached and cached[0] == mtime_ns and now - cached[1] < self.ttl:
+                self._entries.move_to_end(path)
+                return mtime_ns, cached[2]
+
+        items = list_subdirectories(path)
+
+        with self._lock:
+            self._entries[path] = (mtime_ns, now, items)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return mtime_ns, items
+
+
+def count_media_files(path, max_entries=20000):
+    """
+    Count media files in a directory tree, giving up after visiting
+    max_entries entries. Returns (count, truncated).
+    """
+    count = 0
+    visited = 0
+    stack = [path]
+
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    visited += 1
+                    if visited > max_entries:
+                        return count, True
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif renamer.is_video_file(entry.name) or renamer.is_audio_file(entry.name):
+                            count += 1
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+    return count, False
+
+
+class MediaCounter:
+    """
+    Counts media files under directories on a small background pool, so a
+    listing can be returned straight away and the counts fetched later.
+
+    Counts are remembered for `ttl` seconds. Directories already counted
+    or being counted are not queued again.
+    """
+
+    # Drop expired counts once this many are remembered
+    MAX_COUNTS = 10000
+
+    def __init__(self, workers=2, ttl=300, max_entries=20000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-count')
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._pending = set()
+
+    def _count(self, path):
+        try:
+            count, truncated = blocking.call(count_media_files, path, self.max_entries)
+            with self._lock:
+                self._counts[path] = (time.monotonic(), count, truncated)
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+
+    def counts(self, paths):
+        """
+        Return {path: {'count', 'truncated'} or None} for the given paths,
+        queueing a background count for any that are not known yet.
+        """
+        now = time.monotonic()
+        result = {}
+        queue = []
+
+        with self._lock:
+            if len(self._counts) > self.MAX_COUNTS:
+                self._counts = {p: c for p, c in self._counts.items() if now - c[0] < self.ttl}
+            for path in paths:
+                known = self._counts.get(path)
+                if known and now - known[0] < self.ttl:
+                    result[path] = {'count': known[1], 'truncated': known[2]}
+                    continue
+                result[path] = None
+                if path not in self._pending:
+                    self._pending.add(path)
+                    queue.append(path)
+
+        for path in queue:
+            self._pool.submit(self._count, path)
+        return result
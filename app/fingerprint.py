@@ -0,0 +1,187 @@
+"""
+Media Renamer - Match Memory
+Remembers accepted matches by file content, so moved or renamed files are recognized
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Bytes hashed from each end of a file
+CHUNK_SIZE = 64 * 1024
+
+# Rename fields worth remembering for each media type
+MATCH_FIELDS = {
+    'movie': ('title', 'year'),
+    'tv': ('show_name', 'season', 'episode', 'episode_title'),
+    'music': ('artist', 'title')
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS matches (
+    fingerprint TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    match TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    recorded REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS matches_size ON matches (size);
+'''
+
+
+def fingerprint(path, size=None):
+    """
+    Cheap content fingerprint: the file size plus a BLAKE2 hash of its
+    first and last 64 KiB. Reads at most 128 KiB however large the file.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if size is None:
+            size = os.fstat(fd).st_size
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(os.pread(fd, CHUNK_SIZE, 0))
+        if size > CHUNK_SIZE:
+            tail = max(CHUNK_SIZE, size - CHUNK_SIZE)
+            digest.update(os.pread(fd, size - tail, tail))
+    finally:
+        os.close(fd)
+    return f'{size}:{digest.hexdigest()}'
+
+
+class MatchMemory:
+    """
+    SQLite store of accepted matches keyed by content fingerprint, shared
+    by all worker processes through DATA_DIR.
+
+    Sizes are stored separately so a scan only needs to fingerprint files
+    whose size matches something remembered; for media files that is
+    almost never a false candidate.
+
+    Safe to share between threads: each thread gets its own connection.
+    """
+
+    # Seconds a scan may reuse the set of remembered sizes
+    SIZES_TTL = 5
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sizes = None
+        self._sizes_loaded = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connect(self):
+        """Return this thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def remember(self, entries):
+        """
+        Store accepted matches from (fingerprint, file_type, file_data, filename)
+        tuples. Only the rename fields for the type are kept.
+        """
+        rows = []
+        now = time.time()
+        for fp, file_type, file_data, filename in entries:
+            fields = MATCH_FIELDS.get(file_type)
+            if fields is None:
+                continue
+            match = {field: file_data.get(field) for field in fields}
+            rows.append((fp, int(fp.split(':', 1)[0]), file_type, json.dumps(match), filename, now))
+
+        if not rows:
+            return 0
+
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO matches (fingerprint, size, type, match, filename, recorded) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        with self._lock:
+            self._sizes = None
+        return len(rows)
+
+    def forget(self, fingerprints):
+        """Drop remembered matches by fingerprint."""
+        conn = self._connect()
+        with conn:
+            conn.executemany('DELETE FROM matches WHERE fingerprint = ?', ((fp,) for fp in fingerprints))
+        with self._lock:
+            self._sizes = None
+
+    def lookup(self, fp):
+        """Return the remembered match for a fingerprint, or None."""
+        row = self._connect().execute(
+            'SELECT type, match, filename, recorded FROM matches WHERE fingerprint = ?', (fp,)
+        ).fetchone()
+        if row is None:
+            return None
+        file_type, match, filename, recorded = row
+        return {'type': file_type, **json.loads(match), 'filename': filename, 'recorded': recorded}
+
+    def known_sizes(self):
+        """Return the set of file sizes with a remembered match."""
+        with self._lock:
+            if self._sizes is not None and time.monotonic() - self._sizes_loaded < self.SIZES_TTL:
+                return self._sizes
+
+        sizes = {size for (size,) in self._connect().execute('SELECT DISTINCT size FROM matches')}
+        with self._lock:
+            self._sizes, self._sizes_loaded = sizes, time.monotonic()
+        return sizes
+
+    def count(self):
+        (count,) = self._connect().execute('SELECT COUNT(*) FROM matches').fetchone()
+        return count
+
+    def version(self):
+        """A string that changes whenever a match is remembered or forgotten."""
+        count, recorded = self._connect().execute('SELECT COUNT(*), MAX(recorded) FROM matches').fetchone()
+        return f'{count}:{recorded}'
+
+
+def attach_known_matches(files, memory, fingerprint_file=None, stats=None):
+    """
+    Add a "known_match" to each scanned file whose content matches one
+    remembered in memory. fingerprint_file(path, stat_result) can supply
+    cached fingerprints; by default files are hashed directly.
+
+    stats maps paths to the stat results the scanner already has (see
+    renamer.list_media_files); entries are taken out as files go by, and
+    only files missing from it are stat-ed here. A file is only opened
+    when its size matches a remembered one.
+    """
+    sizes = memory.known_sizes()
+    for file_info in files:
+        if sizes:
+            try:
+                st = stats.pop(file_info['filepath'], None) if stats is not None else None
+                if st is None:
+                    st = os.stat(file_info['filepath'])
+                if st.st_size in sizes:
+                    fp = (fingerprint_file(file_info['filepath'], st) if fingerprint_file
+                          else fingerprint(file_info['filepath'], st.st_size))
+                    match = memory.lookup(fp)
+                    if match is not None:
+                        file_info['known_match'] = match
+            except OSError:
+                pass
+        yield file_info
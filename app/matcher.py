@@ -0,0 +1,390 @@
+"""
+Media Renamer - Auto-Match Jobs
+Resolves a whole scan against TMDB/MusicBrainz in the background
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from difflib import SequenceMatcher
+
+import requests
+
+from . import ranking, renamer
+from .ranking import year_of
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class JobStore:
+    """
+    Keeps job state as JSON files in a directory, so a progress poll can be
+    answered by any worker process, not just the one running the job.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def save(self, job):
+        """Atomically write a job's state."""
+        tmp_path = self._path(job['id']) + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job['id']))
+
+    def load(self, job_id):
+        """Return a job's state, or None if there is no such job."""
+        if not JOB_ID_RE.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def prune(self, max_age):
+        """Delete job files older than max_age seconds."""
+        cutoff = time.time() - max_age
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    continue
+
+
+def normalize_title(title):
+    """Lowercase a title and reduce it to words, for comparisons."""
+    return ' '.join(re.findall(r'\w+', (title or '').casefold()))
+
+
+def group_files(files):
+    """
+    Group scanned files by what needs looking up, so each movie, show or
+    track query is searched once however many files share it.
+    Returns dict of group key to list of file info dicts.
+    """
+    groups = {}
+    for file_info in files:
+        info = file_info.get('detected_info') or {}
+        file_type = file_info.get('type')
+
+        if file_info.get('known_match'):
+            key = ('known', file_info.get('filepath'))
+        elif file_type == 'movie' and info.get('name'):
+            key = ('movie', normalize_title(info['name']), info.get('year') or '')
+        elif file_type == 'tv' and info.get('show_name'):
+            key = ('tv', normalize_title(info['show_name']))
+        elif file_type == 'music' and info.get('resolved'):
+            key = ('resolved', file_info.get('filepath'))
+        elif file_type == 'music' and info.get('query'):
+            key = ('music', normalize_title(info['query']))
+        else:
+            key = ('unmatched', file_info.get('filepath'))
+
+        groups.setdefault(key, []).append(file_info)
+    return groups
+
+
+def _plan_entry(file_info, status, confidence=0.0, message='', accepted=False, **match):
+    """
+    Build one rename plan entry. Matched entries can be sent to
+    /api/batch/rename; "accepted" marks those confident enough to rename
+    without review.
+    """
+    entry = {
+        'filepath': file_info.get('filepath'),
+        'filename': file_info.get('filename'),
+        'type': file_info.get('type'),
+        'status': status,
+        'confidence': confidence,
+        'accepted': accepted and status == 'matched',
+        'message': message,
+        'new_filename': None
+    }
+    entry.update(match)
+
+    if status == 'matched':
+        extension = file_info.get('extension') or renamer.get_extension(file_info.get('filename', ''))
+        if entry['type'] == 'movie':
+            entry['new_filename'] = renamer.get_movie_filename(match['title'], match['year'], extension)
+        elif entry['type'] == 'tv':
+            entry['new_filename'] = renamer.get_tv_filename(
+                match['show_name'], match['season'], match['episode'], match['episode_title'], extension
+            )
+        elif entry['type'] == 'music':
+            entry['new_filename'] = renamer.get_music_filename(match['artist'], match['title'], extension)
+    return entry
+
+
+def search_movie(tmdb, files):
+    """
+    Search TMDB for a group of files detected as the same movie.
+    Returns the search for Ranker.rank_batch.
+    """
+    info = files[0]['detected_info']
+    name, year = info['name'], info.get('year')
+
+    results = tmdb.search_movie(name, year).get('results', [])
+    if not results and year:
+        results = tmdb.search_movie(name).get('results', [])
+    return name, year, results, 'title', 'release_date'
+
+
+def search_show(tmdb, files):
+    """
+    Search TMDB for a group of files detected as episodes of the same show.
+    Returns the search for Ranker.rank_batch.
+    """
+    show_name = files[0]['detected_info']['show_name']
+    return show_name, None, tmdb.search_tv(show_name).get('results', []), 'name', 'first_air_date'
+
+
+def resolve_movies(ranker, files, ranked):
+    """Resolve a group of files detected as the same movie from its ranked results."""
+    best, confidence, accepted = ranker.best(ranked)
+    if best is None:
+        return [_plan_entry(f, 'unmatched', message='No results') for f in files]
+
+    match_year = year_of(best.get('release_date')) or files[0]['detected_info'].get('year')
+    if not match_year:
+        return [_plan_entry(f, 'unmatched', confidence, 'Match has no release year') for f in files]
+
+    return [
+        _plan_entry(f, 'matched', confidence, accepted=accepted, tmdb_id=best.get('id'),
+                    title=best.get('title'), year=match_year)
+        for f in files
+    ]
+
+
+def resolve_episodes(tmdb, ranker, files, ranked):
+    """Resolve a group of files detected as episodes of the same show from its ranked results."""
+    best, confidence, accepted = ranker.best(ranked)
+    if best is None:
+        return [_plan_entry(f, 'unmatched', message='No results') for f in files]
+
+    seasons = {}
+    entries = []
+    for f in files:
+        info = f['detected_info']
+        season = int(info['season'])
+        if season not in seasons:
+            try:
+                seasons[season] = tmdb.get_season_episodes(best['id'], season)
+            except requests.RequestException:
+                seasons[season] = {}
+
+        entries.append(_plan_entry(
+            f, 'matched', confidence, accepted=accepted, tmdb_id=best.get('id'), show_name=best.get('name'),
+            season=info['season'], episode=info['episode'],
+            episode_title=seasons[season].get(int(info['episode']), '')
+        ))
+    return entries
+
+
+def match_known(files):
+    """Reuse the match remembered for each file's content."""
+    entries = []
+    for f in files:
+        known = {k: v for k, v in f['known_match'].items() if k not in ('filename', 'recorded')}
+        entries.append(_plan_entry(f, 'matched', 1.0, f"Matched before as {f['known_match']['filename']}",
+                                   accepted=True, source='memory', **known))
+    return entries
+
+
+def match_tagged(files):
+    """Accept files whose embedded tags already name the artist and title."""
+    return [
+        _plan_entry(f, 'matched', 1.0, 'From embedded tags', accepted=True,
+                    artist=f['detected_info']['artist'], title=f['detected_info']['title'], source='tags')
+        for f in files
+    ]
+
+
+def match_tracks(musicbrainz, ranker, files):
+    """Resolve a group of files with the same music query."""
+    query = files[0]['detected_info']['query']
+
+    recordings = musicbrainz.search_recording(query).get('recordings', [])
+    best, best_score = None, 0.0
+    for rec in recordings:
+        artist_credit = rec.get('artist-credit') or [{}]
+        artist = artist_credit[0].get('name', '')
+        similarity = SequenceMatcher(
+            None, normalize_title(query), normalize_title(f"{artist} {rec.get('title', '')}")
+        ).ratio()
+        score = round(similarity * rec.get('score', 0) / 100, 3)
+        if artist and score > best_score:
+            best, best_score = (rec, artist), score
+
+    if best is None:
+        return [_plan_entry(f, 'unmatched', message='No results') for f in files]
+
+    rec, artist = best
+    return [
+        _plan_entry(f, 'matched', best_score, accepted=ranker.accepts(best_score),
+                    musicbrainz_id=rec.get('id'), artist=artist, title=rec.get('title'))
+        for f in files
+    ]
+
+
+class MatchJob:
+    """
+    Background job that resolves scanned files into a proposed rename plan.
+
+    Files are grouped by detected movie, show or track, and TMDB groups are
+    searched concurrently on a bounded worker pool. Once every search is
+    back, all of their candidates are ranked in one Ranker.rank_batch call
+    and the groups resolved from that; episodes then fetch their seasons on
+    the same pool. MusicBrainz groups run on a single worker of their own
+    so they stay behind the client's 1 request/second limit without tying
+    up the TMDB workers. Files whose content was matched before, and music
+    files whose embedded tags already resolve them, skip the lookup
+    entirely.
+
+    Search results are ranked by a shared Ranker, which also decides which
+    matches are confident enough to be accepted without review.
+    """
+
+    # Minimum seconds between progress writes
+    SAVE_INTERVAL = 0.5
+
+    def __init__(self, files, store, tmdb=None, musicbrainz=None, workers=8, ranker=None):
+        self.files = files
+        self.store = store
+        self.tmdb = tmdb
+        self.musicbrainz = musicbrainz
+        self.workers = workers
+        self.ranker = ranker or ranking.Ranker()
+        self.groups = group_files(files)
+
+        self.state = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'created': time.time(),
+            'updated': time.time(),
+            'total': len(files),
+            'done': 0,
+            'matched': 0,
+            'accepted': 0,
+            'groups_total': len(self.groups),
+            'groups_done': 0,
+            'error': None,
+            'plan': None
+        }
+        self._lock = threading.Lock()
+        self._last_save = 0
+        self.store.save(self.state)
+
+    @property
+    def id(self):
+        return self.state['id']
+
+    def start(self):
+        """Run the job in a background thread."""
+        thread = threading.Thread(target=self.run, name=f'match-{self.id}', daemon=True)
+        thread.start()
+        return thread
+
+    def _guarded(self, files, func, *args):
+        """Run one group's step. Errors are recorded per file instead of failing the job."""
+        try:
+            return func(*args)
+        except Exception as e:
+            return [_plan_entry(f, 'error', message=str(e)) for f in files]
+
+    def _searched(self, key):
+        """Whether a group is searched on TMDB and ranked with the others."""
+        return key[0] in ('movie', 'tv') and self.tmdb is not None
+
+    def _resolve(self, key, files):
+        """Resolve a group that is not ranked with the TMDB searches."""
+        kind = key[0]
+        if kind == 'known':
+            return self._guarded(files, match_known, files)
+        if kind == 'resolved':
+            return self._guarded(files, match_tagged, files)
+        if kind == 'music' and self.musicbrainz:
+            return self._guarded(files, match_tracks, self.musicbrainz, self.ranker, files)
+
+        message = 'TMDB API key not configured' if kind in ('movie', 'tv') else 'Nothing to search for'
+        return [_plan_entry(f, 'unmatched', message=message) for f in files]
+
+    def _progress(self, entries):
+        with self._lock:
+            self.state['done'] += len(entries)
+            self.state['matched'] += sum(1 for e in entries if e['status'] == 'matched')
+            self.state['accepted'] += sum(1 for e in entries if e['accepted'])
+            self.state['groups_done'] += 1
+            self.state['updated'] = time.time()
+            if self.state['updated'] - self._last_save >= self.SAVE_INTERVAL:
+                self._last_save = self.state['updated']
+                self.store.save(self.state)
+
+    def run(self):
+        """Resolve every group and store the finished plan."""
+        self.state['status'] = 'running'
+        self.store.save(self.state)
+
+        results = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='match-tmdb') as pool, \
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix='match-musicbrainz') as serial:
+                searching = {}
+                futures = {}
+                for key, files in self.groups.items():
+                    if self._searched(key):
+                        search = search_movie if key[0] == 'movie' else search_show
+                        searching[pool.submit(search, self.tmdb, files)] = key
+                    elif key[0] == 'music' and self.musicbrainz:
+                        futures[serial.submit(self._resolve, key, files)] = key
+                    else:
+                        entries = results[key] = self._resolve(key, files)
+                        self._progress(entries)
+
+                searches = {}
+                for future in as_completed(searching):
+                    key = searching[future]
+                    error = future.exception()
+                    if error is None:
+                        searches[key] = future.result()
+                        continue
+                    entries = results[key] = [_plan_entry(f, 'error', message=str(error)) for f in self.groups[key]]
+                    self._progress(entries)
+
+                # Every TMDB group's candidates are scored together, then
+                # movies are settled at once and shows fetch their seasons
+                keys = list(searches)
+                for key, ranked in zip(keys, self.ranker.rank_batch([searches[k] for k in keys])):
+                    files = self.groups[key]
+                    if key[0] == 'movie':
+                        entries = results[key] = self._guarded(files, resolve_movies, self.ranker, files, ranked)
+                        self._progress(entries)
+                    else:
+                        futures[pool.submit(self._guarded, files, resolve_episodes,
+                                            self.tmdb, self.ranker, files, ranked)] = key
+
+                for future in as_completed(futures):
+                    entries = future.result()
+                    results[futures[future]] = entries
+                    self._progress(entries)
+
+            # Plan entries keep the order files were given in
+            by_path = {e['filepath']: e for entries in results.values() for e in entries}
+            self.state['plan'] = [by_path[f.get('filepath')] for f in self.files]
+            self.state['status'] = 'completed'
+        except Exception as e:
+            self.state['status'] = 'failed'
+            self.state['error'] = str(e)
+
+        self.state['updated'] = time.time()
+        self.store.save(self.state)
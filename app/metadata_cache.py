@@ -0,0 +1,200 @@
+"""
+Media Renamer - Metadata Response Cache
+Disk-backed cache of TMDB/MusicBrainz responses shared by all worker processes
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    negative INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+# Returned by get() when there is no usable entry
+MISSING = object()
+
+COUNTER_NAMES = ('hits', 'negative_hits', 'misses', 'stores', 'evictions')
+
+
+class MetadataCache:
+    """
+    SQLite-backed response cache with TTL, LRU eviction and negative caching.
+
+    Keys are built with make_key() from an endpoint and its normalized
+    params. Empty results and 404s are stored as negative entries with a
+    shorter TTL. Because the store is a file in DATA_DIR, every gunicorn
+    worker shares it and it survives restarts.
+
+    Safe to share between threads: each thread gets its own connection.
+    """
+
+    # Flush in-process counters to the database every this many operations
+    COUNTER_FLUSH_EVERY = 50
+    # Only rewrite an entry's access time when it is older than this (seconds)
+    TOUCH_INTERVAL = 60
+    # Check the size bound every this many stores
+    EVICT_CHECK_EVERY = 100
+
+    def __init__(self, db_path, ttl=86400, negative_ttl=3600, max_entries=50000):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = dict.fromkeys(COUNTER_NAMES, 0)
+        self._operations = 0
+        self._stores = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """
+        Build a cache key from an endpoint and its query params.
+        Credentials are dropped and text values are case- and
+        whitespace-normalized so equivalent queries share an entry.
+        """
+        normalized = {}
+        for name, value in params.items():
+            if name == 'api_key' or value is None:
+                continue
+            if isinstance(value, str):
+                value = ' '.join(value.split()).casefold()
+            normalized[name] = value
+        return f'{endpoint}?{json.dumps(normalized, sort_keys=True, default=str)}'
+
+    def _connect(self):
+        """Return this thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self._pending[name] += 1
+            self._operations += 1
+            flush = self._operations >= self.COUNTER_FLUSH_EVERY
+        if flush:
+            self.flush_counters()
+
+    def flush_counters(self):
+        """Write this process's counter increments to the shared database."""
+        with self._lock:
+            pending = {name: value for name, value in self._pending.items() if value}
+            self._pending = dict.fromkeys(COUNTER_NAMES, 0)
+            self._operations = 0
+        if not pending:
+            return
+
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO counters (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                pending.items()
+            )
+
+    def get(self, key, count=True):
+        """
+        Return the cached value for key, or MISSING. Pass count=False for
+        repeat lookups that should not skew the hit/miss counters.
+        """
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value, negative, expires, accessed FROM entries WHERE key = ?',
+            (key,)
+        ).fetchone()
+
+        if row is None or row[2] < now:
+            if count:
+                self._count('misses')
+            return MISSING
+
+        value, negative, _, accessed = row
+        if now - accessed > self.TOUCH_INTERVAL:
+            with conn:
+                conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+
+        if count:
+            self._count('negative_hits' if negative else 'hits')
+        return json.loads(value)
+
+    def set(self, key, value, negative=False):
+        """Store a JSON-serializable value. Negative entries use the shorter TTL."""
+        now = time.time()
+        ttl = self.negative_ttl if negative else self.ttl
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, negative, expires, accessed) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, json.dumps(value), int(negative), now + ttl, now)
+            )
+        self._count('stores')
+
+        with self._lock:
+            self._stores += 1
+            check = self._stores % self.EVICT_CHECK_EVERY == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones over the size bound."""
+        conn = self._connect()
+        with conn:
+            expired = conn.execute('DELETE FROM entries WHERE expires < ?', (time.time(),)).rowcount
+            (count,) = conn.execute('SELECT COUNT(*) FROM entries').fetchone()
+            excess = max(0, count - self.max_entries)
+            if excess:
+                conn.execute(
+                    'DELETE FROM entries WHERE key IN '
+                    '(SELECT key FROM entries ORDER BY accessed LIMIT ?)',
+                    (excess,)
+                )
+        with self._lock:
+            self._pending['evictions'] += expired + excess
+
+    def clear(self):
+        """Remove all entries. Counters are kept."""
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM entries')
+
+    def stats(self):
+        """Return hit/miss counters aggregated across all processes."""
+        self.flush_counters()
+        conn = self._connect()
+        stats = dict.fromkeys(COUNTER_NAMES, 0)
+        stats.update(conn.execute('SELECT name, value FROM counters'))
+        (stats['entries'],) = conn.execute('SELECT COUNT(*) FROM entries').fetchone()
+
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['negative_hits']) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,440 @@
+"""
+Media Renamer - Metrics
+Prometheus counters and histograms that add up across gunicorn workers
+"""
+
+import bisect
+import fcntl
+import glob
+import json
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class ValueFile:
+    """
+    Float values by key in a memory-mapped file.
+
+    Each process writes only its own file, so updates are plain memory
+    writes with no locking between processes; readers parse the files of
+    every process. The file starts with the number of bytes in use, which
+    is only advanced once an entry is fully written. Entries are a 4-byte
+    key length, the key padded to 8 bytes and an 8-byte double, so values
+    are aligned and read whole. Without a path the values live in
+    anonymous memory and are only seen by this process.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path=None):
+        self.path = path
+        self._offsets = {}
+
+        if path is None:
+            self._fd = None
+            self._size = self.INITIAL_SIZE
+            self._map = mmap.mmap(-1, self._size)
+            self._used = 8
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._size = max(os.fstat(self._fd).st_size, self.INITIAL_SIZE)
+            os.ftruncate(self._fd, self._size)
+            self._map = mmap.mmap(self._fd, self._size)
+            # A file left by an earlier process with the same pid: carry on from its values
+            self._used = struct.unpack_from('Q', self._map, 0)[0] or 8
+            for key, _, offset in _entries(self._map, self._used):
+                self._offsets[key] = offset
+        struct.pack_into('Q', self._map, 0, self._used)
+
+    def _grow(self, needed):
+        size = self._size
+        while size < needed:
+            size *= 2
+        if self._fd is None:
+            grown = mmap.mmap(-1, size)
+            grown[:self._size] = self._map[:self._size]
+        else:
+            os.ftruncate(self._fd, size)
+            grown = mmap.mmap(self._fd, size)
+        self._map.close()
+        self._map, self._size = grown, size
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (-(4 + len(encoded)) % 8)
+        entry = struct.pack(f'=i{padded}sd', len(encoded), encoded, 0.0)
+        if self._used + len(entry) > self._size:
+            self._grow(self._used + len(entry))
+
+        self._map[self._used:self._used + len(entry)] = entry
+        offset = self._used + len(entry) - 8
+        self._used += len(entry)
+        struct.pack_into('Q', self._map, 0, self._used)
+        self._offsets[key] = offset
+        return offset
+
+    def add(self, key, amount):
+        offset = self._offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        value = struct.unpack_from('d', self._map, offset)[0]
+        struct.pack_into('d', self._map, offset, value + amount)
+
+    def items(self):
+        return [(key, value) for key, value, _ in _entries(self._map, self._used)]
+
+    def close(self):
+        self._map.close()
+        if self._fd is not None:
+            os.close(self._fd)
+
+
+def _entries(data, used):
+    """Yield (key, value, value offset) for the entries of a value file's contents."""
+    pos = 8
+    while pos + 4 <= used:
+        length = struct.unpack_from('i', data, pos)[0]
+        key_end = pos + 4 + length
+        value_offset = key_end + (-(4 + length) % 8)
+        if value_offset + 8 > used:
+            return
+        yield bytes(data[pos + 4:key_end]).decode(), struct.unpack_from('d', data, value_offset)[0], value_offset
+        pos = value_offset + 8
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # EPERM: alive, but someone else's
+        return True
+    return True
+
+
+def read_values(path):
+    """Return the (key, value) pairs in a value file written by any process."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    used = min(struct.unpack_from('Q', data, 0)[0], len(data))
+    return [(key, value) for key, value, _ in _entries(data, used)]
+
+
+class Registry:
+    """
+    The metrics of this app and where their values are kept.
+
+    Values go to DIRECTORY/<host>-<pid>.db, one file per worker process,
+    opened on first use after a fork. A scrape reads and sums every file
+    in the directory. The files of this host's workers that have since
+    exited are first added into DIRECTORY/<host>-archive.db and deleted,
+    so they do not pile up as gunicorn replaces workers while counters
+    still never go backwards. Scrapes hold a lock on the directory, so
+    none of them sees a file both folded into the archive and on its own.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.directory = None
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def configure(self, directory=None, enabled=True):
+        """Keep values in directory (None for this process only), or turn metrics off."""
+        with self._lock:
+            self.directory = directory
+            self.enabled = enabled
+            self._file = None
+            self._pid = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, key, amount):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._file = self._open()
+                self._pid = os.getpid()
+            self._file.add(key, amount)
+
+    def _open(self):
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                return ValueFile(os.path.join(self.directory, f'{socket.gethostname()}-{os.getpid()}.db'))
+            except OSError:
+                # Metrics are best effort; keep counting in this process
+                self.directory = None
+        return ValueFile()
+
+    def collect(self):
+        """Return {key: value} summed over every process's values."""
+        if self.directory:
+            try:
+                with self._directory_lock():
+                    self._fold_exited()
+                    sources = self._read_files()
+            except OSError:
+                sources = self._read_files()
+        else:
+            with self._lock:
+                sources = [self._file.items()] if self._file is not None else []
+
+        totals = {}
+        for values in sources:
+            for key, value in values:
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    @contextmanager
+    def _directory_lock(self):
+        fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read_files(self):
+        sources = []
+        for path in glob.glob(os.path.join(self.directory, '*.db')):
+            try:
+                sources.append(read_values(path))
+            except OSError:
+                continue
+        return sources
+
+    def _fold_exited(self):
+        """Add the values of this host's exited workers to the archive file and delete their files."""
+        host = socket.gethostname()
+        exited = []
+        for path in glob.glob(os.path.join(self.directory, f'{glob.escape(host)}-*.db')):
+            pid = os.path.basename(path)[len(host) + 1:-len('.db')]
+            if pid.isdigit() and int(pid) != os.getpid() and not _process_exists(int(pid)):
+                exited.append(path)
+        if not exited:
+            return
+
+        archive = os.path.join(self.directory, f'{host}-archive.db')
+        totals = {}
+        for path in ([archive] if os.path.exists(archive) else []) + exited:
+            for key, value in read_values(path):
+                totals[key] = totals.get(key, 0.0) + value
+
+        # Written beside the archive and renamed over it, so a scrape never reads half of it
+        temporary = archive + '.tmp'
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        values = ValueFile(temporary)
+        try:
+            for key, value in totals.items():
+                values.add(key, value)
+        finally:
+            values.close()
+        os.replace(temporary, archive)
+
+        for path in exited:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def exposition(self):
+        """Render every metric in the Prometheus text format."""
+        samples = {}
+        for key, value in self.collect().items():
+            name, sample, labels = json.loads(key)
+            samples.setdefault(name, []).append((sample, tuple(map(tuple, labels)), value))
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.render(samples.get(name, [])))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._keys = {}
+        registry.register(self)
+
+    def _key(self, sample, labels, extra=()):
+        """The value file key of one sample of a series, memoized per label values."""
+        values = tuple(labels.get(name) for name in self.labelnames)
+        memo_key = (sample, values, extra)
+        key = self._keys.get(memo_key)
+        if key is None:
+            if len(labels) != len(self.labelnames) or None in values:
+                raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+            pairs = [[name, str(value)] for name, value in zip(self.labelnames, values)]
+            key = self._keys[memo_key] = json.dumps([self.name, sample, pairs + [list(extra)] * bool(extra)])
+        return key
+
+
+class Counter(Metric):
+    """A total that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self._key('_total', labels), amount)
+
+    def render(self, samples):
+        return [
+            f'{self.name}_total{_format_labels(labels)} {_format_value(value)}'
+            for _, labels, value in sorted(samples)
+        ]
+
+
+class Histogram(Metric):
+    """
+    Counts of observations in buckets, plus their sum. Each bucket holds
+    only its own observations; they are made cumulative when rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self._bounds = [repr(float(b)) for b in self.buckets] + ['+Inf']
+
+    def observe(self, value, **labels):
+        bound = self._bounds[bisect.bisect_left(self.buckets, value)]
+        self.registry.add(self._key('_bucket', labels, ('le', bound)), 1)
+        self.registry.add(self._key('_sum', labels), value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, samples):
+        series = {}
+        for sample, labels, value in samples:
+            if sample == '_bucket':
+                base = tuple(label for label in labels if label[0] != 'le')
+                le = dict(labels)['le']
+                series.setdefault(base, {'buckets': {}, 'sum': 0.0})['buckets'][le] = value
+            else:
+                series.setdefault(labels, {'buckets': {}, 'sum': 0.0})['sum'] = value
+
+        lines = []
+        for labels, data in sorted(series.items()):
+            cumulative = 0.0
+            for bound in self._bounds:
+                cumulative += data['buckets'].get(bound, 0.0)
+                lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", bound),))} '
+                             f'{_format_value(cumulative)}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(data["sum"])}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {_format_value(cumulative)}')
+        return lines
+
+
+# The app's metrics
+
+REQUEST_DURATION = Histogram(
+    'media_renamer_http_request_duration_seconds',
+    'Time to handle a request, up to the first byte for streamed responses.',
+    ('route', 'method', 'status')
+)
+UPSTREAM_DURATION = Histogram(
+    'media_renamer_upstream_request_duration_seconds',
+    'Time for a metadata API request, excluding rate limit waits.',
+    ('service',)
+)
+UPSTREAM_REQUESTS = Counter(
+    'media_renamer_upstream_requests',
+    'Metadata API requests by HTTP status, or "error" if no response arrived.',
+    ('service', 'status')
+)
+RATELIMIT_WAIT = Histogram(
+    'media_renamer_ratelimit_wait_seconds',
+    'Time spent waiting for a rate limiter slot.',
+    ('limiter',),
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+)
+RATELIMIT_TIMEOUTS = Counter(
+    'media_renamer_ratelimit_timeouts',
+    'Callers turned away because the next slot was past their deadline.',
+    ('limiter',)
+)
+SCANNED_FILES = Counter(
+    'media_renamer_scanned_files',
+    'Media files found by directory scans.',
+    ('indexed',)
+)
+SCAN_DURATION = Histogram(
+    'media_renamer_scan_duration_seconds',
+    'Time to scan a directory tree.',
+    ('indexed',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+RENAMES = Counter(
+    'media_renamer_renames',
+    'Files renamed, by single rename, batch rename or organize move and outcome.',
+    ('kind', 'result')
+)
+RENAME_DURATION = Histogram(
+    'media_renamer_rename_duration_seconds',
+    'Time for one rename system call.',
+    ('kind',),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+)
+ORGANIZE_DURATION = Histogram(
+    'media_renamer_organize_move_duration_seconds',
+    'Time to move one file into the library, by rename or cross-device copy.',
+    ('method',),
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+)
+ORGANIZE_COPIED_BYTES = Counter(
+    'media_renamer_organize_copied_bytes',
+    'Bytes copied across filesystems by organize moves, by copy method.',
+    ('method',)
+)
@@ -0,0 +1,389 @@
+"""
+Media Renamer - Offline Metadata Index
+Local fuzzy title search built from TMDB's daily ID export files
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+
+SCHEMA = '''
+CREATE TABLE titles (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    tmdb_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    popularity REAL NOT NULL,
+    date TEXT NOT NULL
+);
+
+CREATE TABLE grams (
+    kind TEXT NOT NULL,
+    gram TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    ids BLOB NOT NULL,
+    PRIMARY KEY (kind, gram)
+) WITHOUT ROWID;
+
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+# Export kind -> (title field, date field, result title key, result date key)
+KINDS = {
+    'movie': ('original_title', 'release_date', 'title', 'release_date'),
+    'tv': ('original_name', 'first_air_date', 'name', 'first_air_date')
+}
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+# Minimum match score for a title to count as a hit
+MIN_SCORE = 0.3
+# Score from which a hit with the right year answers a search without the API
+CONFIDENT_SCORE = 0.8
+
+
+def normalize(title):
+    """Lowercase, strip accents and reduce punctuation to single spaces."""
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(c for c in title if not unicodedata.combining(c))
+    return ' '.join(NON_WORD_RE.sub(' ', title.lower()).split())
+
+
+def trigrams(norm):
+    """Trigrams of each word of a normalized title, padded like pg_trgm."""
+    grams = set()
+    for word in norm.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def match_score(query_grams, title_grams):
+    """
+    Average of the Jaccard similarity of the two trigram sets and the share
+    of the query's trigrams found in the title. The second part keeps a
+    short query from missing a long title that contains it ("amelie" in
+    "Le Fabuleux Destin d'Amélie Poulain"); the first ranks closer
+    lengths higher ("The Matrix" over "The Matrix Reloaded").
+    """
+    if not query_grams or not title_grams:
+        return 0.0
+    shared = len(query_grams & title_grams)
+    jaccard = shared / (len(query_grams) + len(title_grams) - shared)
+    return (jaccard + shared / len(query_grams)) / 2
+
+
+def is_confident(kind, results, query, year=None):
+    """
+    Whether the best of a search's results is certain enough to stand in
+    for the API's answer: its title equals the query once both are
+    normalized and no other result has that title, or a year was given
+    (so the result has it) and it scores CONFIDENT_SCORE or more. Titles
+    shared by several entries (remakes, reboots) are only told apart by a
+    date, which the exports rarely carry, so they need a dated result
+    from the requested year. Looser hits are only similar titles.
+    """
+    if not results:
+        return False
+    best = results[0]
+    _, _, title_key, date_key = KINDS[kind]
+    norm = normalize(query)
+
+    same_title = [result for result in results if normalize(result[title_key]) == norm]
+    if len(same_title) > 1:
+        dated = [result for result in same_title
+                 if year and (result.get(date_key) or '').startswith(str(year))]
+        return len(dated) == 1 and dated[0] is best
+    if same_title and same_title[0] is best:
+        return True
+    return bool(year) and best['match_score'] >= CONFIDENT_SCORE
+
+
+def kind_of(path):
+    """Guess the kind of an export file from TMDB's file naming."""
+    name = os.path.basename(path)
+    if name.startswith('movie_ids'):
+        return 'movie'
+    if name.startswith('tv_series_ids'):
+        return 'tv'
+    raise ValueError(f'Cannot tell the kind of export from its name: {name}')
+
+
+def read_export(path):
+    """Yield the JSON objects of an export file, gzipped or not. Bad lines are skipped."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def build_index(db_path, exports, logger=None):
+    """
+    Build an index from (kind, path) export files.
+
+    The index is written next to db_path and moved into place when
+    complete, so running searches keep using the old one until then.
+    Adult titles are left out, as they are from API searches.
+    Returns {kind: titles imported}.
+    """
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    tmp_path = f'{db_path}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.executescript(SCHEMA)
+
+    counts = {}
+    row_id = 0
+    try:
+        for kind, path in exports:
+            title_field, date_field = KINDS[kind][:2]
+            postings = {}
+            rows = []
+            started = time.time()
+
+            for entry in read_export(path):
+                title = entry.get(title_field)
+                if not title or entry.get('adult') or 'id' not in entry:
+                    continue
+                norm = normalize(title)
+                if not norm:
+                    continue
+
+                row_id += 1
+                rows.append((row_id, kind, entry['id'], title, norm,
+                             float(entry.get('popularity') or 0), entry.get(date_field) or ''))
+                for gram in trigrams(norm):
+                    ids = postings.get(gram)
+                    if ids is None:
+                        ids = postings[gram] = array('I')
+                    ids.append(row_id)
+
+                if len(rows) >= 10000:
+                    conn.executemany('INSERT INTO titles VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                    rows.clear()
+
+            conn.executemany('INSERT INTO titles VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.executemany(
+                'INSERT INTO grams (kind, gram, size, ids) VALUES (?, ?, ?, ?)',
+                ((kind, gram, len(ids), ids.tobytes()) for gram, ids in postings.items())
+            )
+            counts[kind] = conn.execute('SELECT COUNT(*) FROM titles WHERE kind = ?', (kind,)).fetchone()[0]
+            if logger:
+                logger(f'{kind}: {counts[kind]} titles from {path} in {time.time() - started:.1f}s')
+
+        conn.execute('CREATE INDEX titles_tmdb ON titles (kind, tmdb_id)')
+        conn.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+            ('imported', str(time.time())),
+            ('counts', json.dumps(counts))
+        ])
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+
+    conn.close()
+    os.replace(tmp_path, db_path)
+    return counts
+
+
+class OfflineIndex:
+    """
+    Read side of an index built by build_index.
+
+    Titles are found by trigram similarity: the postings of the query's
+    rarest trigrams give the candidates, which are then scored with
+    match_score and ordered by score and popularity. Results have the shape of the
+    TMDB search API so callers need not care where they came from, except
+    that the exports carry each title only in its original language and
+    usually without a date.
+
+    Safe to share between threads: each thread gets its own read-only
+    connection. A rebuilt index file is picked up within CHECK_INTERVAL.
+    """
+
+    # Title ids counted per search to find candidates. The rarest trigrams
+    # are counted first; common ones ("the") only if the budget allows.
+    POSTINGS_BUDGET = 5000
+    # Candidates scored exactly per search
+    MAX_CANDIDATES = 50
+    # In-process memo of recent searches
+    MEMO_SIZE = 4096
+    # Seconds between checks for a rebuilt index file
+    CHECK_INTERVAL = 30
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+        self._inode = os.stat(db_path).st_ino
+        self._checked = time.monotonic()
+        self._sizes = self._load_sizes()
+
+    def _check_replaced(self):
+        """Switch to a rebuilt index file, at most once per CHECK_INTERVAL."""
+        now = time.monotonic()
+        if now - self._checked < self.CHECK_INTERVAL:
+            return
+        self._checked = now
+        try:
+            inode = os.stat(self.db_path).st_ino
+        except OSError:
+            return
+        if inode != self._inode:
+            self._inode = inode
+            self._sizes = self._load_sizes()
+            with self._memo_lock:
+                self._memo.clear()
+
+    def _connect(self):
+        """Return this thread's connection, reopening it if the file was replaced."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid() or self._local.inode != self._inode:
+            conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.inode = self._inode
+        return conn
+
+    def _load_sizes(self):
+        """Postings sizes by (kind, trigram), kept in memory to pick the rarest trigrams."""
+        return {(kind, gram): size for kind, gram, size in
+                self._connect().execute('SELECT kind, gram, size FROM grams')}
+
+    def _candidates(self, conn, kind, grams):
+        sizes = sorted(
+            (self._sizes[kind, gram], gram) for gram in grams if (kind, gram) in self._sizes
+        )
+
+        chosen, total = [], 0
+        for size, gram in sizes:
+            if chosen and total + size > self.POSTINGS_BUDGET:
+                break
+            chosen.append(gram)
+            total += size
+        if not chosen:
+            return []
+
+        counts = Counter()
+        for (ids,) in conn.execute(
+            f"SELECT ids FROM grams WHERE kind = ? AND gram IN ({', '.join('?' * len(chosen))})",
+            [kind, *chosen]
+        ):
+            counts.update(array('I', ids))
+        return [row_id for row_id, _ in counts.most_common(self.MAX_CANDIDATES)]
+
+    def search(self, kind, query, year=None, limit=20):
+        """
+        Return TMDB-style result dicts for titles similar to query, best
+        first. With a year, titles dated in another year are left out.
+        """
+        self._check_replaced()
+        norm = normalize(query)
+        memo_key = (kind, norm, str(year or ''), limit)
+        with self._memo_lock:
+            found = self._memo.get(memo_key)
+        if found is not None:
+            return found
+
+        grams = trigrams(norm)
+        if not grams:
+            return []
+
+        conn = self._connect()
+        row_ids = self._candidates(conn, kind, grams)
+        if not row_ids:
+            return []
+
+        placeholders = ', '.join('?' * len(row_ids))
+        scored = []
+        for tmdb_id, title, title_norm, popularity, date in conn.execute(
+            f'SELECT tmdb_id, title, norm, popularity, date FROM titles WHERE id IN ({placeholders})',
+            row_ids
+        ):
+            if year and date and not date.startswith(str(year)):
+                continue
+            score = match_score(grams, trigrams(title_norm))
+            if score >= MIN_SCORE:
+                scored.append((score, popularity, tmdb_id, title, date))
+
+        scored.sort(key=lambda s: (s[0], s[1]), reverse=True)
+        _, _, title_key, date_key = KINDS[kind]
+        results = [
+            {'id': tmdb_id, title_key: title, f'original_{title_key}': title, date_key: date,
+             'popularity': popularity, 'overview': '', 'match_score': round(score, 3)}
+            for score, popularity, tmdb_id, title, date in scored[:limit]
+        ]
+
+        with self._memo_lock:
+            if len(self._memo) >= self.MEMO_SIZE:
+                self._memo.pop(next(iter(self._memo)))
+            self._memo[memo_key] = results
+        return results
+
+    def stats(self):
+        """Return when the index was imported and how many titles of each kind it has."""
+        self._check_replaced()
+        meta = dict(self._connect().execute('SELECT key, value FROM meta'))
+        return {'imported': float(meta.get('imported', 0)), 'counts': json.loads(meta.get('counts', '{}'))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m app.offline_index',
+        description='Build or query the offline TMDB title index.'
+    )
+    parser.add_argument('--db', default=os.path.join(os.environ.get('DATA_DIR', '/data'), 'tmdb_index.db'),
+                        help='index file (default: $DATA_DIR/tmdb_index.db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('import', help='build the index from export files, replacing it')
+    build.add_argument('exports', nargs='+', metavar='FILE',
+                       help='movie_ids_*.json.gz and tv_series_ids_*.json.gz export files')
+
+    search = commands.add_parser('search', help='search the index')
+    search.add_argument('kind', choices=sorted(KINDS))
+    search.add_argument('query')
+    search.add_argument('--year')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        try:
+            exports = [(kind_of(path), path) for path in args.exports]
+        except ValueError as e:
+            parser.error(str(e))
+        counts = build_index(args.db, exports, logger=print)
+        print(f'Wrote {args.db}: {json.dumps(counts)}')
+    else:
+        index = OfflineIndex(args.db)
+        started = time.perf_counter()
+        results = index.search(args.kind, args.query, args.year)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False))
+        print(f'{len(results)} results in {elapsed * 1e6:.0f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""
+Media Renamer - Library Organizer
+Moves renamed media into a Movies/TV/Music library tree, across filesystems if need be
+"""
+
+import errno
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import blocking, metrics, renamer
+
+# Bytes handed to one copy_file_range/sendfile call
+COPY_CHUNK = 64 * 1024 * 1024
+# Bytes read at a time when verifying or falling back to read/write
+READ_CHUNK = 1024 * 1024
+
+# Errors meaning "this copy method does not work for these files", not a failed copy
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def _result(success, message, new_path):
+    return {'success': success, 'message': message, 'new_path': new_path}
+
+
+def library_directory(file_data):
+    """
+    Return the directory, relative to the library root, a matched file
+    belongs in: Movies/Title (Year), TV/Show/Season NN or Music/Artist.
+    Returns None for an unknown type.
+    """
+    file_type = file_data.get('type')
+
+    if file_type == 'movie':
+        title = renamer.sanitize_filename(file_data.get('title'))
+        return os.path.join('Movies', f"{title} ({file_data.get('year')})")
+    elif file_type == 'tv':
+        show = renamer.sanitize_filename(file_data.get('show_name'))
+        return os.path.join('TV', show, f"Season {str(int(file_data.get('season'))).zfill(2)}")
+    elif file_type == 'music':
+        return os.path.join('Music', renamer.sanitize_filename(file_data.get('artist')))
+    return None
+
+
+def partial_path(target):
+    """Where a cross-device copy to target is written until it is verified."""
+    return os.path.join(os.path.dirname(target), f'.{os.path.basename(target)}.partial')
+
+
+class OrganizePlan:
+    """
+    The checked source -> target map of an organize batch.
+
+    Like RenamePlan, `results` holds an early result for every move that
+    is already settled and None for the rest, and `steps` are the moves
+    to run. Library targets never overlap the sources being moved, so
+    there are no chains or cycles to order; a target that already exists
+    is simply refused. Steps are marked "move" so undo_batch knows to
+    move files back across filesystems rather than rename them.
+    """
+
+    def __init__(self, moves, batch_id=None):
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.renames = list(moves)
+        self.results = [None] * len(self.renames)
+        self.steps = []
+        self._build()
+
+    def _build(self):
+        claimed = set()
+
+        for i, (source, target) in enumerate(self.renames):
+            if not os.path.isfile(source):
+                self.results[i] = _result(False, 'File not found', target)
+            elif source == target:
+                self.results[i] = _result(True, 'File is already in the library', target)
+            elif target in claimed:
+                self.results[i] = _result(False, 'Another file in this batch has the same new name', target)
+            elif os.path.lexists(target):
+                self.results[i] = _result(False, 'Destination file already exists', target)
+            else:
+                claimed.add(target)
+                self.steps.append({'op': i, 'src': source, 'dst': target, 'move': True})
+
+        for n, step in enumerate(self.steps):
+            step['step'] = n
+
+
+def copy_range(src_fd, dst_fd, offset, end):
+    """
+    Copy bytes offset..end of src_fd to the same offsets of dst_fd. Uses
+    copy_file_range, which lets the kernel (or a server-side copy on NFS
+    4.2/SMB) move the data without it passing through this process, then
+    sendfile, then plain reads and writes, dropping to the next whenever
+    the kernel refuses one for these files. Returns the offset reached,
+    which is short of end only if the source shrank.
+    """
+    methods = ['copy_file_range', 'sendfile', 'read']
+    if not hasattr(os, 'copy_file_range'):
+        methods.remove('copy_file_range')
+    if not hasattr(os, 'sendfile'):
+        methods.remove('sendfile')
+
+    while offset < end:
+        method = methods[0]
+        count = min(COPY_CHUNK if method != 'read' else READ_CHUNK, end - offset)
+        try:
+            if method == 'copy_file_range':
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            elif method == 'sendfile':
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+            else:
+                copied = os.pwrite(dst_fd, os.pread(src_fd, count, offset), offset)
+        except OSError as e:
+            if method != 'read' and e.errno in UNSUPPORTED_ERRNOS:
+                methods.pop(0)
+                continue
+            raise
+
+        if copied == 0:
+            break
+        offset += copied
+        metrics.ORGANIZE_COPIED_BYTES.inc(copied, method=method)
+    return offset
+
+
+def _same_content(path_a, path_b):
+    """Compare two files byte for byte; cheaper than hashing both."""
+    with open(path_a, 'rb') as a, open(path_b, 'rb') as b:
+        while True:
+            chunk = a.read(READ_CHUNK)
+            if chunk != b.read(READ_CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _copy_to_partial(source, partial, resume):
+    """
+    Copy source into partial, continuing after what partial already holds
+    if resume is set. Returns the source's size. Raises OSError.
+    """
+    with open(source, 'rb') as src:
+        size = os.fstat(src.fileno()).st_size
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            offset = os.fstat(fd).st_size if resume else 0
+            if offset > size:
+                offset = 0
+            os.ftruncate(fd, offset)
+            if copy_range(src.fileno(), fd, offset, size) < size:
+                raise OSError(errno.EIO, 'Source file shrank during the copy', source)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return size
+
+
+def copy_across(source, target, verify=True):
+    """
+    Move source to target on another filesystem: copy it to a hidden
+    .partial file beside target, check the copy, give it source's
+    permissions and times, rename it into place and only then delete
+    source. A .partial file left by an interrupted copy is resumed where
+    it stopped; if the resumed copy then fails verification it is redone
+    once from the start. With verify, the copy is read back and compared
+    with source byte for byte; without, only their sizes are compared.
+    Raises OSError.
+    """
+    partial = partial_path(target)
+
+    for resume in (os.path.exists(partial), False):
+        size = _copy_to_partial(source, partial, resume)
+        if os.stat(partial).st_size == size and (not verify or _same_content(source, partial)):
+            break
+        if not resume:
+            os.remove(partial)
+            raise OSError(errno.EIO, 'Copy does not match the source', target)
+
+    try:
+        shutil.copystat(source, partial)
+    except OSError:
+        # Some network filesystems refuse chmod or utime; the data is what matters
+        pass
+    if os.path.lexists(target):
+        raise FileExistsError(errno.EEXIST, 'Destination file already exists', target)
+    os.rename(partial, target)
+    _fsync_directory(os.path.dirname(target))
+    os.remove(source)
+
+
+def move_file(source, target, verify=True):
+    """
+    Move a file to target, creating target's directory. A rename where
+    source and target share a filesystem, otherwise copy_across. Returns
+    "rename" or "copy". Raises OSError, FileExistsError if target exists.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.lexists(target):
+        raise FileExistsError(errno.EEXIST, 'Destination file already exists', target)
+
+    try:
+        os.rename(source, target)
+        return 'rename'
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    copy_across(source, target, verify)
+    return 'copy'
+
+
+def execute_moves(plan, journal=None, dry_run=False, cancelled=None, workers=4, verify=True):
+    """
+    Run an organize plan's moves on a pool of `workers` threads, yielding
+    (index, result) for each move as it finishes. Early results come
+    first. Renames finish at once; cross-device copies of different files
+    run side by side.
+
+    cancelled is an optional callable checked before each move starts;
+    once it returns True the moves not yet started are reported as
+    cancelled. The journal is only written from the calling thread.
+    """
+    for i, result in enumerate(plan.results):
+        if result is not None:
+            yield i, result
+
+    if dry_run:
+        for step in plan.steps:
+            metrics.RENAMES.inc(kind='organize', result='dry_run')
+            yield step['op'], _result(True, 'Dry run - file would be moved', step['dst'])
+        return
+
+    if journal is not None and plan.steps:
+        journal.write_plan(plan)
+
+    stopped = []
+
+    def run(step):
+        if stopped or (cancelled is not None and cancelled()):
+            stopped.append(True)
+            return None
+        start = time.perf_counter()
+        method = blocking.call(move_file, step['src'], step['dst'], verify)
+        metrics.ORGANIZE_DURATION.observe(time.perf_counter() - start, method=method)
+        return method
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='organize')
+    try:
+        futures = {pool.submit(run, step): step for step in plan.steps}
+        for future in as_completed(futures):
+            step = futures[future]
+            try:
+                method = future.result()
+            except FileExistsError:
+                error = 'Destination file already exists'
+            except OSError as e:
+                error = f'Failed to move file: {str(e)}'
+            else:
+                if method is None:
+                    metrics.RENAMES.inc(kind='organize', result='cancelled')
+                    yield step['op'], _result(False, 'Cancelled', step['dst'])
+                    continue
+                if journal is not None:
+                    journal.step_done(step)
+                metrics.RENAMES.inc(kind='organize', result='success')
+                message = 'File moved successfully' if method == 'rename' else 'File copied and verified'
+                yield step['op'], _result(True, message, step['dst'])
+                continue
+
+            if journal is not None:
+                journal.step_failed(step, error)
+            metrics.RENAMES.inc(kind='organize', result='failed')
+            yield step['op'], _result(False, error, step['dst'])
+    finally:
+        # Closed early: let running moves finish, skip the rest
+        stopped.append(True)
+        pool.shutdown(wait=True, cancel_futures=True)
+        if journal is not None and plan.steps:
+            journal.close()
@@ -0,0 +1,184 @@
+"""
+Media Renamer - Candidate Ranking
+Scores search results against what was parsed from filenames, many at a time
+"""
+
+import math
+import re
+
+from .offline_index import normalize, trigrams
+
+LEADING_ARTICLE_RE = re.compile(r'^(?:the|a|an) ')
+
+# Share of a score that depends on popularity among a query's candidates
+POPULARITY_WEIGHT = 0.1
+
+# Score factor by distance in years between the filename and a candidate
+YEAR_FACTORS = {0: 1.0, 1: 0.9}
+DISTANT_YEAR_FACTOR = 0.6
+
+
+def year_of(date):
+    """Extract the year from a YYYY-MM-DD date, or ''."""
+    return date.split('-')[0] if date else ''
+
+
+def year_factor(year, candidate_year):
+    """Penalty for a year mismatch. Nothing is known if either year is missing."""
+    if not year or not candidate_year:
+        return 1.0
+    try:
+        distance = abs(int(year) - int(candidate_year))
+    except (TypeError, ValueError):
+        return 1.0
+    return YEAR_FACTORS.get(distance, DISTANT_YEAR_FACTOR)
+
+
+def popularity_shares(results):
+    """Each result's popularity relative to the most popular, log-scaled to 0-1."""
+    popularities = [max(float(r.get('popularity') or 0), 0.0) for r in results]
+    top = math.log1p(max(popularities, default=0))
+    if top == 0:
+        return [1.0] * len(results)
+    return [math.log1p(p) / top for p in popularities]
+
+
+class Ranker:
+    """
+    Scores search results against parsed filenames in batches.
+
+    A score is the trigram (Dice) similarity of the normalized titles,
+    with leading articles ignored, scaled by how far apart the years are
+    and, as a tie-breaker, by popularity relative to the other candidates
+    for the same query. Normalized titles and their trigrams are memoized
+    per ranker, so a job scoring the same candidates for many files works
+    each title out once.
+
+    The best candidate is accepted automatically when it scores at least
+    `accept_score` and beats the runner-up by `accept_margin`.
+    """
+
+    # Titles memoized before the memo is reset
+    MEMO_SIZE = 65536
+
+    def __init__(self, accept_score=0.9, accept_margin=0.05):
+        self.accept_score = accept_score
+        self.accept_margin = accept_margin
+        self._memo = {}
+
+    def _prepare(self, title):
+        found = self._memo.get(title)
+        if found is None:
+            norm = LEADING_ARTICLE_RE.sub('', normalize(title or ''))
+            found = (norm, frozenset(trigrams(norm)))
+            if len(self._memo) >= self.MEMO_SIZE:
+                self._memo.clear()
+            self._memo[title] = found
+        return found
+
+    def similarity(self, a, b):
+        """Similarity of two titles, from 0 to 1."""
+        norm_a, grams_a = self._prepare(a)
+        norm_b, grams_b = self._prepare(b)
+        if norm_a == norm_b:
+            return 1.0 if norm_a else 0.0
+        if not grams_a or not grams_b:
+            return 0.0
+        return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+    def score_pairs(self, pairs):
+        """
+        Score (query, year, title, candidate_year, popularity_share) tuples.
+        Returns a list of scores between 0 and 1, in the same order.
+        """
+        similarities = self._similarity_matrix((query, title) for query, _, title, _, _ in pairs)
+        return [
+            round(similarities[query, title] * year_factor(year, candidate_year)
+                  * (1 - POPULARITY_WEIGHT + POPULARITY_WEIGHT * share), 3)
+            for query, year, title, candidate_year, share in pairs
+        ]
+
+    def _similarity_matrix(self, pairs):
+        """
+        Return {(query, title): similarity} for every distinct pair at once.
+
+        Each title becomes a trigram bit vector over the trigrams of the
+        batch's queries (a candidate's other trigrams cannot be shared, so
+        they only count towards its size), and a pair's shared trigrams are
+        the population count of the AND of their vectors. Queries and
+        titles repeated across the batch are vectorized and compared once.
+        """
+        pairs = set(pairs)
+        prepared = {}
+        for pair in pairs:
+            for title in pair:
+                if title not in prepared:
+                    prepared[title] = self._prepare(title)
+
+        bits = {}
+        for query in {query for query, _ in pairs}:
+            for gram in prepared[query][1]:
+                bits.setdefault(gram, len(bits))
+
+        vectors = {}
+        for title, (norm, grams) in prepared.items():
+            vector = 0
+            for gram in grams:
+                bit = bits.get(gram)
+                if bit is not None:
+                    vector |= 1 << bit
+            vectors[title] = vector
+
+        matrix = {}
+        for query, title in pairs:
+            norm_a, grams_a = prepared[query]
+            norm_b, grams_b = prepared[title]
+            if norm_a == norm_b:
+                matrix[query, title] = 1.0 if norm_a else 0.0
+            elif not grams_a or not grams_b:
+                matrix[query, title] = 0.0
+            else:
+                shared = (vectors[query] & vectors[title]).bit_count()
+                matrix[query, title] = 2 * shared / (len(grams_a) + len(grams_b))
+        return matrix
+
+    def rank_batch(self, searches):
+        """
+        Rank the results of many searches in one pass, such as every group
+        of a match job. Each search is (query, year, results, title_key,
+        date_key). All candidates of all searches are scored together by
+        score_pairs. Returns, for each search, a list of (score, result)
+        pairs, best first.
+        """
+        pairs = []
+        for query, year, results, title_key, date_key in searches:
+            for result, share in zip(results, popularity_shares(results)):
+                pairs.append((query, year, result.get(title_key), year_of(result.get(date_key)), share))
+
+        scores = iter(self.score_pairs(pairs))
+        ranked = []
+        for _, _, results, _, _ in searches:
+            scored = [(next(scores), result) for result in results]
+            # Stable sort keeps the API's order among equal scores
+            scored.sort(key=lambda s: s[0], reverse=True)
+            ranked.append(scored)
+        return ranked
+
+    def rank(self, query, year, results, title_key, date_key):
+        """Rank one search's results. Returns (score, result) pairs, best first."""
+        return self.rank_batch([(query, year, results, title_key, date_key)])[0]
+
+    def best(self, ranked):
+        """
+        Return (result, score, accepted) for the top of a ranking, or
+        (None, 0, False) if nothing scored above zero.
+        """
+        if not ranked or ranked[0][0] <= 0:
+            return None, 0.0, False
+        score, result = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        return result, score, self.accepts(score, runner_up)
+
+    def accepts(self, score, runner_up=0.0):
+        """Whether a best score is high and clear enough to accept without review."""
+        return score >= self.accept_score and score - runner_up >= self.accept_margin
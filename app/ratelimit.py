@@ -0,0 +1,167 @@
+"""
+Media Renamer - Rate Limiting
+Request pacing shared across threads and worker processes
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from . import metrics
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS limiters (
+    name TEXT PRIMARY KEY,
+    tat REAL NOT NULL,
+    acquired INTEGER NOT NULL,
+    total_wait REAL NOT NULL,
+    max_wait REAL NOT NULL,
+    timeouts INTEGER NOT NULL
+);
+'''
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller's turn would come after its deadline."""
+
+    def __init__(self, wait):
+        super().__init__(f'Rate limit queue is full, next slot in {wait:.1f}s')
+        self.wait = wait
+
+
+class RateLimiter:
+    """
+    FIFO token bucket (GCRA) allowing `rate` requests per second with
+    bursts of up to `burst`.
+
+    Each caller reserves the next free slot in a single short transaction,
+    so callers are served in the order they arrive and know their wait up
+    front. A caller whose slot is further away than its deadline is turned
+    away immediately with RateLimitTimeout instead of sleeping.
+
+    With a db_path, the bucket lives in SQLite and is shared by every
+    worker process using the same file; without one, it is shared by the
+    threads of this process only.
+    """
+
+    def __init__(self, name, rate=1.0, burst=1, db_path=None):
+        self.name = name
+        self.interval = 1.0 / rate
+        self.burst = burst
+        self.db_path = db_path
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._state = {'tat': 0.0, 'acquired': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'timeouts': 0}
+
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            conn = self._connect()
+            conn.executescript(SCHEMA)
+            conn.execute(
+                'INSERT OR IGNORE INTO limiters (name, tat, acquired, total_wait, max_wait, timeouts) '
+                'VALUES (?, 0, 0, 0, 0, 0)',
+                (name,)
+            )
+            conn.commit()
+
+    def _connect(self):
+        """Return this thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _take_slot(self, state, now, deadline):
+        """
+        Reserve the next slot in `state`, updating it in place.
+        Returns the wait in seconds, or raises RateLimitTimeout.
+        """
+        tat = max(state['tat'], now) + self.interval
+        wait = max(0.0, tat - now - self.burst * self.interval)
+
+        if deadline is not None and wait > deadline:
+            state['timeouts'] += 1
+            raise RateLimitTimeout(wait)
+
+        state['tat'] = tat
+        state['acquired'] += 1
+        state['total_wait'] += wait
+        state['max_wait'] = max(state['max_wait'], wait)
+        return wait
+
+    def reserve(self, deadline=None):
+        """
+        Join the queue and return how long to wait, in seconds, before
+        sending. Raises RateLimitTimeout if that is longer than deadline.
+        """
+        now = time.time()
+
+        if not self.db_path:
+            with self._lock:
+                return self._take_slot(self._state, now, deadline)
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tat, acquired, total_wait, max_wait, timeouts FROM limiters WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+            state = dict(zip(('tat', 'acquired', 'total_wait', 'max_wait', 'timeouts'), row))
+            try:
+                return self._take_slot(state, now, deadline)
+            finally:
+                conn.execute(
+                    'UPDATE limiters SET tat = ?, acquired = ?, total_wait = ?, max_wait = ?, '
+                    'timeouts = ? WHERE name = ?',
+                    (state['tat'], state['acquired'], state['total_wait'],
+                     state['max_wait'], state['timeouts'], self.name)
+                )
+        finally:
+            conn.execute('COMMIT')
+
+    def acquire(self, deadline=None):
+        """Wait for a slot. Returns the time waited."""
+        try:
+            wait = self.reserve(deadline)
+        except RateLimitTimeout:
+            metrics.RATELIMIT_TIMEOUTS.inc(limiter=self.name)
+            raise
+        metrics.RATELIMIT_WAIT.observe(wait, limiter=self.name)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def stats(self):
+        """Return queue depth and wait time counters."""
+        if self.db_path:
+            row = self._connect().execute(
+                'SELECT tat, acquired, total_wait, max_wait, timeouts FROM limiters WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+            state = dict(zip(('tat', 'acquired', 'total_wait', 'max_wait', 'timeouts'), row))
+        else:
+            with self._lock:
+                state = dict(self._state)
+
+        # Reserved time beyond the burst allowance is callers still waiting
+        queue_wait = max(0.0, state['tat'] - time.time() - self.burst * self.interval)
+        return {
+            'name': self.name,
+            'rate': round(1.0 / self.interval, 3),
+            'burst': self.burst,
+            'shared': bool(self.db_path),
+            'queue_depth': math.ceil(queue_wait / self.interval - 1e-9),
+            'queue_wait': round(queue_wait, 3),
+            'acquired': state['acquired'],
+            'timeouts': state['timeouts'],
+            'total_wait': round(state['total_wait'], 3),
+            'avg_wait': round(state['total_wait'] / state['acquired'], 3) if state['acquired'] else 0.0,
+            'max_wait': round(state['max_wait'], 3)
+        }
@@ -0,0 +1,368 @@
+"""
+Media Renamer - Batch Rename Engine
+Plans a whole batch of renames up front, journals it, and can undo it
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+
+from . import metrics, organize
+
+BATCH_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _result(success, message, new_path):
+    return {'success': success, 'message': message, 'new_path': new_path}
+
+
+class RenamePlan:
+    """
+    The full source -> target map of a batch, checked and ordered.
+
+    `results` holds an early result for every rename that is already
+    settled (invalid, conflicting, or nothing to do) and None for the
+    rest. `steps` is the order to run the remaining renames in: chains
+    (A -> B while B -> C) are ordered so each target is vacated first,
+    and cycles (A -> B while B -> A) go through a temporary name.
+    Steps are grouped by directory.
+    """
+
+    def __init__(self, renames, batch_id=None):
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.renames = list(renames)
+        self.results = [None] * len(self.renames)
+        self.steps = []
+        self._listings = {}
+        self._build()
+
+    def _names_in(self, directory):
+        """Names in a directory, listed once per plan."""
+        names = self._listings.get(directory)
+        if names is None:
+            try:
+                names = set(os.listdir(directory))
+            except OSError:
+                names = set()
+            self._listings[directory] = names
+        return names
+
+    def _exists(self, path):
+        return os.path.basename(path) in self._names_in(os.path.dirname(path))
+
+    def _build(self):
+        pending = {}
+        claimed = {}
+
+        for i, (source, target) in enumerate(self.renames):
+            if not self._exists(source):
+                self.results[i] = _result(False, 'File not found', target)
+            elif source == target:
+                self.results[i] = _result(True, 'File already has the correct name', target)
+            elif target in claimed:
+                self.results[i] = _result(False, 'Another file in this batch has the same new name', target)
+            else:
+                claimed[target] = i
+                pending[i] = (source, target)
+
+        # Each pending rename is blocked by at most one other: the one whose
+        # source is its target. Fail renames whose target is taken by a file
+        # that is not itself moving, repeating as failures free nothing up.
+        sources = {source: i for i, (source, _) in pending.items()}
+        changed = True
+        while changed:
+            changed = False
+            for i, (source, target) in list(pending.items()):
+                blocker = sources.get(target)
+                if blocker is None and self._exists(target) or blocker is not None and blocker not in pending:
+                    self.results[i] = _result(False, 'Destination file already exists', target)
+                    del pending[i]
+                    del sources[source]
+                    changed = True
+
+        blocked_by = {i: sources.get(target) for i, (_, target) in pending.items()}
+        blocking = {j: i for i, j in blocked_by.items() if j is not None}
+
+        chains = []
+        placed = set()
+
+        # Chains: start from renames whose target is free and walk back to
+        # the renames waiting on each source
+        for i in sorted(pending, key=lambda i: pending[i]):
+            if blocked_by[i] is not None:
+                continue
+            chain = []
+            while i is not None:
+                chain.append({'op': i, 'src': pending[i][0], 'dst': pending[i][1]})
+                placed.add(i)
+                i = blocking.get(i)
+            chains.append(chain)
+
+        # Whatever is left forms cycles: park one file on a temporary name,
+        # run the rest of the cycle, then move it into place
+        for i in sorted(pending, key=lambda i: pending[i]):
+            if i in placed:
+                continue
+            source, target = pending[i]
+            temp = os.path.join(
+                os.path.dirname(source),
+                f'.{os.path.basename(source)}.renaming-{self.batch_id[:8]}'
+            )
+            chain = [{'op': i, 'src': source, 'dst': temp, 'temp': True}]
+            placed.add(i)
+            j = blocking.get(i)
+            while j is not None and j not in placed:
+                chain.append({'op': j, 'src': pending[j][0], 'dst': pending[j][1]})
+                placed.add(j)
+                j = blocking.get(j)
+            chain.append({'op': i, 'src': temp, 'dst': target, 'restore': source})
+            chains.append(chain)
+
+        chains.sort(key=lambda chain: os.path.dirname(chain[0]['src']))
+        for chain in chains:
+            chain[0]['chain_start'] = True
+            self.steps.extend(chain)
+        for n, step in enumerate(self.steps):
+            step['step'] = n
+
+
+def cancel_path(directory, batch_id):
+    """The file whose existence asks a running batch to stop."""
+    return os.path.join(directory, f'{batch_id}.cancel')
+
+
+class RenameJournal:
+    """
+    Append-only JSON-lines record of a batch.
+
+    The full plan is written and fsync'd before anything is renamed;
+    completed steps are appended and fsync'd in batches. After a crash,
+    steps without a record are checked against the filesystem on undo.
+    A batch is running from its plan record until a closing record; a
+    <batch_id>.cancel file beside the journal asks it to stop, and is
+    removed when the journal is closed.
+    """
+
+    FSYNC_EVERY = 100
+    CLOSING_RECORDS = ('commit', 'undo')
+
+    def __init__(self, directory, batch_id):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{batch_id}.jsonl')
+        self.cancel_path = cancel_path(directory, batch_id)
+        self._file = None
+        self._unsynced = 0
+
+    def _append(self, record, sync=False):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record) + '\n')
+        self._unsynced += 1
+        if sync or self._unsynced >= self.FSYNC_EVERY:
+            self.sync()
+
+    def sync(self):
+        """Flush buffered records to disk."""
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def write_plan(self, plan):
+        self._append({'type': 'plan', 'batch_id': plan.batch_id, 'created': time.time(),
+                      'steps': plan.steps}, sync=True)
+
+    def step_done(self, step):
+        self._append({'type': 'done', 'step': step['step']})
+
+    def step_failed(self, step, message):
+        self._append({'type': 'failed', 'step': step['step'], 'message': message})
+
+    def step_undone(self, step):
+        self._append({'type': 'undone', 'step': step['step']})
+
+    def close(self, record_type='commit'):
+        """Write a closing record and close the journal."""
+        self._append({'type': record_type, 'time': time.time()}, sync=True)
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self.cancel_path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def running(directory, batch_id):
+        """Whether a batch has a journaled plan and has not ended."""
+        records = RenameJournal.read(directory, batch_id)
+        if not records or records[0].get('type') != 'plan':
+            return False
+        return not any(record.get('type') in RenameJournal.CLOSING_RECORDS for record in records)
+
+    @staticmethod
+    def read(directory, batch_id):
+        """Return a journal's records, or None if there is no such batch."""
+        if not BATCH_ID_RE.match(batch_id):
+            return None
+        path = os.path.join(directory, f'{batch_id}.jsonl')
+        records = []
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A torn final line from a crash
+                        break
+        except OSError:
+            return None
+        return records
+
+
+def execute_plan(plan, journal=None, dry_run=False, cancelled=None):
+    """
+    Run a plan's renames, yielding (index, result) for each rename as it
+    is settled, in no particular order. Early results come first.
+
+    A failed step leaves its source in place, so steps that needed that
+    path vacated fail too rather than overwrite it.
+
+    cancelled is an optional callable checked between chains of dependent
+    renames (never mid-swap); once it returns True the remaining renames
+    are reported as cancelled. Closing the generator early also stops the
+    batch and closes the journal.
+    """
+    for i, result in enumerate(plan.results):
+        if result is not None:
+            yield i, result
+
+    if dry_run:
+        for step in plan.steps:
+            if not step.get('temp'):
+                metrics.RENAMES.inc(kind='batch', result='dry_run')
+                yield step['op'], _result(True, 'Dry run - file would be renamed', step['dst'])
+        return
+
+    if journal is not None and plan.steps:
+        journal.write_plan(plan)
+
+    occupied = set()
+    missing = set()
+
+    try:
+        for n, step in enumerate(plan.steps):
+            if step.get('chain_start') and cancelled is not None and cancelled():
+                for rest in plan.steps[n:]:
+                    if not rest.get('temp'):
+                        metrics.RENAMES.inc(kind='batch', result='cancelled')
+                        yield rest['op'], _result(False, 'Cancelled', rest['dst'])
+                break
+
+            src, dst = step['src'], step['dst']
+
+            if src in missing or dst in occupied:
+                error = 'Blocked by another rename in this batch that failed'
+            else:
+                try:
+                    with metrics.RENAME_DURATION.time(kind='batch'):
+                        os.rename(src, dst)
+                    error = None
+                except OSError as e:
+                    error = f'Failed to rename file: {str(e)}'
+
+            if error is None:
+                if journal is not None:
+                    journal.step_done(step)
+                if not step.get('temp'):
+                    metrics.RENAMES.inc(kind='batch', result='success')
+                    yield step['op'], _result(True, 'File renamed successfully', dst)
+                continue
+
+            if journal is not None:
+                journal.step_failed(step, error)
+            occupied.add(src)
+
+            if step.get('temp'):
+                # The file never left its source, so the temporary name stays empty
+                missing.add(dst)
+                continue
+
+            # Put a parked file back where it came from
+            restore = step.get('restore')
+            if restore and src not in missing:
+                try:
+                    os.rename(src, restore)
+                except OSError:
+                    error += f' (file left at {src})'
+
+            metrics.RENAMES.inc(kind='batch', result='failed')
+            yield step['op'], _result(False, error, dst)
+    finally:
+        if journal is not None and plan.steps:
+            journal.close()
+
+
+def undo_batch(directory, batch_id):
+    """
+    Reverse a journaled batch or organize move, newest rename first.
+    Returns list of per-step results, or None if there is no such batch.
+    """
+    records = RenameJournal.read(directory, batch_id)
+    if not records or records[0].get('type') != 'plan':
+        return None
+
+    steps = records[0]['steps']
+    done = set()
+    failed = set()
+    undone = set()
+    for record in records[1:]:
+        kind = record.get('type')
+        if kind == 'done':
+            done.add(record['step'])
+        elif kind == 'failed':
+            failed.add(record['step'])
+        elif kind == 'undone':
+            undone.add(record['step'])
+
+    journal = RenameJournal(directory, batch_id)
+    results = []
+
+    try:
+        for step in reversed(steps):
+            n = step['step']
+            if n in undone or n in failed:
+                continue
+            if n not in done:
+                # Unrecorded steps from an interrupted batch: trust the filesystem
+                if not (os.path.lexists(step['dst']) and not os.path.lexists(step['src'])):
+                    continue
+
+            # Steps through a temporary name are reported once, as the whole rename
+            original = step.get('restore', step['src'])
+
+            if os.path.lexists(step['src']):
+                error = 'Original path is in use by another file'
+            else:
+                try:
+                    if step.get('move'):
+                        # Organize moves may have crossed filesystems
+                        organize.move_file(step['dst'], step['src'])
+                    else:
+                        os.rename(step['dst'], step['src'])
+                    error = None
+                except OSError as e:
+                    error = f'Failed to rename file: {str(e)}'
+
+            if error is None:
+                journal.step_undone(step)
+                if not step.get('temp'):
+                    results.append({'original_path': original, 'success': True,
+                                    'message': 'Rename undone', 'from_path': step['dst']})
+            elif not step.get('temp'):
+                results.append({'original_path': original, 'success': False, 'message': error})
+    finally:
+        journal.close('undo')
+
+    return results
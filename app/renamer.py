@@ -3,11 +3,21 @@ Media Renamer - Core Logic
 Adapted from file_renamer.sh for web interface
 """
 
+import contextlib
+import email.utils
+import functools
 import os
 import re
+import threading
 import time
 import urllib.parse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import blocking, metrics, offline_index, tags
+from .metadata_cache import MISSING, MetadataCache
+from .ratelimit import RateLimiter
 
 # File extensions
 VIDEO_EXTENSIONS = {'mkv', 'mp4', 'avi', 'mov', 'wmv', 'flv', 'webm', 'm4v',
@@ -31,6 +41,62 @@ def is_audio_file(filename):
     return get_extension(filename) in AUDIO_EXTENSIONS
 
 
+# Filename patterns, compiled once at import
+SEPARATORS_RE = re.compile(r'[._-]+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# TV patterns in priority order. Each includes the optional separator in
+# front of it so the show name is simply everything before the match.
+TV_PATTERNS = [
+    re.compile(r'[._-]?[Ss](\d{1,2})[Ee](\d{1,2})'),
+    re.compile(r'[._-]?(\d{1,2})x(\d{1,2})'),
+]
+TV_SEASON_EPISODE_RE = re.compile(r'[Ss]eason[._\s-]?(\d{1,2})[._\s-]?[Ee]pisode[._\s-]?(\d{1,2})')
+TV_SEASON_CUT_RE = re.compile(r'[._-]?season', re.IGNORECASE)
+
+QUALITY_TOKENS = [
+    r'720p|1080p|2160p|4k|uhd|hdr',
+    r'bluray|brrip|bdrip|dvdrip|webrip|web-dl|webdl|hdtv',
+    r'xvid|divx|x264|x265|h264|h265|hevc',
+    r'aac|ac3|dts|5\.1|7\.1',
+]
+MOVIE_TOKENS = QUALITY_TOKENS + [
+    r'proper|repack|extended|unrated|directors\s*cut|theatrical|remastered',
+    r'yify|yts|rarbg|eztv|ettv|sparks|axxo|fgt|ctrlhd|ntb|mtb|publichd',
+]
+SHOW_TOKENS = QUALITY_TOKENS + [r'proper|repack']
+SHOW_GROUPS = (r'yify|yts|rarbg|eztv|ettv|sparks|axxo|fgt|ctrlhd|ntb|mtb|publichd'
+               r'|lol|dimension|fleet|killers|fov|bamboozle')
+
+# All junk tokens folded into a single alternation so each name is
+# scanned once. The movie pattern also captures years in the same pass.
+MOVIE_TOKENS_RE = re.compile(
+    r'\b(?:(?P<year>(?:19|20)\d{2})|' + '|'.join(MOVIE_TOKENS) + r')\b',
+    re.IGNORECASE
+)
+SHOW_TOKENS_RE = re.compile(r'\b(?:' + '|'.join(SHOW_TOKENS) + r')\b', re.IGNORECASE)
+SHOW_YEAR_RE = re.compile(r'\([0-9]{4}\)|\[[0-9]{4}\]')
+SHOW_GROUP_RE = re.compile(r'\s+(?:' + SHOW_GROUPS + r').*$', re.IGNORECASE)
+
+MUSIC_TRACK_NUMBER_RE = re.compile(r'^[\d]{1,3}[\.\-\s]*')
+MUSIC_TOKENS_RE = re.compile(
+    r'\b(320kbps|256kbps|192kbps|128kbps|flac|mp3|wav|aac|ogg|lossless|cd|vinyl|remaster|remastered)\b',
+    re.IGNORECASE
+)
+MUSIC_SQUARE_BRACKETS_RE = re.compile(r'\[[^\]]*\]')
+MUSIC_PARENTHESES_RE = re.compile(r'\([^\)]*\)')
+
+# Memo sizes for repeated names (the same show across every episode,
+# the same files across re-scans)
+PARSE_CACHE_SIZE = 131072
+SHOW_NAME_CACHE_SIZE = 8192
+
+
+def _show_name_before(name, end):
+    """Turn the part of a name before a TV marker into a show name."""
+    return SEPARATORS_RE.sub(' ', name[:end]).strip()
+
+
 def detect_tv_show(filename):
     """
     Detect if a filename is a TV show and extract season/episode info.
@@ -39,31 +105,25 @@ def detect_tv_show(filename):
     name = os.path.splitext(filename)[0]
 
     # Pattern 1: S01E02 format (most common)
-    match = re.search(r'[Ss](\d{1,2})[Ee](\d{1,2})', name)
-    if match:
-        season = match.group(1)
-        episode = match.group(2)
-        show_name = re.sub(r'[._-]?[Ss]\d{1,2}[Ee]\d{1,2}.*', '', name)
-        show_name = re.sub(r'[._-]+', ' ', show_name).strip()
-        return {'show_name': show_name, 'season': season, 'episode': episode}
-
     # Pattern 2: 1x02 format
-    match = re.search(r'(\d{1,2})x(\d{1,2})', name)
-    if match:
-        season = match.group(1)
-        episode = match.group(2)
-        show_name = re.sub(r'[._-]?\d{1,2}x\d{1,2}.*', '', name)
-        show_name = re.sub(r'[._-]+', ' ', show_name).strip()
-        return {'show_name': show_name, 'season': season, 'episode': episode}
+    for pattern in TV_PATTERNS:
+        match = pattern.search(name)
+        if match:
+            return {
+                'show_name': _show_name_before(name, match.start()),
+                'season': match.group(1),
+                'episode': match.group(2)
+            }
 
     # Pattern 3: Season 1 Episode 2 format
-    match = re.search(r'[Ss]eason[._\s-]?(\d{1,2})[._\s-]?[Ee]pisode[._\s-]?(\d{1,2})', name)
+    match = TV_SEASON_EPISODE_RE.search(name)
     if match:
-        season = match.group(1)
-        episode = match.group(2)
-        show_name = re.sub(r'[._-]?[Ss]eason.*', '', name, flags=re.IGNORECASE)
-        show_name = re.sub(r'[._-]+', ' ', show_name).strip()
-        return {'show_name': show_name, 'season': season, 'episode': episode}
+        cut = TV_SEASON_CUT_RE.search(name)
+        return {
+            'show_name': _show_name_before(name, cut.start()),
+            'season': match.group(1),
+            'episode': match.group(2)
+        }
 
     return None
 
@@ -73,60 +133,46 @@ def clean_movie_name(filename):
     name = os.path.splitext(filename)[0]
 
     # Replace common separators with spaces
-    name = re.sub(r'[._-]+', ' ', name)
+    name = SEPARATORS_RE.sub(' ', name)
 
-    # Extract year if present
-    year_match = re.search(r'\b(19|20)\d{2}\b', name)
-    year = year_match.group(0) if year_match else None
+    # Remove quality indicators and the year (returned separately) in one
+    # pass. Only occurrences of the first year found are removed.
+    year = None
 
-    # Remove quality indicators
-    patterns = [
-        r'\b(720p|1080p|2160p|4k|uhd|hdr)\b',
-        r'\b(bluray|brrip|bdrip|dvdrip|webrip|web-dl|webdl|hdtv)\b',
-        r'\b(xvid|divx|x264|x265|h264|h265|hevc)\b',
-        r'\b(aac|ac3|dts|5\.1|7\.1)\b',
-        r'\b(proper|repack|extended|unrated|directors\s*cut|theatrical|remastered)\b',
-        r'\b(yify|yts|rarbg|eztv|ettv|sparks|axxo|fgt|ctrlhd|ntb|mtb|publichd)\b',
-    ]
-
-    for pattern in patterns:
-        name = re.sub(pattern, '', name, flags=re.IGNORECASE)
-
-    # Remove year from search string (will use separately)
-    if year:
-        name = re.sub(r'\b' + year + r'\b', '', name)
+    def strip_token(match):
+        nonlocal year
+        found = match.group('year')
+        if found is None:
+            return ''
+        if year is None:
+            year = found
+        return '' if found == year else found
+
+    name = MOVIE_TOKENS_RE.sub(strip_token, name)
 
     # Clean up whitespace
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = WHITESPACE_RE.sub(' ', name).strip()
 
     return {'name': name, 'year': year}
 
 
+@functools.lru_cache(maxsize=SHOW_NAME_CACHE_SIZE)
 def clean_show_name(name):
     """Clean a TV show name for searching."""
     # Replace common separators with spaces
-    name = re.sub(r'[._-]+', ' ', name)
+    name = SEPARATORS_RE.sub(' ', name)
 
     # Remove year in parentheses/brackets
-    name = re.sub(r'\([0-9]{4}\)', '', name)
-    name = re.sub(r'\[[0-9]{4}\]', '', name)
+    name = SHOW_YEAR_RE.sub('', name)
 
     # Remove quality indicators
-    patterns = [
-        r'\b(720p|1080p|2160p|4k|uhd|hdr)\b',
-        r'\b(bluray|brrip|bdrip|dvdrip|webrip|web-dl|webdl|hdtv)\b',
-        r'\b(xvid|divx|x264|x265|h264|h265|hevc)\b',
-        r'\b(aac|ac3|dts|5\.1|7\.1|proper|repack)\b',
-    ]
-
-    for pattern in patterns:
-        name = re.sub(pattern, '', name, flags=re.IGNORECASE)
+    name = SHOW_TOKENS_RE.sub('', name)
 
     # Remove common group names
-    name = re.sub(r'\s+(yify|yts|rarbg|eztv|ettv|sparks|axxo|fgt|ctrlhd|ntb|mtb|publichd|lol|dimension|fleet|killers|fov|bamboozle).*$', '', name, flags=re.IGNORECASE)
+    name = SHOW_GROUP_RE.sub('', name)
 
     # Clean up whitespace
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = WHITESPACE_RE.sub(' ', name).strip()
 
     return name
 
@@ -136,24 +182,60 @@ def clean_music_filename(filename):
     name = os.path.splitext(filename)[0]
 
     # Replace common separators with spaces
-    name = re.sub(r'[._-]+', ' ', name)
+    name = SEPARATORS_RE.sub(' ', name)
 
     # Remove track numbers at start
-    name = re.sub(r'^[\d]{1,3}[\.\-\s]*', '', name)
+    name = MUSIC_TRACK_NUMBER_RE.sub('', name)
 
     # Remove quality/format tags
-    name = re.sub(r'\b(320kbps|256kbps|192kbps|128kbps|flac|mp3|wav|aac|ogg|lossless|cd|vinyl|remaster|remastered)\b', '', name, flags=re.IGNORECASE)
+    name = MUSIC_TOKENS_RE.sub('', name)
 
     # Remove brackets content
-    name = re.sub(r'\[[^\]]*\]', '', name)
-    name = re.sub(r'\([^\)]*\)', '', name)
+    name = MUSIC_SQUARE_BRACKETS_RE.sub('', name)
+    name = MUSIC_PARENTHESES_RE.sub('', name)
 
     # Clean up whitespace
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = WHITESPACE_RE.sub(' ', name).strip()
 
     return name
 
 
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_filename_cached(filename, mode):
+    """Memoized body of parse_filename. Callers must not mutate the result."""
+    if mode in ('auto', 'movies', 'tv') and is_video_file(filename):
+        tv_info = detect_tv_show(filename)
+        if tv_info and mode != 'movies':
+            return 'tv', {
+                'show_name': clean_show_name(tv_info['show_name']),
+                'season': tv_info['season'],
+                'episode': tv_info['episode']
+            }
+        if mode != 'tv':
+            return 'movie', clean_movie_name(filename)
+        return None, None
+
+    if mode in ('auto', 'music') and is_audio_file(filename):
+        return 'music', {'query': clean_music_filename(filename)}
+
+    return None, None
+
+
+def parse_filename(filename, mode='auto'):
+    """
+    Detect the media type of a filename and parse it for searching.
+    Returns (type, detected_info); type is None if the file is not media
+    handled by the given mode.
+    """
+    media_type, detected_info = _parse_filename_cached(filename, mode)
+    return media_type, dict(detected_info) if detected_info else None
+
+
+def parse_many(filenames, mode='auto'):
+    """Parse a batch of filenames. Returns a list of (type, detected_info)."""
+    return [parse_filename(filename, mode) for filename in filenames]
+
+
 def sanitize_filename(name):
     """Remove invalid characters from filename."""
     # Remove invalid filename characters
@@ -163,16 +245,229 @@ def sanitize_filename(name):
     return name
 
 
-class TMDBClient:
-    """Client for The Movie Database API."""
+# Statuses worth retrying with backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def get_http_session(pool_size=10, retries=3, backoff=0.5, rate_limited=False):
+    """
+    Return this process's pooled keep-alive HTTP session.
+
+    The session is created on first use and again after a fork, so each
+    gunicorn worker gets its own connection pool. Idempotent requests are
+    retried with exponential backoff on connection errors and on 429/5xx,
+    honouring Retry-After. Settings only apply when the session is created.
+
+    A rate_limited session only retries connections that never reached
+    the server: every request that does reach it must take a rate limit
+    slot first, so clients with a limiter retry responses themselves.
+    """
+    pid = os.getpid()
+    with _http_sessions_lock:
+        session = _http_sessions.get((pid, rate_limited))
+        if session is None:
+            if rate_limited:
+                retry = Retry(total=retries, connect=retries, read=0, status=0, other=0,
+                              backoff_factor=backoff, raise_on_status=False)
+            else:
+                retry = Retry(
+                    total=retries,
+                    backoff_factor=backoff,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset(['GET']),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            for key in [key for key in _http_sessions if key[0] != pid]:
+                del _http_sessions[key]
+            _http_sessions[(pid, rate_limited)] = session
+    return session
+
+
+def retry_after(response):
+    """Return a response's Retry-After header in seconds, or 0."""
+    value = response.headers.get('Retry-After', '').strip()
+    if not value:
+        return 0.0
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, when.timestamp() - time.time())
+
+
+def get_host_slots(url, limit):
+    """
+    Return this process's semaphore bounding concurrent requests to the
+    host of url, shared by every client of that host. The limit only
+    applies when the semaphore is created.
+    """
+    key = (os.getpid(), urllib.parse.urlsplit(url).netloc)
+    with _host_slots_lock:
+        slots = _host_slots.get(key)
+        if slots is None:
+            slots = _host_slots[key] = threading.BoundedSemaphore(limit)
+    return slots
+
+
+class MetadataClient:
+    """
+    Base class for metadata API clients.
+
+    Requests go through a pooled keep-alive session with connect/read
+    timeouts. Responses are served from an optional MetadataCache. 404s and
+    responses with empty results are cached as negative entries; other
+    errors are never cached. With a singleflight Group, concurrent identical
+    requests share a single upstream call. base_url points a client at
+    another server speaking the same API, such as a mirror or a mock.
+    With max_concurrency, at most that many requests to the client's host
+    are in flight at once in this process; the rest wait their turn.
+
+    Clients hold no per-request state and can be shared between threads.
+    """
+
+    BASE_URL = ''
+    # Name of the service in metrics
+    SERVICE = ''
+    # Response keys holding the result list, used to spot empty results
+    RESULT_KEYS = ()
+    # (connect, read) timeout in seconds
+    TIMEOUT = (5, 30)
+
+    def __init__(self, cache=None, session=None, timeout=None, singleflight=None, base_url=None,
+                 max_concurrency=None):
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.slots = get_host_slots(self.base_url, max_concurrency) if max_concurrency else contextlib.nullcontext()
+        self.cache = cache
+        self.session = session or get_http_session()
+        self.timeout = timeout or self.TIMEOUT
+        self.singleflight = singleflight
+
+    def _request(self, path, params, headers=None, deadline=None):
+        """
+        Send a GET request to the API. deadline is the longest a caller is
+        willing to wait for a rate limit slot, for clients that have one.
+        """
+        with self.slots:
+            status = 'error'
+            start = time.perf_counter()
+            try:
+                response = self.session.get(f'{self.base_url}{path}', params=params,
+                                            headers=headers, timeout=self.timeout)
+                status = response.status_code
+                return response
+            finally:
+                metrics.UPSTREAM_DURATION.observe(time.perf_counter() - start, service=self.SERVICE)
+                metrics.UPSTREAM_REQUESTS.inc(service=self.SERVICE, status=status)
+
+    def _is_empty(self, data):
+        """Check whether a response has no results."""
+        return any(key in data and not data[key] for key in self.RESULT_KEYS)
+
+    def _fetch(self, key, path, params, headers, deadline):
+        """
+        Request an API path and cache the outcome.
+        Returns {'status', 'data'} for 200 and 404; raises for other errors.
+        """
+        response = self._request(path, params, headers, deadline)
+        if response.status_code not in (200, 404):
+            response.raise_for_status()
+
+        data = response.json() if response.status_code == 200 else None
+        entry = {'status': response.status_code, 'data': data}
+
+        if self.cache is not None:
+            negative = data is None or self._is_empty(data)
+            blocking.call(functools.partial(self.cache.set, key, entry, negative=negative))
+        return entry
+
+    def _get_json(self, path, params, headers=None, deadline=None):
+        """
+        GET an API path and return the decoded JSON body.
+        Raises requests.HTTPError for error statuses, including cached 404s.
+        """
+        key = MetadataCache.make_key(f'{self.base_url}{path}', params)
+
+        entry = blocking.call(self.cache.get, key) if self.cache is not None else MISSING
+        if entry is MISSING:
+            def fetch():
+                return self._fetch(key, path, params, headers, deadline)
+
+            if self.singleflight is None:
+                entry = fetch()
+            else:
+                # Another worker may have filled the cache while we waited
+                recheck = None
+                if self.cache is not None:
+                    def recheck():
+                        found = blocking.call(functools.partial(self.cache.get, key, count=False))
+                        return None if found is MISSING else found
+
+                entry = self.singleflight.do(key, fetch, recheck)
+
+        if entry['status'] != 200:
+            raise requests.HTTPError(f"{entry['status']} Client Error: Not Found for path: {path}")
+        return entry['data']
+
+
+class TMDBClient(MetadataClient):
+    """
+    Client for The Movie Database API.
+
+    With an offline index, searches are answered locally when the index
+    has a confident match (see offline_index.is_confident) and otherwise
+    go to the API, which also gives en-US titles where the index only
+    has original ones. Without an API key the index is all there is, and
+    any similar titles it has are returned.
+    """
 
     BASE_URL = 'https://api.themoviedb.org/3'
+    SERVICE = 'tmdb'
+    RESULT_KEYS = ('results',)
 
-    def __init__(self, api_key):
+    # In-process memo of season episode maps, on top of the response cache
+    SEASON_MEMO_SIZE = 512
+    SEASON_MEMO_TTL = 600
+
+    def __init__(self, api_key, cache=None, session=None, timeout=None, singleflight=None, base_url=None,
+                 max_concurrency=None, offline_index=None):
+        super().__init__(cache, session, timeout, singleflight, base_url, max_concurrency)
         self.api_key = api_key
+        self.offline_index = offline_index
+        self._season_memo = {}
+        self._season_memo_lock = threading.Lock()
+
+    def _search_offline(self, kind, query, year=None):
+        """
+        Search the offline index, returning an API-shaped response, or None
+        to ask the API instead: with an API key, anything short of a
+        confident match.
+        """
+        results = []
+        if self.offline_index is not None:
+            results = self.offline_index.search(kind, query, year)
+        if self.api_key and not offline_index.is_confident(kind, results, query, year):
+            return None
+        return {'page': 1, 'results': results, 'total_results': len(results),
+                'total_pages': 1 if results else 0, 'source': 'offline'}
 
     def search_movie(self, query, year=None):
         """Search for a movie."""
+        offline = self._search_offline('movie', query, year)
+        if offline is not None:
+            return offline
+
         params = {
             'api_key': self.api_key,
             'query': query,
@@ -183,12 +478,14 @@ class TMDBClient:
         if year:
             params['year'] = year
 
-        response = requests.get(f'{self.BASE_URL}/search/movie', params=params)
-        response.raise_for_status()
-        return response.json()
+        return self._get_json('/search/movie', params)
 
     def search_tv(self, query):
         """Search for a TV show."""
+        offline = self._search_offline('tv', query)
+        if offline is not None:
+            return offline
+
         params = {
             'api_key': self.api_key,
             'query': query,
@@ -197,49 +494,134 @@ class TMDBClient:
             'include_adult': 'false'
         }
 
-        response = requests.get(f'{self.BASE_URL}/search/tv', params=params)
-        response.raise_for_status()
-        return response.json()
+        return self._get_json('/search/tv', params)
 
-    def get_episode_details(self, show_id, season, episode):
-        """Get episode title from TMDB."""
+    def get_season_episodes(self, show_id, season):
+        """
+        Get all episode titles of a season in one request.
+        Returns dict of episode number to title.
+        """
         season = int(season)
-        episode = int(episode)
+        if not self.api_key:
+            # Episode titles are not in the offline index
+            return {}
+
+        memo_key = (str(show_id), season)
+        now = time.time()
+
+        with self._season_memo_lock:
+            memo = self._season_memo.get(memo_key)
+        if memo and memo[0] > now:
+            return memo[1]
 
         params = {
             'api_key': self.api_key,
             'language': 'en-US'
         }
 
-        url = f'{self.BASE_URL}/tv/{show_id}/season/{season}/episode/{episode}'
-        response = requests.get(url, params=params)
-
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('name', '')
-        return ''
+        data = self._get_json(f'/tv/{show_id}/season/{season}', params)
+        episodes = {
+            ep['episode_number']: ep.get('name', '')
+            for ep in data.get('episodes', [])
+            if 'episode_number' in ep
+        }
 
+        with self._season_memo_lock:
+            if len(self._season_memo) >= self.SEASON_MEMO_SIZE:
+                self._season_memo.pop(next(iter(self._season_memo)))
+            self._season_memo[memo_key] = (now + self.SEASON_MEMO_TTL, episodes)
 
-class MusicBrainzClient:
-    """Client for MusicBrainz API."""
+        return episodes
 
-    BASE_URL = 'https://musicbrainz.org/ws/2'
-    USER_AGENT = 'MediaRenamer/1.0 (https://github.com/sp00nznet/file-renamer)'
+    def get_episode_details(self, show_id, season, episode):
+        """Get episode title from TMDB."""
+        season = int(season)
+        episode = int(episode)
 
-    # Rate limiting - 1 request per second
-    _last_request = 0
+        # Whole-season lookups are shared by every episode of the season
+        try:
+            return self.get_season_episodes(show_id, season).get(episode, '')
+        except requests.HTTPError:
+            pass
 
-    def _rate_limit(self):
-        """Ensure we don't exceed rate limits."""
-        elapsed = time.time() - self._last_request
-        if elapsed < 1.0:
-            time.sleep(1.0 - elapsed)
-        self._last_request = time.time()
+        params = {
+            'api_key': self.api_key,
+            'language': 'en-US'
+        }
 
-    def search_recording(self, query):
-        """Search for a music recording."""
-        self._rate_limit()
+        try:
+            data = self._get_json(f'/tv/{show_id}/season/{season}/episode/{episode}', params)
+        except requests.HTTPError:
+            return ''
+        return data.get('name', '')
+
+    def get_episode_titles(self, show_id, episodes):
+        """
+        Get titles for many (season, episode) pairs, fetching each season once.
+        Returns list of titles in the same order; '' where not found.
+        """
+        seasons = {}
+        titles = []
+
+        for season, episode in episodes:
+            season = int(season)
+            if season not in seasons:
+                try:
+                    seasons[season] = self.get_season_episodes(show_id, season)
+                except requests.HTTPError:
+                    seasons[season] = {}
+            titles.append(seasons[season].get(int(episode), ''))
+
+        return titles
+
+
+class MusicBrainzClient(MetadataClient):
+    """Client for MusicBrainz API."""
 
+    BASE_URL = 'https://musicbrainz.org/ws/2'
+    SERVICE = 'musicbrainz'
+    USER_AGENT = 'MediaRenamer/1.0 (https://github.com/sp00nznet/file-renamer)'
+    RESULT_KEYS = ('recordings',)
+
+    # Rate limiting - 1 request per second. Used when no shared limiter is
+    # given; shared by every instance in this process.
+    default_rate_limiter = RateLimiter('musicbrainz', rate=1.0)
+
+    def __init__(self, cache=None, session=None, timeout=None, singleflight=None, base_url=None,
+                 max_concurrency=None, rate_limiter=None, retries=3, backoff=0.5):
+        super().__init__(cache, session or get_http_session(rate_limited=True), timeout, singleflight,
+                         base_url, max_concurrency)
+        self.rate_limiter = rate_limiter or self.default_rate_limiter
+        self.retries = retries
+        self.backoff = backoff
+
+    def _request(self, path, params, headers=None, deadline=None):
+        """
+        Send a rate-limited GET request. Cache hits never get here.
+
+        429 and 5xx responses are retried up to `retries` times, waiting
+        out Retry-After (or exponential backoff) and then a fresh rate
+        limit slot before each attempt, so retries count against the limit
+        like any other request. The session must be a rate_limited one.
+        A wait longer than deadline returns the failed response instead.
+        """
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.acquire(deadline)
+            response = super()._request(path, params, headers)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+
+            delay = max(retry_after(response), self.backoff * 2 ** attempt)
+            if deadline is not None and delay > deadline:
+                return response
+            response.close()
+            time.sleep(delay)
+
+    def search_recording(self, query, deadline=None):
+        """
+        Search for a music recording.
+        Raises RateLimitTimeout if no request slot is free within deadline seconds.
+        """
         params = {
             'query': query,
             'fmt': 'json',
@@ -248,64 +630,115 @@ class MusicBrainzClient:
 
         headers = {'User-Agent': self.USER_AGENT}
 
-        response = requests.get(
-            f'{self.BASE_URL}/recording',
-            params=params,
-            headers=headers
-        )
-        response.raise_for_status()
-        return response.json()
+        return self._get_json('/recording', params, headers, deadline)
 
 
-def scan_directory(directory, mode='auto'):
+def add_embedded_tags(detected_info, filepath):
     """
-    Scan a directory for media files.
-    Returns list of file info dicts.
+    Add artist/title/album from a music file's own tags to its detected
+    info. Files tagged with both artist and title are marked resolved:
+    they can be renamed without a MusicBrainz lookup.
     """
-    files = []
+    embedded = tags.read_tags(filepath)
+    if not embedded:
+        return
+
+    detected_info.update(embedded)
+    if embedded.get('artist') and embedded.get('title'):
+        detected_info['resolved'] = True
+        detected_info['query'] = f"{embedded['artist']} {embedded['title']}"
+
+
+def build_file_info(filename, filepath, mode='auto'):
+    """
+    Build the file info dict for a single file.
+    Returns None if the file is not a media file handled by the given mode.
+    """
+    media_type, detected_info = parse_filename(filename, mode)
+
+    # Video files are listed even when the mode rejects their type
+    if media_type is None and not (mode == 'tv' and is_video_file(filename)):
+        return None
+
+    if media_type == 'music':
+        add_embedded_tags(detected_info, filepath)
+
+    return {
+        'filename': filename,
+        'filepath': filepath,
+        'extension': get_extension(filename),
+        'type': media_type,
+        'detected_info': detected_info
+    }
 
-    if not os.path.isdir(directory):
-        return files
 
-    for filename in sorted(os.listdir(directory)):
-        filepath = os.path.join(directory, filename)
+def list_media_files(directory, mode='auto', recursive=False, stats=None):
+    """
+    List one directory with os.scandir. Returns (file info dicts,
+    subdirectories), both sorted by name; subdirectories only if recursive.
+    With a stats dict, each media file's stat result is stored in it by
+    path, so callers needing sizes do not stat the files again.
+    """
+    try:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return [], []
 
-        if not os.path.isfile(filepath):
+    files = []
+    subdirs = []
+    for entry in entries:
+        try:
+            if entry.is_file():
+                file_info = build_file_info(entry.name, entry.path, mode)
+                if file_info:
+                    if stats is not None:
+                        with contextlib.suppress(OSError):
+                            stats[entry.path] = entry.stat()
+                    files.append(file_info)
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+        except OSError:
             continue
+    return files, subdirs
 
-        ext = get_extension(filename)
 
-        file_info = {
-            'filename': filename,
-            'filepath': filepath,
-            'extension': ext,
-            'type': None,
-            'detected_info': None
-        }
+def iter_media_files(directory, mode='auto', recursive=False, walker=None, stats=None):
+    """
+    Walk a directory and yield file info dicts.
 
-        if mode in ('auto', 'movies', 'tv') and is_video_file(filename):
-            tv_info = detect_tv_show(filename)
-            if tv_info and mode != 'movies':
-                file_info['type'] = 'tv'
-                file_info['detected_info'] = {
-                    'show_name': clean_show_name(tv_info['show_name']),
-                    'season': tv_info['season'],
-                    'episode': tv_info['episode']
-                }
-            elif mode != 'tv':
-                file_info['type'] = 'movie'
-                cleaned = clean_movie_name(filename)
-                file_info['detected_info'] = cleaned
-            files.append(file_info)
-
-        elif mode in ('auto', 'music') and is_audio_file(filename):
-            file_info['type'] = 'music'
-            file_info['detected_info'] = {
-                'query': clean_music_filename(filename)
-            }
-            files.append(file_info)
+    Entries are sorted by name within each directory. When recursive, a
+    directory's files are yielded before its subdirectories are entered,
+    so results arrive one directory at a time. With a ConcurrentWalker,
+    directories are listed on its threads, in the same order. A stats
+    dict is filled as in list_media_files, before each file is yielded.
+    """
+    if walker is not None:
+        def visit(path):
+            return list_media_files(path, mode, recursive, stats)
+
+        for _, files in walker.walk(directory, visit, recursive):
+            yield from files
+        return
+
+    stack = [directory]
+
+    while stack:
+        files, subdirs = list_media_files(stack.pop(), mode, recursive, stats)
+        yield from files
+        # Reversed so the stack pops subdirectories in sorted order
+        stack.extend(reversed(subdirs))
+
+
+def scan_directory(directory, mode='auto', recursive=False, walker=None):
+    """
+    Scan a directory for media files.
+    Returns list of file info dicts.
+    """
+    if not os.path.isdir(directory):
+        return []
 
-    return files
+    return list(iter_media_files(directory, mode, recursive, walker))
 
 
 def get_movie_filename(title, year, extension):
@@ -358,6 +791,7 @@ def rename_file(old_path, new_filename, dry_run=False):
         }
 
     if dry_run:
+        metrics.RENAMES.inc(kind='single', result='dry_run')
         return {
             'success': True,
             'message': 'Dry run - file would be renamed',
@@ -366,13 +800,16 @@ def rename_file(old_path, new_filename, dry_run=False):
         }
 
     try:
-        os.rename(old_path, new_path)
+        with metrics.RENAME_DURATION.time(kind='single'):
+            os.rename(old_path, new_path)
+        metrics.RENAMES.inc(kind='single', result='success')
         return {
             'success': True,
             'message': 'File renamed successfully',
             'new_path': new_path
         }
     except OSError as e:
+        metrics.RENAMES.inc(kind='single', result='failed')
         return {
             'success': False,
             'message': f'Failed to rename file: {str(e)}',
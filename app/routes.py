@@ -2,12 +2,432 @@
 Flask routes for Media Renamer Web App
 """
 
+import hashlib
+import json
 import os
-from flask import Blueprint, render_template, request, jsonify, current_app
-from . import renamer
+import sqlite3
+import threading
+import time
+from flask import (Blueprint, Response, g, render_template, request, jsonify,
+                   current_app, stream_with_context, url_for)
+from . import (blocking, browser, compression, fingerprint, matcher, metrics, offline_index, organize, ranking,
+               rename_plan, renamer, singleflight, walker, watcher)
+from .scan_columns import ScanColumns
+from .metadata_cache import MetadataCache
+from .ratelimit import RateLimiter, RateLimitTimeout
+from .scan_index import ScanIndex
+from .scan_results import SCAN_ID_RE, ScanResults
 
 bp = Blueprint('main', __name__)
 
+# Per-process metadata cache, rate limiter and API clients, created on first use
+_metadata_cache = None
+_musicbrainz_limiter = None
+_singleflight = None
+_watch_queue = None
+_match_memory = None
+_scan_results = None
+_listing_cache = None
+_media_counter = None
+_offline_index = None
+_offline_index_checked = None
+_ranker = None
+_watcher = None
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def open_scan_index():
+    """Open the persistent scan index, or return None if it is disabled or unavailable."""
+    if not current_app.config.get('SCAN_INDEX'):
+        return None
+
+    db_path = os.path.join(current_app.config.get('DATA_DIR', '/data'), 'scan_index.db')
+    try:
+        return ScanIndex(db_path)
+    except (OSError, sqlite3.Error) as e:
+        current_app.logger.warning('Scan index unavailable (%s), scanning without it', e)
+        return None
+
+
+def get_scan_results():
+    """Return the store of scan result snapshots, or None if it is unavailable."""
+    global _scan_results
+
+    if _scan_results is None:
+        db_path = os.path.join(current_app.config.get('DATA_DIR', '/data'), 'scan_results.db')
+        try:
+            _scan_results = ScanResults(db_path, ttl=current_app.config['SCAN_RESULTS_TTL'])
+        except (OSError, sqlite3.Error) as e:
+            current_app.logger.warning('Scan snapshots unavailable (%s)', e)
+            return None
+
+    return _scan_results
+
+
+PAGE_FILTERS = ('type', 'show', 'extension', 'status', 'q')
+
+
+def scan_page(results, scan_id, options):
+    """Read one page of a snapshot using the paging, sort and filter options given."""
+    files, next_cursor, matching = results.page(
+        scan_id,
+        cursor=options.get('cursor'),
+        limit=options.get('limit') or 500,
+        sort=options.get('sort') or 'scan',
+        order=options.get('order') or 'asc',
+        **{name: options.get(name) for name in PAGE_FILTERS}
+    )
+    if options.get('fields'):
+        fields = options['fields'].split(',')
+        files = [{field: f.get(field) for field in fields} for f in files]
+
+    page = {'files': files, 'count': len(files), 'next_cursor': next_cursor}
+    if matching is not None:
+        page['matching'] = matching
+    return page
+
+
+def get_metadata_cache():
+    """Return the shared metadata response cache, or None if it is disabled or unavailable."""
+    global _metadata_cache
+
+    if not current_app.config.get('METADATA_CACHE'):
+        return None
+
+    if _metadata_cache is None:
+        db_path = os.path.join(current_app.config.get('DATA_DIR', '/data'), 'metadata_cache.db')
+        try:
+            _metadata_cache = MetadataCache(
+                db_path,
+                ttl=current_app.config['METADATA_CACHE_TTL'],
+                negative_ttl=current_app.config['METADATA_CACHE_NEGATIVE_TTL'],
+                max_entries=current_app.config['METADATA_CACHE_SIZE']
+            )
+        except (OSError, sqlite3.Error) as e:
+            current_app.logger.warning('Metadata cache unavailable (%s), continuing without it', e)
+            return None
+
+    return _metadata_cache
+
+
+def get_match_memory():
+    """Return the fingerprint-keyed memory of accepted matches, or None if it is disabled or unavailable."""
+    global _match_memory
+
+    if not current_app.config.get('MATCH_MEMORY'):
+        return None
+
+    if _match_memory is None:
+        db_path = os.path.join(current_app.config.get('DATA_DIR', '/data'), 'match_memory.db')
+        try:
+            _match_memory = fingerprint.MatchMemory(db_path)
+        except (OSError, sqlite3.Error) as e:
+            current_app.logger.warning('Match memory unavailable (%s), continuing without it', e)
+            return None
+
+    return _match_memory
+
+
+def get_scan_walker(directory):
+    """
+    Return a ConcurrentWalker for scanning directory, or None to scan it
+    serially. With SCAN_CONCURRENCY "auto", only network filesystems,
+    where each listing is a round trip, are walked concurrently.
+    """
+    setting = current_app.config['SCAN_CONCURRENCY']
+    if setting == 'off' or (setting == 'auto' and not watcher.is_network_filesystem(directory)):
+        return None
+    return walker.ConcurrentWalker(
+        workers=current_app.config['SCAN_WORKERS'],
+        per_mount=current_app.config['SCAN_MOUNT_CONCURRENCY']
+    )
+
+
+def iter_scanned_files(directory, mode, recursive, index=None):
+    """
+    Yield scanned file info dicts, through the scan index if one is given,
+    with any match remembered for a file's content attached as "known_match".
+    """
+    memory = get_match_memory()
+    scan_walker = get_scan_walker(directory)
+    indexed = 'false' if index is None else 'true'
+    count = 0
+    start = time.perf_counter()
+
+    # Sizes for matching against the memory come from the scan itself, only
+    # needed once something is remembered
+    stats = {} if memory is not None and memory.known_sizes() else None
+
+    try:
+        if index is None:
+            files = renamer.iter_media_files(directory, mode, recursive, scan_walker, stats)
+            if memory is not None:
+                files = fingerprint.attach_known_matches(files, memory, stats=stats)
+            for file_info in files:
+                count += 1
+                yield file_info
+            return
+
+        with index:
+            files = index.iter_media_files(directory, mode, recursive, scan_walker, stats)
+            if memory is not None:
+                files = fingerprint.attach_known_matches(files, memory, index.fingerprint, stats)
+            for file_info in files:
+                count += 1
+                yield file_info
+    finally:
+        metrics.SCANNED_FILES.inc(count, indexed=indexed)
+        metrics.SCAN_DURATION.observe(time.perf_counter() - start, indexed=indexed)
+
+
+def scan_etag(index, directory, mode, recursive, options):
+    """
+    Return the entity tag for a scan's response, or None if the index
+    cannot vouch for the directories being unchanged (for one, the first
+    scan of a directory). The tag covers the scan options, the mtime of
+    every directory the scan would visit and the match memory, so it
+    changes whenever the response could.
+    """
+    try:
+        signature = index.signature(directory, mode, recursive, get_scan_walker(directory))
+        if signature is None:
+            return None
+        digest = hashlib.sha1(signature.encode())
+        digest.update(json.dumps([directory, options], sort_keys=True).encode())
+        memory = get_match_memory()
+        if memory is not None:
+            digest.update(memory.version().encode())
+    except sqlite3.Error as e:
+        current_app.logger.warning('Scan signature unavailable: %s', e)
+        return None
+    return digest.hexdigest()
+
+
+def not_modified(etag):
+    """An empty 304 response for a request whose If-None-Match matched etag."""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def remember_matches(memory, accepted):
+    """
+    Record accepted renames, given as (file_data, new_path) pairs, in the
+    match memory. Failures are logged, never raised.
+    """
+    if memory is None or not accepted:
+        return
+
+    def remember():
+        entries = []
+        for file_data, new_path in accepted:
+            try:
+                entries.append((fingerprint.fingerprint(new_path), file_data.get('type'),
+                                file_data, os.path.basename(new_path)))
+            except OSError:
+                continue
+
+        try:
+            memory.remember(entries)
+        except sqlite3.Error as e:
+            current_app.logger.warning('Failed to remember matches: %s', e)
+
+    blocking.call(remember)
+
+
+def get_singleflight():
+    """
+    Return the group that coalesces identical in-flight metadata lookups,
+    coordinating with other workers through lock files in DATA_DIR.
+    """
+    global _singleflight
+
+    if not current_app.config.get('SINGLEFLIGHT'):
+        return None
+
+    if _singleflight is None:
+        lock_dir = os.path.join(current_app.config.get('DATA_DIR', '/data'), 'locks')
+        try:
+            _singleflight = singleflight.Group(lock_dir)
+        except OSError as e:
+            current_app.logger.warning('Cross-worker coalescing unavailable (%s), coalescing per process', e)
+            _singleflight = singleflight.Group()
+
+    return _singleflight
+
+
+def _client_options(rate_limited=False):
+    """
+    Session, timeout, cache, coalescing and concurrency shared by all
+    metadata clients. Rate-limited clients get a session that leaves
+    retrying responses to them.
+    """
+    config = current_app.config
+    return {
+        'cache': get_metadata_cache(),
+        'singleflight': get_singleflight(),
+        'session': renamer.get_http_session(
+            pool_size=config['HTTP_POOL_SIZE'],
+            retries=config['HTTP_RETRIES'],
+            backoff=config['HTTP_RETRY_BACKOFF'],
+            rate_limited=rate_limited
+        ),
+        'timeout': (config['HTTP_CONNECT_TIMEOUT'], config['HTTP_READ_TIMEOUT']),
+        'max_concurrency': config['UPSTREAM_CONCURRENCY']
+    }
+
+
+def get_offline_index():
+    """
+    Return the offline TMDB index, or None if none has been imported.
+    A missing index is looked for again once a minute, so one imported
+    while the server runs is picked up.
+    """
+    global _offline_index, _offline_index_checked
+
+    if _offline_index is not None:
+        return _offline_index
+
+    now = time.monotonic()
+    if _offline_index_checked is not None and now - _offline_index_checked < 60:
+        return None
+    _offline_index_checked = now
+
+    db_path = current_app.config['TMDB_OFFLINE_INDEX']
+    if db_path and os.path.exists(db_path):
+        try:
+            _offline_index = offline_index.OfflineIndex(db_path)
+        except (OSError, sqlite3.Error) as e:
+            current_app.logger.warning('Offline TMDB index unavailable (%s)', e)
+
+    return _offline_index
+
+
+def get_tmdb_client(api_key):
+    """
+    Return the shared TMDB client, rebuilding it if the API key or the
+    offline index changed.
+    """
+    index = get_offline_index()
+    with _clients_lock:
+        client = _clients.get('tmdb')
+        if client is None or client.api_key != api_key or client.offline_index is not index:
+            client = renamer.TMDBClient(api_key, base_url=current_app.config['TMDB_BASE_URL'],
+                                        offline_index=index, **_client_options())
+            _clients['tmdb'] = client
+    return client
+
+
+def get_ranker():
+    """Return this process's candidate ranker, which memoizes normalized titles."""
+    global _ranker
+
+    if _ranker is None:
+        _ranker = ranking.Ranker(
+            accept_score=current_app.config['AUTO_ACCEPT_SCORE'],
+            accept_margin=current_app.config['AUTO_ACCEPT_MARGIN']
+        )
+    return _ranker
+
+
+def get_musicbrainz_limiter():
+    """
+    Return the MusicBrainz rate limiter shared by all worker processes,
+    falling back to a per-process one if DATA_DIR is unavailable.
+    """
+    global _musicbrainz_limiter
+
+    if _musicbrainz_limiter is None:
+        rate = current_app.config['MUSICBRAINZ_RATE']
+        db_path = os.path.join(current_app.config.get('DATA_DIR', '/data'), 'ratelimit.db')
+        try:
+            _musicbrainz_limiter = RateLimiter('musicbrainz', rate=rate, db_path=db_path)
+        except (OSError, sqlite3.Error) as e:
+            current_app.logger.warning('Shared rate limiter unavailable (%s), limiting per process', e)
+            _musicbrainz_limiter = RateLimiter('musicbrainz', rate=rate)
+
+    return _musicbrainz_limiter
+
+
+def get_musicbrainz_client():
+    """Return the shared MusicBrainz client."""
+    with _clients_lock:
+        client = _clients.get('musicbrainz')
+        if client is None:
+            client = renamer.MusicBrainzClient(base_url=current_app.config['MUSICBRAINZ_BASE_URL'],
+                                               rate_limiter=get_musicbrainz_limiter(),
+                                               retries=current_app.config['HTTP_RETRIES'],
+                                               backoff=current_app.config['HTTP_RETRY_BACKOFF'],
+                                               **_client_options(rate_limited=True))
+            _clients['musicbrainz'] = client
+    return client
+
+
+@bp.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@bp.after_request
+def observe_request(response):
+    """Record the request's latency, labelled by route pattern rather than path."""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - started, route=route,
+                                         method=request.method, status=response.status_code)
+    return response
+
+
+@bp.after_request
+def compress_response(response):
+    """Compress large JSON and streamed NDJSON for clients that accept it."""
+    if not current_app.config.get('COMPRESSION'):
+        return response
+    return compression.compress_response(response, request.accept_encodings,
+                                         current_app.config['COMPRESS_MIN_SIZE'])
+
+
+@bp.after_app_request
+def cache_static(response):
+    """Let browsers keep versioned static files (see static_url) without revalidating."""
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['STATIC_MAX_AGE']
+        response.cache_control.immutable = True
+    return response
+
+
+_static_versions = {}
+
+
+@bp.app_context_processor
+def static_helpers():
+    def static_url(filename):
+        """
+        URL of a static file with a content hash in its query string, so a
+        changed file gets a new URL and can be cached indefinitely.
+        """
+        path = os.path.join(current_app.static_folder, filename)
+        mtime_ns = os.stat(path).st_mtime_ns
+        version = _static_versions.get(path)
+        if version is None or version[0] != mtime_ns:
+            with open(path, 'rb') as f:
+                version = _static_versions[path] = (mtime_ns, hashlib.sha1(f.read()).hexdigest()[:12])
+        return url_for('static', filename=filename, v=version[1])
+
+    return {'static_url': static_url}
+
+
+@bp.route('/metrics')
+def get_metrics():
+    """Prometheus scrape endpoint, summed over all worker processes."""
+    if not current_app.config.get('METRICS'):
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.REGISTRY.exposition(), content_type=metrics.CONTENT_TYPE)
+
 
 @bp.route('/')
 def index():
@@ -20,7 +440,10 @@ def get_config():
     """Get current configuration."""
     return jsonify({
         'tmdb_api_key': bool(current_app.config.get('TMDB_API_KEY')),
-        'media_dir': current_app.config.get('MEDIA_DIR', '/media')
+        'tmdb_offline_index': get_offline_index() is not None,
+        'media_dir': current_app.config.get('MEDIA_DIR', '/media'),
+        'watch_enabled': bool(current_app.config.get('WATCH_ENABLED')),
+        'library_dir': current_app.config.get('LIBRARY_DIR') or None
     })
 
 
@@ -44,59 +467,431 @@ def set_config():
 
 @bp.route('/api/scan', methods=['POST'])
 def scan_files():
-    """Scan directory for media files."""
+    """
+    Scan directory for media files.
+
+    With "stream" set, results are sent as newline-delimited JSON, one
+    file per line, as the directory tree is walked. Scans go through the
+    persistent scan index unless "incremental" is false.
+
+    With "limit" set, or "snapshot" with "stream", the results are also
+    kept on the server as a snapshot that can be paged, sorted and
+    filtered through /api/scan/<scan_id>. A limited scan returns the
+    snapshot's first page (taking the same options as that endpoint); a
+    streamed one sends the snapshot id in the X-Scan-Id header and each
+    file's position in the snapshot as "seq".
+
+    With "format": "columnar", files are sent in ScanColumns' columnar
+    format instead of as a list of objects; streamed, each line is a
+    block of files in that format.
+
+    Indexed scans of directories the index already holds carry an ETag
+    (see scan_etag). Sent back in If-None-Match, it is answered with 304
+    and no re-scan while nothing has changed; for scans kept as a
+    snapshot the tag names the snapshot, which is reused while it exists.
+    """
     data = request.json or {}
     directory = data.get('directory', current_app.config.get('MEDIA_DIR', '/media'))
     mode = data.get('mode', 'auto')
+    recursive = bool(data.get('recursive', False))
+    columnar = data.get('format', 'rows') == 'columnar'
 
     if not os.path.isdir(directory):
         return jsonify({'error': f'Directory not found: {directory}'}), 400
+    if data.get('format', 'rows') not in ('rows', 'columnar'):
+        return jsonify({'error': 'format must be "rows" or "columnar"'}), 400
+
+    paginate = data.get('limit') is not None
+    results = get_scan_results() if paginate or (data.get('stream') and data.get('snapshot')) else None
+    if paginate and results is None:
+        return jsonify({'error': 'Paginated scans are unavailable'}), 503
+
+    # Opened after the last early return above; iter_scanned_files closes it
+    index = open_scan_index() if data.get('incremental', True) else None
+
+    etag = blocking.call(scan_etag, index, directory, mode, recursive, data) if index is not None else None
+    if etag is not None:
+        unchanged = unchanged_scan(etag, results)
+        if unchanged is not None:
+            index.close()
+            return unchanged
+
+    scan_id = results.create(directory, mode, recursive) if results is not None else None
+    if etag is not None and scan_id is not None:
+        etag = f'{etag}-{scan_id}'
+
+    def iter_files():
+        files = iter_scanned_files(directory, mode, recursive, index)
+        if scan_id is not None:
+            files = results.record(scan_id, files)
+        return files
+
+    if paginate:
+        def drain():
+            for _ in iter_files():
+                pass
+
+        blocking.call(drain)
+        try:
+            page = scan_page(results, scan_id, data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = jsonify({**results.get(scan_id), **page})
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+        return response
+
+    if data.get('stream'):
+        def flush(buffer):
+            if columnar:
+                return json.dumps(ScanColumns(buffer).to_json()) + '\n'
+            return ''.join(json.dumps(file_info) + '\n' for file_info in buffer)
+
+        def generate():
+            # Flush once per directory (or every 500 files) rather than per line
+            buffer = []
+            current_dir = None
+            for file_info in blocking.iterate(iter_files()):
+                file_dir = os.path.dirname(file_info['filepath'])
+                if buffer and (file_dir != current_dir or len(buffer) >= 500):
+                    yield flush(buffer)
+                    buffer = []
+                current_dir = file_dir
+                buffer.append(file_info)
+            if buffer:
+                yield flush(buffer)
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        if scan_id is not None:
+            response.headers['X-Scan-Id'] = scan_id
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+        return response
+
+    header = {'directory': directory, 'mode': mode, 'recursive': recursive}
+
+    def respond():
+        files = ScanColumns(iter_files())
+        if columnar:
+            return jsonify({**header, **files.to_json()})
+
+        # Encoded a file at a time, so the whole list never exists as dicts
+        encode = current_app.json.dumps
+        body = ''.join([
+            encode({**header, 'count': len(files)})[:-1],
+            ',"files":[',
+            ','.join(encode(file_info) for file_info in files),
+            ']}'
+        ])
+        return current_app.response_class(body, mimetype='application/json')
+
+    # The scan and its encoding run off the event loop under gevent
+    response = blocking.call(respond)
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def unchanged_scan(etag, results):
+    """
+    Return a 304 response if the request's If-None-Match holds etag, or,
+    for snapshot scans (results given), etag suffixed with the id of a
+    complete snapshot that still exists. Otherwise return None.
+    """
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if results is None:
+            if tag == etag:
+                return not_modified(tag)
+        elif tag.startswith(etag + '-'):
+            scan_id = tag[len(etag) + 1:]
+            snapshot = results.get(scan_id) if SCAN_ID_RE.match(scan_id) else None
+            if snapshot is not None and snapshot['complete']:
+                response = not_modified(tag)
+                response.headers['X-Scan-Id'] = scan_id
+                return response
+    return None
+
+
+@bp.route('/api/scan/<scan_id>', methods=['GET'])
+def scan_snapshot(scan_id):
+    """
+    Page through a scan snapshot.
+
+    Takes "cursor" (from the previous page's next_cursor), "limit",
+    "sort" (scan, name, path, type, show or extension), "order" (asc or
+    desc) and filters "type", "show", "extension", "status" (matched,
+    unmatched, known or tagged) and "q" (filename substring). "fields"
+    (comma-separated) trims each file to just those keys. With "facets",
+    the first page also lists the types, shows and extensions present
+    with their counts.
+    """
+    results = get_scan_results()
+    snapshot = results.get(scan_id) if results is not None and SCAN_ID_RE.match(scan_id) else None
+    if snapshot is None:
+        return jsonify({'error': 'Scan not found'}), 404
+
+    options = request.args.to_dict()
+    options['limit'] = request.args.get('limit', 500, type=int)
+    try:
+        page = scan_page(results, scan_id, options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('facets') and not options.get('cursor'):
+        page['facets'] = results.facets(scan_id)
+
+    return jsonify({**snapshot, **page})
+
+
+def _open_watch_queue(config):
+    return watcher.WatchQueue(os.path.join(config.get('DATA_DIR', '/data'), 'watch_queue.db'))
+
 
-    files = renamer.scan_directory(directory, mode)
+def get_watch_queue():
+    """Return the queue of files found by the watcher, or None if watching is disabled or unavailable."""
+    global _watch_queue
 
+    if not current_app.config.get('WATCH_ENABLED'):
+        return None
+
+    if _watch_queue is None:
+        try:
+            _watch_queue = _open_watch_queue(current_app.config)
+        except (OSError, sqlite3.Error) as e:
+            current_app.logger.warning('Watch queue unavailable (%s)', e)
+            return None
+
+    return _watch_queue
+
+
+def start_watcher(app):
+    """
+    Start this process's watcher thread. Every worker starts one; a lock
+    file in DATA_DIR lets only one of them watch at a time.
+    """
+    global _watcher
+
+    config = app.config
+    roots = [config.get('MEDIA_DIR', '/media')]
+    roots += [d for d in config['WATCH_DIRS'] if d not in roots]
+    data_dir = config.get('DATA_DIR', '/data')
+
+    try:
+        _watcher = watcher.Watcher(
+            roots,
+            _open_watch_queue(config),
+            mode=config['WATCH_MODE'],
+            settle=config['WATCH_SETTLE'],
+            poll_interval=config['WATCH_POLL_INTERVAL'],
+            backend=config['WATCH_BACKEND'],
+            lock_path=os.path.join(data_dir, 'watcher.lock'),
+            logger=app.logger
+        )
+    except (OSError, sqlite3.Error) as e:
+        app.logger.warning('Watch folders unavailable (%s)', e)
+        return None
+
+    _watcher.start()
+    return _watcher
+
+
+def get_job_store():
+    """Return the store for auto-match job state."""
+    return matcher.JobStore(os.path.join(current_app.config.get('DATA_DIR', '/data'), 'jobs'))
+
+
+@bp.route('/api/match/jobs', methods=['POST'])
+def create_match_job():
+    """
+    Start a background job that matches scanned files against TMDB/MusicBrainz.
+
+    Takes "files" as returned by /api/scan, "watch_queue": true to match
+    the files queued by the watcher (taking them off the queue), or a
+    "directory" (with optional "mode" and "recursive") to scan on the
+    server. Poll the returned job id for progress and the proposed rename
+    plan.
+    """
+    data = request.json or {}
+    files = data.get('files')
+    queue = None
+
+    if data.get('watch_queue'):
+        queue = get_watch_queue()
+        if queue is None:
+            return jsonify({'error': 'Watch folders are not enabled'}), 400
+        files = queue.list()
+    elif files is None:
+        directory = data.get('directory', current_app.config.get('MEDIA_DIR', '/media'))
+        if not os.path.isdir(directory):
+            return jsonify({'error': f'Directory not found: {directory}'}), 400
+
+        mode = data.get('mode', 'auto')
+        recursive = bool(data.get('recursive', False))
+        files = list(iter_scanned_files(directory, mode, recursive, open_scan_index()))
+
+    api_key = current_app.config.get('TMDB_API_KEY')
+
+    try:
+        store = get_job_store()
+        store.prune(current_app.config['MATCH_JOB_RETENTION'])
+        job = matcher.MatchJob(
+            files,
+            store,
+            tmdb=get_tmdb_client(api_key) if api_key or get_offline_index() else None,
+            musicbrainz=get_musicbrainz_client(),
+            workers=current_app.config['MATCH_WORKERS'],
+            ranker=get_ranker()
+        )
+    except OSError as e:
+        return jsonify({'error': f'Failed to create job: {e}'}), 500
+
+    job.start()
+    if queue is not None:
+        queue.remove([f['filepath'] for f in files])
+
+    return jsonify({k: v for k, v in job.state.items() if k != 'plan'}), 202
+
+
+@bp.route('/api/watch/queue', methods=['GET'])
+def watch_queue():
+    """List new files found in the watch folders that are waiting to be matched."""
+    queue = get_watch_queue()
+    if queue is None:
+        return jsonify({'enabled': False, 'total': 0, 'files': []})
+
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
     return jsonify({
-        'directory': directory,
-        'mode': mode,
-        'files': files,
-        'count': len(files)
+        'enabled': True,
+        'total': queue.count(),
+        'files': queue.list(limit, offset) if limit != 0 else []
     })
 
 
+@bp.route('/api/watch/queue', methods=['DELETE'])
+def clear_watch_queue():
+    """Dismiss queued files by "paths", or the whole queue if none are given."""
+    queue = get_watch_queue()
+    if queue is None:
+        return jsonify({'error': 'Watch folders are not enabled'}), 400
+
+    paths = (request.get_json(silent=True) or {}).get('paths')
+    removed = queue.remove(paths) if paths else queue.clear()
+    return jsonify({'removed': removed})
+
+
+@bp.route('/api/match/jobs/<job_id>', methods=['GET'])
+def get_match_job(job_id):
+    """Get an auto-match job's progress, and its rename plan once completed."""
+    job = get_job_store().load(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job)
+
+
+@bp.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Get metadata cache hit/miss counters across all workers."""
+    cache = get_metadata_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+
+    return jsonify({'enabled': True, **cache.stats()})
+
+
+@bp.route('/api/ratelimit/stats', methods=['GET'])
+def ratelimit_stats():
+    """Get MusicBrainz rate limiter queue depth and wait times across all workers."""
+    return jsonify(get_musicbrainz_limiter().stats())
+
+
+def get_listing_cache():
+    """Return this process's directory listing cache."""
+    global _listing_cache
+
+    if _listing_cache is None:
+        _listing_cache = browser.ListingCache(ttl=current_app.config['BROWSE_CACHE_TTL'])
+    return _listing_cache
+
+
+def get_media_counter():
+    """Return this process's background media file counter."""
+    global _media_counter
+
+    with _clients_lock:
+        if _media_counter is None:
+            _media_counter = browser.MediaCounter()
+    return _media_counter
+
+
 @bp.route('/api/browse', methods=['GET'])
 def browse_directory():
-    """Browse directories."""
+    """
+    Browse directories.
+
+    Large directories are paged with "offset" and "limit". With "counts",
+    each item has a media_count that is null until it has been counted in
+    the background; while counts_pending is true, request the same page
+    again to pick them up (the listing itself comes from the cache).
+
+    Pages carry an ETag made from the directory's mtime, the paging
+    options and the counts, so a browser revalidating an unchanged page
+    gets a 304.
+    """
     path = request.args.get('path', '/')
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = max(1, min(request.args.get('limit', current_app.config['BROWSE_PAGE_SIZE'], type=int), 5000))
 
     if not os.path.isdir(path):
         return jsonify({'error': 'Path not found'}), 404
 
-    items = []
     try:
-        for name in sorted(os.listdir(path)):
-            full_path = os.path.join(path, name)
-            if os.path.isdir(full_path):
-                items.append({
-                    'name': name,
-                    'path': full_path,
-                    'type': 'directory'
-                })
+        mtime_ns, listing = blocking.call(get_listing_cache().stamped_listing, path)
     except PermissionError:
         return jsonify({'error': 'Permission denied'}), 403
+    except OSError:
+        return jsonify({'error': 'Path not found'}), 404
+
+    items = [
+        {'name': name, 'path': full_path, 'type': 'directory'}
+        for name, full_path in listing[offset:offset + limit]
+    ]
+
+    counts = None
+    counts_pending = False
+    if request.args.get('counts'):
+        counts = get_media_counter().counts([item['path'] for item in items])
+        for item in items:
+            item['media_count'] = counts[item['path']]
+        counts_pending = any(count is None for count in counts.values())
+
+    etag = hashlib.sha1(json.dumps([path, mtime_ns, offset, limit, counts], sort_keys=True).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
 
     parent = os.path.dirname(path) if path != '/' else None
+    next_offset = offset + limit if offset + limit < len(listing) else None
 
-    return jsonify({
+    response = jsonify({
         'current': path,
         'parent': parent,
-        'items': items
+        'items': items,
+        'total': len(listing),
+        'offset': offset,
+        'next_offset': next_offset,
+        'counts_pending': counts_pending
     })
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
 
 
 @bp.route('/api/search/movie', methods=['POST'])
 def search_movie():
     """Search for a movie on TMDB."""
     api_key = current_app.config.get('TMDB_API_KEY')
-    if not api_key:
+    if not api_key and get_offline_index() is None:
         return jsonify({'error': 'TMDB API key not configured'}), 400
 
     data = request.json
@@ -107,26 +902,27 @@ def search_movie():
         return jsonify({'error': 'Query is required'}), 400
 
     try:
-        client = renamer.TMDBClient(api_key)
+        client = get_tmdb_client(api_key)
         results = client.search_movie(query, year)
 
-        # Format results for frontend
+        # Best matches for the query first, formatted for the frontend
+        ranked = get_ranker().rank(query, year, results.get('results', []), 'title', 'release_date')
         movies = []
-        for movie in results.get('results', [])[:5]:
-            release_date = movie.get('release_date', '')
-            year = release_date.split('-')[0] if release_date else ''
+        for score, movie in ranked[:5]:
             movies.append({
                 'id': movie.get('id'),
                 'title': movie.get('title'),
-                'year': year,
-                'overview': movie.get('overview', '')[:150],
-                'vote_average': movie.get('vote_average', 0)
+                'year': ranking.year_of(movie.get('release_date')),
+                'overview': (movie.get('overview') or '')[:150],
+                'vote_average': movie.get('vote_average', 0),
+                'confidence': score
             })
 
         return jsonify({
             'query': query,
             'results': movies,
-            'total': results.get('total_results', 0)
+            'total': results.get('total_results', 0),
+            'source': results.get('source', 'api')
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -136,7 +932,7 @@ def search_movie():
 def search_tv():
     """Search for a TV show on TMDB."""
     api_key = current_app.config.get('TMDB_API_KEY')
-    if not api_key:
+    if not api_key and get_offline_index() is None:
         return jsonify({'error': 'TMDB API key not configured'}), 400
 
     data = request.json
@@ -146,26 +942,27 @@ def search_tv():
         return jsonify({'error': 'Query is required'}), 400
 
     try:
-        client = renamer.TMDBClient(api_key)
+        client = get_tmdb_client(api_key)
         results = client.search_tv(query)
 
-        # Format results for frontend
+        # Best matches for the query first, formatted for the frontend
+        ranked = get_ranker().rank(query, None, results.get('results', []), 'name', 'first_air_date')
         shows = []
-        for show in results.get('results', [])[:5]:
-            first_air_date = show.get('first_air_date', '')
-            year = first_air_date.split('-')[0] if first_air_date else ''
+        for score, show in ranked[:5]:
             shows.append({
                 'id': show.get('id'),
                 'name': show.get('name'),
-                'year': year,
-                'overview': show.get('overview', '')[:150],
-                'vote_average': show.get('vote_average', 0)
+                'year': ranking.year_of(show.get('first_air_date')),
+                'overview': (show.get('overview') or '')[:150],
+                'vote_average': show.get('vote_average', 0),
+                'confidence': score
             })
 
         return jsonify({
             'query': query,
             'results': shows,
-            'total': results.get('total_results', 0)
+            'total': results.get('total_results', 0),
+            'source': results.get('source', 'api')
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -187,7 +984,7 @@ def get_episode():
         return jsonify({'error': 'show_id, season, and episode are required'}), 400
 
     try:
-        client = renamer.TMDBClient(api_key)
+        client = get_tmdb_client(api_key)
         episode_title = client.get_episode_details(show_id, season, episode)
 
         return jsonify({
@@ -200,6 +997,40 @@ def get_episode():
         return jsonify({'error': str(e)}), 500
 
 
+@bp.route('/api/search/tv/episodes', methods=['POST'])
+def get_episodes():
+    """Get titles for many episodes of one show in a single request."""
+    api_key = current_app.config.get('TMDB_API_KEY')
+    if not api_key:
+        return jsonify({'error': 'TMDB API key not configured'}), 400
+
+    data = request.json
+    show_id = data.get('show_id')
+    episodes = data.get('episodes', [])
+
+    if not show_id or not episodes:
+        return jsonify({'error': 'show_id and episodes are required'}), 400
+
+    try:
+        pairs = [(int(ep['season']), int(ep['episode'])) for ep in episodes]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each episode needs a numeric season and episode'}), 400
+
+    try:
+        client = get_tmdb_client(api_key)
+        titles = client.get_episode_titles(show_id, pairs)
+
+        return jsonify({
+            'show_id': show_id,
+            'episodes': [
+                {'season': ep['season'], 'episode': ep['episode'], 'title': title}
+                for ep, title in zip(episodes, titles)
+            ]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/api/search/music', methods=['POST'])
 def search_music():
     """Search for music on MusicBrainz."""
@@ -210,8 +1041,10 @@ def search_music():
         return jsonify({'error': 'Query is required'}), 400
 
     try:
-        client = renamer.MusicBrainzClient()
-        results = client.search_recording(query)
+        client = get_musicbrainz_client()
+        results = client.search_recording(
+            query, deadline=current_app.config['MUSICBRAINZ_QUEUE_DEADLINE']
+        )
 
         # Format results for frontend
         recordings = []
@@ -237,6 +1070,10 @@ def search_music():
             'query': query,
             'results': recordings
         })
+    except RateLimitTimeout as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(int(e.wait) + 1)
+        return response, 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -330,6 +1167,8 @@ def rename_file():
         return jsonify({'error': 'Invalid file type'}), 400
 
     result = renamer.rename_file(filepath, new_filename, dry_run)
+    if result['success'] and not dry_run:
+        remember_matches(get_match_memory(), [(data, result['new_path'])])
 
     return jsonify({
         'original_filename': os.path.basename(filepath),
@@ -338,76 +1177,397 @@ def rename_file():
     })
 
 
-@bp.route('/api/batch/rename', methods=['POST'])
-def batch_rename():
-    """Rename multiple files at once."""
-    data = request.json
-    files = data.get('files', [])
-    dry_run = data.get('dry_run', False)
+def _batch_new_filename(file_data, extension):
+    """Build the new filename for one batch entry. Returns None for an invalid type."""
+    file_type = file_data.get('type')
 
-    results = []
-
-    for file_data in files:
-        file_type = file_data.get('type')
+    if file_type == 'movie':
+        return renamer.get_movie_filename(
+            file_data.get('title'),
+            file_data.get('year'),
+            extension
+        )
+    elif file_type == 'tv':
+        return renamer.get_tv_filename(
+            file_data.get('show_name'),
+            file_data.get('season'),
+            file_data.get('episode'),
+            file_data.get('episode_title', ''),
+            extension
+        )
+    elif file_type == 'music':
+        return renamer.get_music_filename(
+            file_data.get('artist'),
+            file_data.get('title'),
+            extension
+        )
+    return None
+
+
+def batch_files(data):
+    """
+    The files a batch rename request names: its "files", or with "job_id"
+    the entries a completed auto-match job accepted without review.
+    Returns (files, None), or (None, error response).
+    """
+    job_id = data.get('job_id')
+    if not job_id:
+        return data.get('files', []), None
+
+    job = get_job_store().load(job_id)
+    if job is None:
+        return None, (jsonify({'error': 'Job not found'}), 404)
+    if job['status'] != 'completed':
+        return None, (jsonify({'error': f"Job is {job['status']}"}), 409)
+    return [entry for entry in job['plan'] if entry.get('accepted')], None
+
+
+def plan_batch(files, library_dir=None):
+    """
+    Work out the new name of every file in a batch and plan the renames.
+    Returns (results, plan, positions): results holds an entry for files
+    rejected up front and None for the rest, and positions maps each
+    rename in the plan back to its index in files.
+
+    With library_dir, files are instead planned as moves to their place
+    in that library (see organize.library_directory).
+    """
+    results = [None] * len(files)
+    renames = []
+    positions = []
+
+    for n, file_data in enumerate(files):
         filepath = file_data.get('filepath')
 
-        if not filepath or not os.path.exists(filepath):
-            results.append({
+        if not filepath:
+            results[n] = {
                 'filepath': filepath,
                 'success': False,
                 'message': 'File not found'
-            })
+            }
             continue
 
         extension = renamer.get_extension(os.path.basename(filepath))
 
         try:
-            if file_type == 'movie':
-                new_filename = renamer.get_movie_filename(
-                    file_data.get('title'),
-                    file_data.get('year'),
-                    extension
-                )
-            elif file_type == 'tv':
-                new_filename = renamer.get_tv_filename(
-                    file_data.get('show_name'),
-                    file_data.get('season'),
-                    file_data.get('episode'),
-                    file_data.get('episode_title', ''),
-                    extension
-                )
-            elif file_type == 'music':
-                new_filename = renamer.get_music_filename(
-                    file_data.get('artist'),
-                    file_data.get('title'),
-                    extension
-                )
-            else:
-                results.append({
-                    'filepath': filepath,
-                    'success': False,
-                    'message': 'Invalid file type'
-                })
-                continue
-
-            result = renamer.rename_file(filepath, new_filename, dry_run)
-            results.append({
-                'original_filename': os.path.basename(filepath),
-                'new_filename': new_filename,
-                **result
-            })
+            new_filename = _batch_new_filename(file_data, extension)
+            if library_dir is None:
+                directory = os.path.dirname(filepath)
+            elif new_filename is not None:
+                directory = os.path.join(library_dir, organize.library_directory(file_data))
         except Exception as e:
-            results.append({
+            results[n] = {
                 'filepath': filepath,
                 'success': False,
                 'message': str(e)
-            })
+            }
+            continue
+
+        if new_filename is None:
+            results[n] = {
+                'filepath': filepath,
+                'success': False,
+                'message': 'Invalid file type'
+            }
+            continue
+
+        renames.append((filepath, os.path.join(directory, new_filename)))
+        positions.append(n)
+
+    if library_dir is not None:
+        return results, organize.OrganizePlan(renames), positions
+    return results, rename_plan.RenamePlan(renames), positions
+
+
+def get_journal_dir():
+    """Directory holding batch rename journals."""
+    return os.path.join(current_app.config.get('DATA_DIR', '/data'), 'journal')
+
+
+def open_journal(plan):
+    """Open the journal for a batch, or return None if DATA_DIR is unavailable."""
+    try:
+        return rename_plan.RenameJournal(get_journal_dir(), plan.batch_id)
+    except OSError as e:
+        current_app.logger.warning('Rename journal unavailable (%s), batch cannot be undone', e)
+        return None
+
+
+def batch_result(plan, index, result):
+    """Format the result of one planned rename."""
+    source, target = plan.renames[index]
+    return {
+        'original_filename': os.path.basename(source),
+        'new_filename': os.path.basename(target),
+        **result
+    }
+
+
+@bp.route('/api/batch/rename', methods=['POST'])
+def batch_rename():
+    """
+    Rename multiple files at once.
+
+    The whole batch is planned before anything is renamed: files given the
+    same new name are rejected, and chains or swaps of names are ordered so
+    nothing is overwritten. Applied batches are journaled and can be
+    reverted with /api/undo/<batch_id>. Instead of "files", "job_id" renames
+    every match an auto-match job accepted.
+    """
+    data = request.json
+    files, error = batch_files(data)
+    if error:
+        return error
+    dry_run = data.get('dry_run', False)
+
+    results, plan, positions = plan_batch(files)
+    journal = None if dry_run else open_journal(plan)
+
+    for index, result in blocking.iterate(rename_plan.execute_plan(plan, journal, dry_run)):
+        results[positions[index]] = batch_result(plan, index, result)
+
+    success_count = sum(1 for r in results if r.get('success'))
+    if not dry_run:
+        remember_matches(get_match_memory(), [
+            (file_data, result['new_path'])
+            for file_data, result in zip(files, results)
+            if result.get('success') and result.get('new_path')
+        ])
+
+    return jsonify({
+        'results': results,
+        'total': len(results),
+        'success_count': success_count,
+        'dry_run': dry_run,
+        'batch_id': plan.batch_id if journal is not None and plan.steps else None
+    })
+
+
+@bp.route('/api/batch/rename/stream', methods=['POST'])
+def batch_rename_stream():
+    """
+    Rename multiple files, streaming progress as Server-Sent Events.
+
+    Emits a "start" event with the batch id, "result" events carrying each
+    file's index in the request, its result and running counters, and a
+    final "done" event. The batch stops between renames if the client
+    disconnects or calls /api/batch/<batch_id>/cancel.
+    """
+    data = request.json
+    files, error = batch_files(data)
+    if error:
+        return error
+    dry_run = data.get('dry_run', False)
+
+    results, plan, positions = plan_batch(files)
+    journal = None if dry_run else open_journal(plan)
+    return stream_batch(files, results, plan, positions, journal, dry_run,
+                        lambda cancelled: rename_plan.execute_plan(plan, journal, dry_run, cancelled))
+
+
+def stream_batch(files, results, plan, positions, journal, dry_run, execute):
+    """
+    The Server-Sent Events response of a planned batch. execute(cancelled)
+    runs the plan, writing to journal, and yields (index, result) like
+    rename_plan.execute_plan.
+    """
+    cancel_path = rename_plan.cancel_path(get_journal_dir(), plan.batch_id)
+    memory = None if dry_run else get_match_memory()
+
+    def event(name, payload):
+        return f'event: {name}\ndata: {json.dumps(payload)}\n\n'
+
+    def generate():
+        counters = {'done': 0, 'success': 0, 'failed': 0}
+        last_check = [time.monotonic()]
+        stopped = []
+
+        def cancelled():
+            # A stat at most twice a second, not once per file
+            now = time.monotonic()
+            if stopped or now - last_check[0] < 0.5:
+                return bool(stopped)
+            last_check[0] = now
+            if os.path.exists(cancel_path):
+                stopped.append(True)
+            return bool(stopped)
+
+        accepted = []
+
+        def result_event(n, result):
+            counters['done'] += 1
+            counters['success' if result.get('success') else 'failed'] += 1
+            if result.get('success') and result.get('new_path'):
+                accepted.append((files[n], result['new_path']))
+            return event('result', {'index': n, **result, 'counters': dict(counters)})
+
+        yield event('start', {'batch_id': plan.batch_id, 'total': len(files), 'dry_run': dry_run})
+
+        buffer = [result_event(n, r) for n, r in enumerate(results) if r is not None]
+        last_flush = time.monotonic()
+
+        try:
+            for index, result in blocking.iterate(execute(cancelled)):
+                buffer.append(result_event(positions[index], batch_result(plan, index, result)))
+                # Flush every 50 results or quarter second
+                if len(buffer) >= 50 or time.monotonic() - last_flush >= 0.25:
+                    yield ''.join(buffer)
+                    buffer = []
+                    last_flush = time.monotonic()
+
+            buffer.append(event('done', {
+                'batch_id': plan.batch_id if journal is not None and plan.steps else None,
+                'total': len(files),
+                'success_count': counters['success'],
+                'dry_run': dry_run,
+                'cancelled': bool(stopped)
+            }))
+            yield ''.join(buffer)
+        finally:
+            # Closing the journal removed any cancel file
+            remember_matches(memory, accepted)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def plan_organize(data):
+    """
+    Plan an organize request. Returns ((files, results, plan, positions,
+    journal, execute), None), or (None, error response). execute(cancelled)
+    runs the moves, yielding (index, result).
+    """
+    library_dir = data.get('library_dir') or current_app.config.get('LIBRARY_DIR')
+    if not library_dir:
+        return None, (jsonify({'error': 'No library directory configured (LIBRARY_DIR)'}), 400)
+    if not os.path.isdir(library_dir):
+        return None, (jsonify({'error': f'Library directory not found: {library_dir}'}), 400)
+
+    files, error = batch_files(data)
+    if error:
+        return None, error
+    dry_run = data.get('dry_run', False)
+
+    results, plan, positions = plan_batch(files, library_dir)
+    journal = None if dry_run else open_journal(plan)
+    workers = current_app.config['ORGANIZE_WORKERS']
+    verify = current_app.config['ORGANIZE_VERIFY']
+
+    def execute(cancelled=None):
+        return organize.execute_moves(plan, journal, dry_run, cancelled, workers, verify)
+
+    return (files, results, plan, positions, journal, execute), None
+
+
+@bp.route('/api/organize', methods=['POST'])
+def organize_files():
+    """
+    Move matched files into the library at "library_dir" (LIBRARY_DIR by
+    default), renamed and filed under Movies/Title (Year), TV/Show/Season NN
+    or Music/Artist.
+
+    Takes "files" or "job_id" and "dry_run" like /api/batch/rename. Moves
+    within a filesystem are renames; across filesystems files are copied
+    with copy_file_range/sendfile, verified and only then removed, several
+    at once. An interrupted copy resumes from its .partial file on the next
+    attempt. Organize batches are journaled and undone like renames.
+    """
+    data = request.json or {}
+    planned, error = plan_organize(data)
+    if error:
+        return error
+    files, results, plan, positions, journal, execute = planned
+    dry_run = data.get('dry_run', False)
+
+    for index, result in blocking.iterate(execute()):
+        results[positions[index]] = batch_result(plan, index, result)
 
     success_count = sum(1 for r in results if r.get('success'))
+    if not dry_run:
+        remember_matches(get_match_memory(), [
+            (file_data, result['new_path'])
+            for file_data, result in zip(files, results)
+            if result.get('success') and result.get('new_path')
+        ])
 
     return jsonify({
         'results': results,
         'total': len(results),
         'success_count': success_count,
-        'dry_run': dry_run
+        'dry_run': dry_run,
+        'batch_id': plan.batch_id if journal is not None and plan.steps else None
+    })
+
+
+@bp.route('/api/organize/stream', methods=['POST'])
+def organize_files_stream():
+    """
+    /api/organize with progress streamed as Server-Sent Events, as
+    /api/batch/rename/stream does. Cancelling stops moves that have not
+    started; copies already under way finish.
+    """
+    data = request.json or {}
+    planned, error = plan_organize(data)
+    if error:
+        return error
+    files, results, plan, positions, journal, execute = planned
+    return stream_batch(files, results, plan, positions, journal, data.get('dry_run', False), execute)
+
+
+@bp.route('/api/batch/<batch_id>/cancel', methods=['POST'])
+def cancel_batch(batch_id):
+    """Ask a running streaming batch rename or organize to stop, from any worker."""
+    journal_dir = get_journal_dir()
+    if not rename_plan.RenameJournal.running(journal_dir, batch_id):
+        return jsonify({'error': 'Batch not found or no longer running'}), 404
+
+    cancel_path = rename_plan.cancel_path(journal_dir, batch_id)
+    try:
+        with open(cancel_path, 'w'):
+            pass
+        # The batch may have ended, and cleaned up after itself, meanwhile
+        if not rename_plan.RenameJournal.running(journal_dir, batch_id):
+            try:
+                os.remove(cancel_path)
+            except FileNotFoundError:
+                pass
+            return jsonify({'error': 'Batch not found or no longer running'}), 404
+    except OSError as e:
+        return jsonify({'error': f'Failed to cancel batch: {e}'}), 500
+
+    return jsonify({'batch_id': batch_id, 'cancelling': True}), 202
+
+
+@bp.route('/api/undo/<batch_id>', methods=['POST'])
+def undo_batch(batch_id):
+    """Revert a batch rename by replaying its journal in reverse."""
+    results = blocking.call(rename_plan.undo_batch, get_journal_dir(), batch_id)
+    if results is None:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    # An undone rename was not a match worth remembering
+    memory = get_match_memory()
+    if memory is not None:
+        def forget():
+            fingerprints = []
+            for result in results:
+                if result['success']:
+                    try:
+                        fingerprints.append(fingerprint.fingerprint(result['original_path']))
+                    except OSError:
+                        continue
+            try:
+                memory.forget(fingerprints)
+            except sqlite3.Error as e:
+                current_app.logger.warning('Failed to forget undone matches: %s', e)
+
+        blocking.call(forget)
+
+    return jsonify({
+        'batch_id': batch_id,
+        'results': results,
+        'total': len(results),
+        'success_count': sum(1 for r in results if r['success'])
     })
@@ -0,0 +1,149 @@
+"""
+Media Renamer - Columnar Scan Results
+Holds scanned files column by column and encodes them compactly for the UI
+"""
+
+from array import array
+
+# Keys every scanned file info dict has, in build_file_info's order
+BASE_KEYS = ('filename', 'filepath', 'extension', 'type', 'detected_info')
+
+
+class ScanColumns:
+    """
+    Scanned file info dicts stored as columns instead of one dict each.
+
+    The directory part of each path, extensions, types and the key sets
+    of detected_info are stored once and referenced by index from compact
+    arrays; detected_info values go in one flat list, with repeated
+    strings (show names, seasons) shared. Keys beyond BASE_KEYS, such as
+    "known_match" or "seq", are kept sparsely by row, as is the full path
+    of a file whose path does not end in its filename. Rows read back are
+    equal to the dicts that were added.
+
+    to_json() gives the columnar response format; decodeColumnar in
+    app.js turns it back into file objects.
+    """
+
+    __slots__ = ('prefixes', 'extensions', 'types', 'schemas', '_tables',
+                 'prefix_ids', 'names', 'extension_ids', 'type_ids', 'schema_ids',
+                 'value_offsets', 'values', '_strings', 'extras')
+
+    def __init__(self, files=()):
+        self.prefixes = []
+        self.extensions = []
+        self.types = []
+        self.schemas = []
+        # Lookup tables for the lists above, by value
+        self._tables = ({}, {}, {}, {})
+
+        self.prefix_ids = array('I')
+        self.names = []
+        self.extension_ids = array('H')
+        self.type_ids = array('B')
+        self.schema_ids = array('H')
+        self.value_offsets = array('I', [0])
+        self.values = []
+        self._strings = {}
+        self.extras = {}
+
+        for file_info in files:
+            self.append(file_info)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _id(self, kind, value):
+        table = self._tables[kind]
+        found = table.get(value)
+        if found is None:
+            found = table[value] = len(table)
+            (self.prefixes, self.extensions, self.types, self.schemas)[kind].append(value)
+        return found
+
+    def append(self, file_info):
+        filename = file_info['filename']
+        filepath = file_info['filepath']
+        row = len(self.names)
+        if filepath.endswith(filename):
+            prefix = filepath[:len(filepath) - len(filename)]
+        else:
+            # Not seen from scans; kept whole so the row reads back unchanged
+            prefix = ''
+            self.extras.setdefault('filepath', {})[row] = filepath
+
+        info = file_info.get('detected_info')
+        schema = tuple(info) if info is not None else None
+
+        self.prefix_ids.append(self._id(0, prefix))
+        self.names.append(filename)
+        self.extension_ids.append(self._id(1, file_info.get('extension')))
+        self.type_ids.append(self._id(2, file_info.get('type')))
+        self.schema_ids.append(self._id(3, schema))
+
+        if info:
+            strings = self._strings
+            for value in info.values():
+                if isinstance(value, str):
+                    value = strings.setdefault(value, value)
+                self.values.append(value)
+        self.value_offsets.append(len(self.values))
+
+        for key, value in file_info.items():
+            if key not in BASE_KEYS:
+                self.extras.setdefault(key, {})[row] = value
+
+    def row(self, i):
+        """Rebuild the file info dict of row i."""
+        prefix = self.prefixes[self.prefix_ids[i]]
+        name = self.names[i]
+        schema = self.schemas[self.schema_ids[i]]
+        file_info = {
+            'filename': name,
+            'filepath': prefix + name,
+            'extension': self.extensions[self.extension_ids[i]],
+            'type': self.types[self.type_ids[i]],
+            'detected_info': (None if schema is None else
+                              dict(zip(schema, self.values[self.value_offsets[i]:self.value_offsets[i + 1]])))
+        }
+        for key, rows in self.extras.items():
+            if i in rows:
+                file_info[key] = rows[i]
+        return file_info
+
+    def __iter__(self):
+        return (self.row(i) for i in range(len(self.names)))
+
+    def to_json(self):
+        """
+        The columnar response format. Row i's file has filepath
+        prefixes[prefix[i]] + filename[i], and detected_info made of the keys
+        schemas[schema[i]] with the next values from `values`. An extra
+        key present in every row is a plain list under "extra"; otherwise
+        it is [[row, value], ...] under "sparse".
+        """
+        dense, sparse = {}, {}
+        for key, rows in self.extras.items():
+            if len(rows) == len(self.names):
+                dense[key] = [rows[i] for i in range(len(self.names))]
+            else:
+                sparse[key] = sorted(rows.items())
+
+        return {
+            'format': 'columnar',
+            'count': len(self.names),
+            'prefixes': self.prefixes,
+            'extensions': self.extensions,
+            'types': self.types,
+            'schemas': [list(schema) if schema is not None else None for schema in self.schemas],
+            'columns': {
+                'prefix': self.prefix_ids.tolist(),
+                'filename': self.names,
+                'extension': self.extension_ids.tolist(),
+                'type': self.type_ids.tolist(),
+                'schema': self.schema_ids.tolist()
+            },
+            'values': self.values,
+            'extra': dense,
+            'sparse': sparse
+        }
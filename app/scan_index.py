@@ -0,0 +1,361 @@
+"""
+Media Renamer - Persistent Scan Index
+Remembers scanned files so re-scans only revisit what changed on disk
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections import namedtuple
+
+from . import fingerprint, renamer
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    PRIMARY KEY (path, mode)
+);
+
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    info TEXT NOT NULL,
+    fingerprint TEXT,
+    PRIMARY KEY (path, mode)
+);
+
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory, mode, filename);
+'''
+
+# Bump when build_file_info output or the schema changes; the index is rebuilt
+INDEX_VERSION = 3
+
+# The parts of a file's stat the index keeps, for files it answers without a stat
+StatKey = namedtuple('StatKey', ('st_ino', 'st_size', 'st_mtime_ns'))
+
+
+def read_directory(directory):
+    """
+    List a directory for the index, stat-ing only media files.
+    Returns (subdirs, [(name, path, stat)]) sorted by name, or None if it
+    cannot be listed.
+    """
+    try:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return None
+
+    subdirs = []
+    media = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+            if not entry.is_file():
+                continue
+
+            # Cheap extension check before paying for a stat
+            if not (renamer.is_video_file(entry.name) or renamer.is_audio_file(entry.name)):
+                continue
+
+            media.append((entry.name, entry.path, entry.stat()))
+        except OSError:
+            continue
+    return subdirs, media
+
+
+def _walk_serially(root, visit, recursive):
+    """The serial counterpart of ConcurrentWalker.walk."""
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        result, subdirs = visit(path)
+        yield path, result
+        if recursive:
+            stack.extend(reversed(subdirs))
+
+
+class ScanIndex:
+    """
+    SQLite-backed index of scanned media files.
+
+    Each directory is stored with the mtime it had when it was last listed.
+    On re-scan, directories whose mtime is unchanged are answered straight
+    from the index, and in changed directories only files whose inode, size
+    or mtime differ are parsed again.
+
+    A ScanIndex holds one SQLite connection and must only be used by one
+    request at a time; open one per request. It is not tied to the thread
+    that opened it, as under gevent a request's blocking calls run on
+    threadpool threads.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        (version,) = self.conn.execute('PRAGMA user_version').fetchone()
+        if version != INDEX_VERSION:
+            with self.conn:
+                self.conn.execute('DROP TABLE IF EXISTS files')
+                self.conn.execute('DROP TABLE IF EXISTS directories')
+                self.conn.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """Commit pending changes and close the database."""
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def iter_media_files(self, directory, mode='auto', recursive=False, walker=None, stats=None):
+        """
+        Incremental equivalent of renamer.iter_media_files.
+        Yields the same file info dicts in the same order. A stats dict
+        gets each file's stat by path as in renamer.list_media_files; for
+        files answered from the index it is the stored StatKey.
+        """
+        if walker is not None:
+            yield from self._walk_concurrently(directory, mode, recursive, walker, stats)
+            return
+
+        stack = [directory]
+
+        try:
+            while stack:
+                current = stack.pop()
+                try:
+                    mtime_ns = os.stat(current).st_mtime_ns
+                except OSError:
+                    continue
+
+                row = self.conn.execute(
+                    'SELECT mtime_ns, subdirs FROM directories WHERE path = ? AND mode = ?',
+                    (current, mode)
+                ).fetchone()
+
+                if row and row[0] == mtime_ns:
+                    files = self._indexed_files(current, mode, stats)
+                    subdirs = json.loads(row[1])
+                else:
+                    files, subdirs = self._relist(current, mode, mtime_ns, stats=stats)
+
+                yield from files
+
+                if recursive:
+                    stack.extend(reversed(subdirs))
+        finally:
+            self.conn.commit()
+
+    def _walk_concurrently(self, directory, mode, recursive, walker, stats=None):
+        """
+        iter_media_files on a ConcurrentWalker. The walker's threads stat
+        each directory and list only those whose mtime differs from the
+        index; the index itself is only touched from this thread.
+        """
+        known = self._known_directories(directory, mode)
+
+        def visit(path):
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                return None, []
+            previous = known.get(path)
+            if previous and previous[0] == mtime_ns:
+                return (mtime_ns, None), json.loads(previous[1])
+            listing = read_directory(path)
+            if listing is None:
+                # Unreadable: yield nothing for it, as the serial walk does
+                return None, []
+            return (mtime_ns, listing), listing[0]
+
+        try:
+            for path, visited in walker.walk(directory, visit, recursive):
+                if visited is None:
+                    continue
+                mtime_ns, listing = visited
+                if listing is None:
+                    yield from self._indexed_files(path, mode, stats)
+                else:
+                    yield from self._relist(path, mode, mtime_ns, listing, stats)[0]
+        finally:
+            self.conn.commit()
+
+    def signature(self, directory, mode='auto', recursive=False, walker=None):
+        """
+        Return a digest of the mtime of every directory a scan would visit,
+        or None if any of them is not indexed or has changed since it was.
+        While the signature is unchanged a scan would be answered entirely
+        from the index, so it can stand in for the scan's results; it costs
+        one stat per directory and lists nothing.
+        """
+        known = self._known_directories(directory, mode)
+
+        def visit(path):
+            previous = known.get(path)
+            try:
+                if previous is None or os.stat(path).st_mtime_ns != previous[0]:
+                    return None, []
+            except OSError:
+                return None, []
+            return previous[0], json.loads(previous[1])
+
+        if walker is None:
+            walk = _walk_serially(directory, visit, recursive)
+        else:
+            walk = walker.walk(directory, visit, recursive)
+
+        digest = hashlib.sha1(f'{INDEX_VERSION}\0{mode}\0{recursive}'.encode())
+        for path, mtime_ns in walk:
+            if mtime_ns is None:
+                return None
+            digest.update(f'\0{path}\0{mtime_ns}'.encode())
+        return digest.hexdigest()
+
+    def _known_directories(self, directory, mode):
+        """Return {path: (mtime_ns, subdirs JSON)} for indexed directories under directory."""
+        prefix = directory.rstrip(os.sep) + os.sep
+        return {
+            path: (mtime_ns, subdirs)
+            for path, mtime_ns, subdirs in self.conn.execute(
+                'SELECT path, mtime_ns, subdirs FROM directories '
+                'WHERE mode = ? AND (path = ? OR substr(path, 1, ?) = ?)',
+                (mode, directory, len(prefix), prefix)
+            )
+        }
+
+    def _indexed_files(self, directory, mode, stats=None):
+        """Load a directory's file info dicts from the index."""
+        if stats is None:
+            rows = self.conn.execute(
+                'SELECT info FROM files WHERE directory = ? AND mode = ? ORDER BY filename',
+                (directory, mode)
+            )
+            return [json.loads(info) for (info,) in rows]
+
+        files = []
+        for path, inode, size, mtime_ns, info in self.conn.execute(
+            'SELECT path, inode, size, mtime_ns, info FROM files '
+            'WHERE directory = ? AND mode = ? ORDER BY filename',
+            (directory, mode)
+        ):
+            stats[path] = StatKey(inode, size, mtime_ns)
+            files.append(json.loads(info))
+        return files
+
+    def _relist(self, directory, mode, mtime_ns, listing=None, stats=None):
+        """
+        List a changed directory, re-parsing only new or modified files,
+        and store the result. Returns (files, subdirs). listing is the
+        directory's read_directory result, if it was already read.
+        """
+        known = {
+            path: (inode, size, file_mtime_ns, info)
+            for path, inode, size, file_mtime_ns, info in self.conn.execute(
+                'SELECT path, inode, size, mtime_ns, info FROM files '
+                'WHERE directory = ? AND mode = ?',
+                (directory, mode)
+            )
+        }
+
+        if listing is None:
+            listing = read_directory(directory)
+        if listing is None:
+            return [], []
+        subdirs, media = listing
+
+        files = []
+        rows = []
+
+        for name, path, st in media:
+            stat_key = (st.st_ino, st.st_size, st.st_mtime_ns)
+            previous = known.pop(path, None)
+
+            if previous and previous[:3] == stat_key:
+                info = previous[3]
+                file_info = json.loads(info)
+            else:
+                file_info = renamer.build_file_info(name, path, mode)
+                if not file_info:
+                    continue
+                info = json.dumps(file_info)
+                rows.append((path, mode, directory, name, *stat_key, info))
+
+            if stats is not None:
+                stats[path] = st
+            files.append(file_info)
+
+        if known:
+            self.conn.executemany(
+                'DELETE FROM files WHERE path = ? AND mode = ?',
+                [(path, mode) for path in known]
+            )
+        if rows:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO files '
+                '(path, mode, directory, filename, inode, size, mtime_ns, info) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+        self._forget_removed_subdirs(directory, mode, subdirs)
+        self.conn.execute(
+            'INSERT OR REPLACE INTO directories (path, mode, mtime_ns, subdirs) '
+            'VALUES (?, ?, ?, ?)',
+            (directory, mode, mtime_ns, json.dumps(subdirs))
+        )
+
+        return files, subdirs
+
+    def fingerprint(self, path, st):
+        """
+        Return a file's content fingerprint, reusing the one stored for it
+        while its inode, size and mtime are unchanged.
+        """
+        stat_key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        row = self.conn.execute(
+            'SELECT inode, size, mtime_ns, fingerprint FROM files WHERE path = ? LIMIT 1', (path,)
+        ).fetchone()
+        if row and row[:3] == stat_key and row[3]:
+            return row[3]
+
+        fp = fingerprint.fingerprint(path, st.st_size)
+        if row and row[:3] == stat_key:
+            self.conn.execute('UPDATE files SET fingerprint = ? WHERE path = ?', (fp, path))
+        return fp
+
+    def _forget_removed_subdirs(self, directory, mode, subdirs):
+        """Drop index entries under subdirectories that no longer exist."""
+        row = self.conn.execute(
+            'SELECT subdirs FROM directories WHERE path = ? AND mode = ?',
+            (directory, mode)
+        ).fetchone()
+        if not row:
+            return
+
+        for removed in set(json.loads(row[0])) - set(subdirs):
+            prefix = removed.rstrip(os.sep) + os.sep
+            for table, column in (('directories', 'path'), ('files', 'directory')):
+                self.conn.execute(
+                    f'DELETE FROM {table} WHERE mode = ? AND ({column} = ? OR substr({column}, 1, ?) = ?)',
+                    (mode, removed, len(prefix), prefix)
+                )
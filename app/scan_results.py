@@ -0,0 +1,282 @@
+"""
+Media Renamer - Scan Result Snapshots
+Keeps scan results on the server so clients can page, sort and filter them
+"""
+
+import base64
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scans (
+    id TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    recursive INTEGER NOT NULL,
+    created REAL NOT NULL,
+    total INTEGER NOT NULL,
+    complete INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    scan_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    filepath TEXT NOT NULL,
+    filename TEXT NOT NULL COLLATE NOCASE,
+    extension TEXT NOT NULL,
+    type TEXT NOT NULL,
+    show TEXT NOT NULL COLLATE NOCASE,
+    status TEXT NOT NULL,
+    info TEXT NOT NULL,
+    PRIMARY KEY (scan_id, seq)
+);
+
+CREATE INDEX IF NOT EXISTS results_filename ON results (scan_id, filename, seq);
+CREATE INDEX IF NOT EXISTS results_filepath ON results (scan_id, filepath, seq);
+CREATE INDEX IF NOT EXISTS results_type ON results (scan_id, type, seq);
+CREATE INDEX IF NOT EXISTS results_show ON results (scan_id, show, seq);
+'''
+
+SCAN_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Sort name -> column; every order is tie-broken by scan order
+SORT_COLUMNS = {
+    'scan': 'seq',
+    'name': 'filename',
+    'path': 'filepath',
+    'type': 'type',
+    'show': 'show',
+    'extension': 'extension'
+}
+
+# Match status filter -> stored statuses it covers
+STATUS_FILTERS = {
+    'matched': ('known', 'tagged'),
+    'unmatched': ('unmatched',),
+    'known': ('known',),
+    'tagged': ('tagged',)
+}
+
+MAX_PAGE_SIZE = 5000
+
+
+def match_status(file_info):
+    """What the server already knows about a file's match."""
+    if file_info.get('known_match'):
+        return 'known'
+    if (file_info.get('detected_info') or {}).get('resolved'):
+        return 'tagged'
+    return 'unmatched'
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor, raising ValueError if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+class ScanResults:
+    """
+    SQLite store of scan snapshots.
+
+    A scan's results are written as they are produced and can then be read
+    back a page at a time with keyset (cursor) pagination, sorted by one of
+    SORT_COLUMNS and filtered by type, detected show, extension, match
+    status or a filename substring. Pages cost the same however deep into
+    the results they are. Snapshots are kept for `ttl` seconds.
+
+    Safe to share between threads: each thread gets its own connection.
+    """
+
+    # Rows per insert batch while a scan is being recorded
+    WRITE_BATCH = 1000
+
+    def __init__(self, db_path, ttl=3600):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connect(self):
+        """Return this thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, directory, mode, recursive):
+        """Start a new snapshot and return its id. Expired snapshots are dropped."""
+        self.prune()
+        scan_id = uuid.uuid4().hex
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO scans (id, directory, mode, recursive, created, total, complete) '
+                'VALUES (?, ?, ?, ?, ?, 0, 0)',
+                (scan_id, directory, mode, int(recursive), time.time())
+            )
+        return scan_id
+
+    def record(self, scan_id, files):
+        """
+        Store files in a snapshot as they pass through, yielding each one
+        with its "seq" (its position in the scan) added. The snapshot is
+        marked complete once the iterator is exhausted.
+        """
+        conn = self._connect()
+        rows = []
+        seq = 0
+
+        def flush():
+            with conn:
+                conn.executemany(
+                    'INSERT INTO results (scan_id, seq, filepath, filename, extension, type, show, status, info) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                conn.execute('UPDATE scans SET total = ? WHERE id = ?', (seq, scan_id))
+            rows.clear()
+
+        try:
+            for file_info in files:
+                file_info['seq'] = seq
+                info = file_info.get('detected_info') or {}
+                rows.append((
+                    scan_id, seq, file_info['filepath'], file_info['filename'],
+                    file_info.get('extension') or '', file_info.get('type') or '',
+                    info.get('show_name') or '', match_status(file_info), json.dumps(file_info)
+                ))
+                seq += 1
+                if len(rows) >= self.WRITE_BATCH:
+                    flush()
+                yield file_info
+        finally:
+            flush()
+
+        with conn:
+            conn.execute('UPDATE scans SET complete = 1 WHERE id = ?', (scan_id,))
+
+    def get(self, scan_id):
+        """Return a snapshot's summary, or None if there is no such snapshot."""
+        row = self._connect().execute(
+            'SELECT directory, mode, recursive, created, total, complete FROM scans WHERE id = ?',
+            (scan_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        directory, mode, recursive, created, total, complete = row
+        return {
+            'scan_id': scan_id, 'directory': directory, 'mode': mode,
+            'recursive': bool(recursive), 'created': created,
+            'total': total, 'complete': bool(complete)
+        }
+
+    def _filters(self, scan_id, filters):
+        clauses, params = ['scan_id = ?'], [scan_id]
+        if filters.get('type'):
+            clauses.append('type = ?')
+            params.append('' if filters['type'] == 'none' else filters['type'])
+        if filters.get('show'):
+            clauses.append('show = ?')
+            params.append(filters['show'])
+        if filters.get('extension'):
+            clauses.append('extension = ?')
+            params.append(filters['extension'].lower().lstrip('.'))
+        if filters.get('status'):
+            statuses = STATUS_FILTERS.get(filters['status'])
+            if statuses is None:
+                raise ValueError(f"Unknown status filter: {filters['status']}")
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if filters.get('q'):
+            clauses.append("filename LIKE ? ESCAPE '\\'")
+            escaped = filters['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{escaped}%')
+        return clauses, params
+
+    def page(self, scan_id, cursor=None, limit=500, sort='scan', order='asc', **filters):
+        """
+        Return one page of a snapshot as (files, next_cursor, matching).
+        next_cursor is None on the last page. matching, the number of
+        files passing the filters, is only counted for the first page.
+        Raises ValueError for a bad sort, filter or cursor.
+        """
+        column = SORT_COLUMNS.get(sort)
+        if column is None:
+            raise ValueError(f'Unknown sort: {sort}')
+        if order not in ('asc', 'desc'):
+            raise ValueError(f'Unknown order: {order}')
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        clauses, params = self._filters(scan_id, filters)
+        conn = self._connect()
+
+        matching = None
+        if cursor is None:
+            (matching,) = conn.execute(
+                f"SELECT COUNT(*) FROM results WHERE {' AND '.join(clauses)}", params
+            ).fetchone()
+        else:
+            last_value, last_seq = decode_cursor(cursor)
+            op = '>' if order == 'asc' else '<'
+            clauses.append(f'({column}, seq) {op} (?, ?)')
+            params.extend([last_value, last_seq])
+
+        direction = 'ASC' if order == 'asc' else 'DESC'
+        rows = conn.execute(
+            f"SELECT {column}, seq, info FROM results WHERE {' AND '.join(clauses)} "
+            f'ORDER BY {column} {direction}, seq {direction} LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][0], rows[-1][1]])
+
+        return [json.loads(info) for _, _, info in rows], next_cursor, matching
+
+    def facets(self, scan_id):
+        """Return the distinct types, shows and extensions in a snapshot, with counts."""
+        conn = self._connect()
+        result = {}
+        for name, column in (('types', 'type'), ('shows', 'show'), ('extensions', 'extension')):
+            result[name] = {
+                value: count for value, count in conn.execute(
+                    f'SELECT {column}, COUNT(*) FROM results WHERE scan_id = ? AND {column} != \'\' '
+                    f'GROUP BY {column} ORDER BY {column}',
+                    (scan_id,)
+                )
+            }
+        return result
+
+    def prune(self):
+        """Drop snapshots older than the TTL."""
+        cutoff = time.time() - self.ttl
+        conn = self._connect()
+        with conn:
+            expired = [scan_id for (scan_id,) in conn.execute('SELECT id FROM scans WHERE created < ?', (cutoff,))]
+            conn.executemany('DELETE FROM results WHERE scan_id = ?', ((s,) for s in expired))
+            conn.executemany('DELETE FROM scans WHERE id = ?', ((s,) for s in expired))
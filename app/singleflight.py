@@ -0,0 +1,119 @@
+"""
+Media Renamer - Request Coalescing
+Lets concurrent callers asking for the same thing share one upstream call
+"""
+
+import fcntl
+import hashlib
+import os
+import threading
+import time
+
+
+class _Call:
+    """An in-flight call that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    Within a process, the first caller for a key runs the function and any
+    caller arriving while it is in flight waits for and shares its result
+    or exception.
+
+    With a lock_dir, the caller running the function also takes a file lock
+    for the key, so only one worker process goes upstream at a time. A
+    process that had to wait for the lock calls `recheck` first, which
+    should look in a cache shared between processes (see MetadataCache),
+    and only runs the function if that finds nothing.
+    """
+
+    # Number of lock files keys are hashed into
+    LOCK_BUCKETS = 1024
+
+    def __init__(self, lock_dir=None, lock_timeout=30):
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, recheck=None):
+        """
+        Call fn() once for all concurrent callers with this key.
+        recheck() may return a result found after waiting for another
+        process, or None.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_exclusive(key, fn, recheck)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def _lock_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        bucket = int(digest[:8], 16) % self.LOCK_BUCKETS
+        return os.path.join(self.lock_dir, f'{bucket:04d}.lock')
+
+    def _run_exclusive(self, key, fn, recheck):
+        """Run fn under the cross-process lock for key, if there is one."""
+        if not self.lock_dir or recheck is None:
+            return fn()
+
+        fd = os.open(self._lock_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            waited = self._acquire(fd)
+            if waited:
+                result = recheck()
+                if result is not None:
+                    return result
+            return fn()
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+    def _acquire(self, fd):
+        """
+        Take the file lock, polling rather than blocking so it also
+        cooperates with green threads. Returns True if another process
+        held it. Gives up waiting after lock_timeout and proceeds unlocked.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.005
+        waited = False
+
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return waited
+            except BlockingIOError:
+                waited = True
+                if time.monotonic() >= deadline:
+                    return waited
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
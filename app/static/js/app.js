@@ -8,7 +8,16 @@ const state = {
     currentFile: null,
     selectedFiles: new Set(),
     browserPath: '/',
-    searchType: null
+    searchType: null,
+    lastBatchId: null,
+    batchRun: null,
+    scanId: null,
+    // The last scan's options, ETag and columnar blocks, reused when the server answers 304
+    lastScan: null,
+    // Bumped on every directory change so stale listings and count polls are dropped
+    browserRequest: 0,
+    // Indices into files currently shown, or null for all in scan order
+    view: null
 };
 
 // DOM Elements
@@ -18,14 +27,25 @@ const elements = {
     mediaDir: document.getElementById('media-dir'),
     browseDir: document.getElementById('browse-dir'),
     modeSelect: document.getElementById('mode-select'),
+    recursiveScan: document.getElementById('recursive-scan'),
     dryRun: document.getElementById('dry-run'),
+    organize: document.getElementById('organize'),
+    organizeGroup: document.getElementById('organize-group'),
+    libraryDir: document.getElementById('library-dir'),
     saveSettings: document.getElementById('save-settings'),
     scanFiles: document.getElementById('scan-files'),
+    loadWatchQueue: document.getElementById('load-watch-queue'),
     filesPanel: document.getElementById('files-panel'),
     filesList: document.getElementById('files-list'),
     fileCount: document.getElementById('file-count'),
     selectAll: document.getElementById('select-all'),
+    filterQuery: document.getElementById('filter-query'),
+    filterType: document.getElementById('filter-type'),
+    filterStatus: document.getElementById('filter-status'),
+    sortBy: document.getElementById('sort-by'),
     renameSelected: document.getElementById('rename-selected'),
+    autoMatch: document.getElementById('auto-match'),
+    undoBatch: document.getElementById('undo-batch'),
     browserModal: document.getElementById('browser-modal'),
     browserUp: document.getElementById('browser-up'),
     browserCurrentPath: document.getElementById('browser-current-path'),
@@ -50,11 +70,14 @@ function initEventListeners() {
     elements.toggleApiKey.addEventListener('click', toggleApiKeyVisibility);
     elements.saveSettings.addEventListener('click', saveSettings);
     elements.scanFiles.addEventListener('click', scanFiles);
+    elements.loadWatchQueue.addEventListener('click', loadWatchQueue);
 
     // Directory Browser
     elements.browseDir.addEventListener('click', openBrowser);
     elements.browserUp.addEventListener('click', browserGoUp);
     elements.browserSelect.addEventListener('click', selectBrowserPath);
+    elements.browserList.addEventListener('click', onBrowserClick);
+    elements.browserList.addEventListener('dblclick', onBrowserDoubleClick);
 
     // Modal close buttons
     document.querySelectorAll('.modal-close').forEach(btn => {
@@ -74,7 +97,25 @@ function initEventListeners() {
 
     // File selection
     elements.selectAll.addEventListener('click', toggleSelectAll);
+    elements.filesList.addEventListener('change', (e) => {
+        if (e.target.classList.contains('file-checkbox')) {
+            toggleFileSelection(Number(e.target.closest('.file-item').dataset.index));
+        }
+    });
+    elements.filesList.addEventListener('scroll', scheduleRender);
+
+    // Filtering and sorting
+    let filterTimer = null;
+    elements.filterQuery.addEventListener('input', () => {
+        clearTimeout(filterTimer);
+        filterTimer = setTimeout(applyFilters, 300);
+    });
+    [elements.filterType, elements.filterStatus, elements.sortBy].forEach(control => {
+        control.addEventListener('change', applyFilters);
+    });
     elements.renameSelected.addEventListener('click', renameSelected);
+    elements.autoMatch.addEventListener('click', autoMatch);
+    elements.undoBatch.addEventListener('click', undoLastBatch);
 
     // Search
     elements.searchBtn.addEventListener('click', performSearch);
@@ -108,11 +149,51 @@ async function loadConfig() {
         const response = await fetch('/api/config');
         const config = await response.json();
         elements.mediaDir.value = config.media_dir || '/media';
+        if (config.library_dir) {
+            elements.libraryDir.textContent = config.library_dir;
+            elements.organizeGroup.style.display = '';
+        }
+        if (config.watch_enabled) {
+            refreshWatchCount();
+            setInterval(refreshWatchCount, 30000);
+        }
     } catch (error) {
         console.error('Failed to load config:', error);
     }
 }
 
+// Watch folders
+async function refreshWatchCount() {
+    try {
+        const response = await fetch('/api/watch/queue?limit=0');
+        const data = await response.json();
+        elements.loadWatchQueue.textContent = `New Files (${data.total})`;
+        elements.loadWatchQueue.style.display = data.total > 0 ? '' : 'none';
+    } catch (error) {
+        console.error('Failed to check watch queue:', error);
+    }
+}
+
+async function loadWatchQueue() {
+    try {
+        const response = await fetch('/api/watch/queue');
+        const data = await response.json();
+
+        state.files = data.files;
+        state.files.forEach(file => {
+            applyEmbeddedTags(file);
+            applyKnownMatch(file);
+        });
+        state.selectedFiles.clear();
+        state.scanId = null;
+        elements.filesPanel.style.display = 'block';
+        await applyFilters();
+        showToast(`Loaded ${state.files.length} new files`, 'success');
+    } catch (error) {
+        showToast('Failed to load new files', 'error');
+    }
+}
+
 // Save settings
 async function saveSettings() {
     const settings = {
@@ -142,67 +223,293 @@ async function saveSettings() {
 async function scanFiles() {
     const directory = elements.mediaDir.value;
     const mode = elements.modeSelect.value;
+    const recursive = elements.recursiveScan.checked;
 
     elements.filesList.innerHTML = '<div class="loading"><div class="spinner"></div>Scanning...</div>';
     elements.filesPanel.style.display = 'block';
 
-    try {
-        const response = await fetch('/api/scan', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ directory, mode })
+    state.files = [];
+    state.selectedFiles.clear();
+    state.scanId = null;
+    state.view = null;
+    elements.fileCount.textContent = 0;
+
+    const addBlock = (block) => {
+        decodeColumnar(block).forEach(file => {
+            applyEmbeddedTags(file);
+            applyKnownMatch(file);
+            state.files.push(file);
         });
+        scheduleRender();
+    };
 
-        const data = await response.json();
+    try {
+        // The server keeps a snapshot of the results for filtering and sorting
+        const options = JSON.stringify({ directory, mode, recursive, stream: true, snapshot: true, format: 'columnar' });
+        const headers = { 'Content-Type': 'application/json' };
+        const previous = state.lastScan?.options === options ? state.lastScan : null;
+        if (previous) headers['If-None-Match'] = previous.etag;
+
+        const response = await fetch('/api/scan', { method: 'POST', headers, body: options });
+
+        // Nothing changed since the last scan: rebuild its files instead of re-reading them
+        if (response.status === 304) {
+            previous.blocks.forEach(addBlock);
+            state.scanId = response.headers.get('X-Scan-Id');
+            await applyFilters();
+            showToast(`Found ${state.files.length} files (unchanged)`, 'success');
+            return;
+        }
 
-        if (response.ok) {
-            state.files = data.files;
-            state.selectedFiles.clear();
-            renderFiles();
-            elements.fileCount.textContent = data.count;
-            showToast(`Found ${data.count} files`, 'success');
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             elements.filesList.innerHTML = `<div class="empty-state"><h3>Error</h3><p>${data.error}</p></div>`;
             showToast(data.error, 'error');
+            return;
         }
+
+        // Results arrive as newline-delimited JSON, one columnar block of files per line
+        const blocks = [];
+        await readNdjson(response, (block) => {
+            blocks.push(block);
+            addBlock(block);
+        });
+
+        const etag = response.headers.get('ETag');
+        state.lastScan = etag ? { options, etag, blocks } : null;
+        state.scanId = response.headers.get('X-Scan-Id');
+        await applyFilters();
+        showToast(`Found ${state.files.length} files`, 'success');
     } catch (error) {
         elements.filesList.innerHTML = '<div class="empty-state"><h3>Error</h3><p>Failed to scan directory</p></div>';
         showToast('Failed to scan directory', 'error');
     }
 }
 
-// Render files list
+// Expand a block of files in the server's columnar scan format (see scan_columns.py)
+function decodeColumnar(block) {
+    const { columns, schemas, values } = block;
+    const files = new Array(block.count);
+    let offset = 0;
+
+    for (let i = 0; i < block.count; i++) {
+        const filename = columns.filename[i];
+        const schema = schemas[columns.schema[i]];
+        let detectedInfo = null;
+        if (schema) {
+            detectedInfo = {};
+            schema.forEach(key => { detectedInfo[key] = values[offset++]; });
+        }
+        files[i] = {
+            filename,
+            filepath: block.prefixes[columns.prefix[i]] + filename,
+            extension: block.extensions[columns.extension[i]],
+            type: block.types[columns.type[i]],
+            detected_info: detectedInfo
+        };
+    }
+
+    Object.entries(block.extra || {}).forEach(([key, column]) => {
+        column.forEach((value, i) => { files[i][key] = value; });
+    });
+    Object.entries(block.sparse || {}).forEach(([key, pairs]) => {
+        pairs.forEach(([i, value]) => { files[i][key] = value; });
+    });
+    return files;
+}
+
+async function readNdjson(response, onItem) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onItem(JSON.parse(line)));
+    }
+
+    buffer += decoder.decode();
+    if (buffer.trim()) onItem(JSON.parse(buffer));
+}
+
+// Music files whose own tags name the artist and title need no search
+function applyEmbeddedTags(file) {
+    const info = file.detected_info;
+    if (file.type !== 'music' || !info || !info.resolved) return;
+
+    file.renameData = { type: 'music', filepath: file.filepath, artist: info.artist, title: info.title };
+    file.newName = `${info.artist} - ${info.title}.${file.extension}`;
+}
+
+// Files whose content was matched before reuse that match
+function applyKnownMatch(file) {
+    const known = file.known_match;
+    if (!known || !MATCH_FIELDS[known.type]) return;
+
+    file.renameData = { type: known.type, filepath: file.filepath };
+    MATCH_FIELDS[known.type].forEach(field => { file.renameData[field] = known[field]; });
+    file.newName = known.filename.includes('.')
+        ? `${known.filename.slice(0, known.filename.lastIndexOf('.'))}.${file.extension}`
+        : `${known.filename}.${file.extension}`;
+    file.confidence = 1;
+}
+
+// Coalesce re-renders while results stream in or the list scrolls
+let renderPending = false;
+
+function scheduleRender() {
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(() => {
+        renderPending = false;
+        renderFiles();
+    });
+}
+
+function viewLength() {
+    return state.view ? state.view.length : state.files.length;
+}
+
+function viewIndices() {
+    return state.view || state.files.map((_, index) => index);
+}
+
+function rowHeight() {
+    return parseFloat(getComputedStyle(elements.filesList).getPropertyValue('--row-height')) || 112;
+}
+
+// Render files list. Only the rows in view (plus a few either side) are
+// put in the DOM, so the cost does not grow with the number of files.
 function renderFiles() {
+    elements.fileCount.textContent = state.view
+        ? `${state.view.length} of ${state.files.length}`
+        : state.files.length;
+
     if (state.files.length === 0) {
         elements.filesList.innerHTML = '<div class="empty-state"><h3>No files found</h3><p>Try changing the mode or directory</p></div>';
         return;
     }
+    if (viewLength() === 0) {
+        elements.filesList.innerHTML = '<div class="empty-state"><h3>No matching files</h3><p>Try changing the filters</p></div>';
+        return;
+    }
 
-    elements.filesList.innerHTML = state.files.map((file, index) => {
-        const isSelected = state.selectedFiles.has(index);
-        const detectedInfo = getDetectedInfo(file);
+    const height = rowHeight();
+    const list = elements.filesList;
+    const overscan = 8;
+    const first = Math.max(0, Math.floor(list.scrollTop / height) - overscan);
+    const last = Math.min(viewLength(), Math.ceil((list.scrollTop + list.clientHeight) / height) + overscan);
 
-        return `
-            <div class="file-item ${isSelected ? 'selected' : ''} ${file.renamed ? 'renamed' : ''}" data-index="${index}">
-                <input type="checkbox" class="file-checkbox" ${isSelected ? 'checked' : ''}>
-                <div class="file-info">
-                    <div class="file-name">${escapeHtml(file.filename)}</div>
-                    <span class="file-type ${file.type}">${file.type}</span>
-                    <div class="file-detected">${detectedInfo}</div>
-                    ${file.newName ? `<div class="file-new-name">${escapeHtml(file.newName)}</div>` : ''}
-                </div>
-                <div class="file-actions">
-                    <button class="btn btn-sm btn-primary" onclick="openSearch(${index})">Search</button>
-                    ${file.newName ? `<button class="btn btn-sm btn-success" onclick="renameFile(${index})">Rename</button>` : ''}
-                </div>
+    let rows = '';
+    for (let position = first; position < last; position++) {
+        const index = state.view ? state.view[position] : position;
+        rows += renderFileRow(state.files[index], index, position * height);
+    }
+
+    list.innerHTML = `<div class="files-spacer" style="height: ${viewLength() * height}px">${rows}</div>`;
+}
+
+function renderFileRow(file, index, top) {
+    const isSelected = state.selectedFiles.has(index);
+    const detectedInfo = getDetectedInfo(file);
+
+    return `
+        <div class="file-item ${isSelected ? 'selected' : ''} ${file.renamed ? 'renamed' : ''}" data-index="${index}" style="top: ${top}px">
+            <input type="checkbox" class="file-checkbox" ${isSelected ? 'checked' : ''}>
+            <div class="file-info">
+                <div class="file-name" title="${escapeHtml(file.filename)}">${escapeHtml(file.filename)}</div>
+                <span class="file-type ${file.type}">${file.type}</span>
+                ${file.confidence !== undefined ? `<span class="file-confidence ${file.confidence < 0.8 ? 'low' : ''}">${Math.round(file.confidence * 100)}% match</span>` : ''}
+                <div class="file-detected">${detectedInfo}</div>
+                ${file.newName ? `<div class="file-new-name">${escapeHtml(file.newName)}</div>` : ''}
             </div>
-        `;
-    }).join('');
+            <div class="file-actions">
+                <button class="btn btn-sm btn-primary" onclick="openSearch(${index})">Search</button>
+                ${file.newName ? `<button class="btn btn-sm btn-success" onclick="renameFile(${index})">Rename</button>` : ''}
+            </div>
+        </div>
+    `;
+}
+
+// Filtering and sorting. Name, type and sort order are answered by the
+// server from the scan snapshot; match status is filtered here, since
+// matches picked in this page only exist here.
+let filterGeneration = 0;
+
+async function applyFilters() {
+    const generation = ++filterGeneration;
+    const q = elements.filterQuery.value.trim();
+    const type = elements.filterType.value;
+    const status = elements.filterStatus.value;
+    const sort = elements.sortBy.value;
+
+    let view = null;
+    if (q || type || sort !== 'scan') {
+        view = state.scanId
+            ? await fetchSnapshotView({ q, type, sort })
+            : localView({ q, type, sort });
+        if (generation !== filterGeneration) return;
+        if (view === null) {
+            showToast('Failed to filter files', 'error');
+        }
+    }
+
+    if (status) {
+        const wanted = status === 'matched';
+        view = (view || viewIndices()).filter(index => Boolean(state.files[index].renameData) === wanted);
+    }
+
+    state.view = view;
+    elements.filesList.scrollTop = 0;
+    renderFiles();
+}
 
-    // Add checkbox event listeners
-    elements.filesList.querySelectorAll('.file-checkbox').forEach((checkbox, index) => {
-        checkbox.addEventListener('change', () => toggleFileSelection(index));
+async function fetchSnapshotView(filters) {
+    const view = [];
+    let cursor = null;
+
+    try {
+        do {
+            const params = new URLSearchParams({ limit: 5000, fields: 'seq', sort: filters.sort });
+            if (filters.q) params.set('q', filters.q);
+            if (filters.type) params.set('type', filters.type);
+            if (cursor) params.set('cursor', cursor);
+
+            const response = await fetch(`/api/scan/${state.scanId}?${params}`);
+            if (!response.ok) return null;
+            const page = await response.json();
+            page.files.forEach(file => view.push(file.seq));
+            cursor = page.next_cursor;
+        } while (cursor);
+    } catch (error) {
+        return null;
+    }
+
+    return view;
+}
+
+// Fallback for lists with no server snapshot, such as the watch queue
+function localView(filters) {
+    const q = filters.q.toLowerCase();
+    const keys = { name: 'filename', type: 'type' };
+    const sortKey = (file) => filters.sort === 'show'
+        ? (file.detected_info?.show_name || '')
+        : String(file[keys[filters.sort]] || '');
+
+    const view = state.files.map((_, index) => index).filter(index => {
+        const file = state.files[index];
+        return (!q || file.filename.toLowerCase().includes(q)) && (!filters.type || file.type === filters.type);
     });
+
+    if (filters.sort !== 'scan') {
+        view.sort((a, b) => sortKey(state.files[a]).localeCompare(sortKey(state.files[b])) || a - b);
+    }
+    return view;
 }
 
 function getDetectedInfo(file) {
@@ -214,6 +521,9 @@ function getDetectedInfo(file) {
     } else if (file.type === 'tv') {
         return `Detected: ${file.detected_info.show_name} S${file.detected_info.season}E${file.detected_info.episode}`;
     } else if (file.type === 'music') {
+        if (file.detected_info.resolved) {
+            return `Tags: ${escapeHtml(`${file.detected_info.artist} - ${file.detected_info.title}`)}`;
+        }
         return `Search: ${file.detected_info.query}`;
     }
     return '';
@@ -235,11 +545,13 @@ function toggleFileSelection(index) {
     renderFiles();
 }
 
+// Select All applies to the files passing the current filters
 function toggleSelectAll() {
-    if (state.selectedFiles.size === state.files.length) {
-        state.selectedFiles.clear();
+    const indices = viewIndices();
+    if (indices.every(index => state.selectedFiles.has(index))) {
+        indices.forEach(index => state.selectedFiles.delete(index));
     } else {
-        state.files.forEach((_, index) => state.selectedFiles.add(index));
+        indices.forEach(index => state.selectedFiles.add(index));
     }
     renderFiles();
 }
@@ -251,33 +563,55 @@ function openBrowser() {
     elements.browserModal.classList.add('active');
 }
 
-async function loadBrowserDirectory(path) {
+function browserItemHtml(item) {
+    return `
+        <li data-path="${escapeHtml(item.path)}">
+            <span class="folder-icon"></span>
+            <span class="folder-name">${escapeHtml(item.name)}</span>
+            <span class="media-count">${mediaCountLabel(item.media_count)}</span>
+        </li>
+    `;
+}
+
+function mediaCountLabel(mediaCount) {
+    if (mediaCount === undefined) return '';
+    if (mediaCount === null) return '&hellip;';
+    return `${mediaCount.count}${mediaCount.truncated ? '+' : ''}`;
+}
+
+async function fetchBrowserPage(path, offset) {
+    const params = new URLSearchParams({ path, offset, counts: 1 });
+    const response = await fetch(`/api/browse?${params}`);
+    return { response, data: await response.json() };
+}
+
+async function loadBrowserDirectory(path, offset = 0) {
+    const request = offset === 0 ? ++state.browserRequest : state.browserRequest;
+
     try {
-        const response = await fetch(`/api/browse?path=${encodeURIComponent(path)}`);
-        const data = await response.json();
+        const { response, data } = await fetchBrowserPage(path, offset);
+        if (request !== state.browserRequest) return;
 
         if (response.ok) {
             state.browserPath = data.current;
             elements.browserCurrentPath.textContent = data.current;
             elements.browserUp.disabled = !data.parent;
 
-            elements.browserList.innerHTML = data.items.map(item => `
-                <li data-path="${escapeHtml(item.path)}">
-                    <span class="folder-icon"></span>
-                    ${escapeHtml(item.name)}
-                </li>
-            `).join('');
-
-            // Add click listeners
-            elements.browserList.querySelectorAll('li').forEach(li => {
-                li.addEventListener('click', () => {
-                    elements.browserList.querySelectorAll('li').forEach(el => el.classList.remove('selected'));
-                    li.classList.add('selected');
-                });
-                li.addEventListener('dblclick', () => {
-                    loadBrowserDirectory(li.dataset.path);
-                });
-            });
+            const html = data.items.map(browserItemHtml).join('');
+            const more = data.next_offset !== null
+                ? `<li class="load-more" data-offset="${data.next_offset}">Show more (${data.total - data.next_offset} left)</li>`
+                : '';
+
+            if (offset === 0) {
+                elements.browserList.innerHTML = html + more;
+            } else {
+                elements.browserList.querySelector('li.load-more')?.remove();
+                elements.browserList.insertAdjacentHTML('beforeend', html + more);
+            }
+
+            if (data.counts_pending) {
+                setTimeout(() => pollBrowserCounts(data.current, offset, request), 1000);
+            }
         } else {
             showToast(data.error, 'error');
         }
@@ -286,6 +620,47 @@ async function loadBrowserDirectory(path) {
     }
 }
 
+// Media counts are worked out in the background; ask again until a page has them all
+async function pollBrowserCounts(path, offset, request) {
+    if (request !== state.browserRequest || !elements.browserModal.classList.contains('active')) return;
+
+    try {
+        const { response, data } = await fetchBrowserPage(path, offset);
+        if (request !== state.browserRequest || !response.ok) return;
+
+        const rows = new Map();
+        elements.browserList.querySelectorAll('li[data-path]').forEach(li => rows.set(li.dataset.path, li));
+        data.items.forEach(item => {
+            const badge = rows.get(item.path)?.querySelector('.media-count');
+            if (badge) badge.innerHTML = mediaCountLabel(item.media_count);
+        });
+
+        if (data.counts_pending) {
+            setTimeout(() => pollBrowserCounts(path, offset, request), 2000);
+        }
+    } catch (error) {
+        // Counts are a nicety; leave the placeholders
+    }
+}
+
+function onBrowserClick(event) {
+    const li = event.target.closest('li');
+    if (!li) return;
+
+    if (li.classList.contains('load-more')) {
+        li.textContent = 'Loading...';
+        loadBrowserDirectory(state.browserPath, parseInt(li.dataset.offset, 10));
+        return;
+    }
+    elements.browserList.querySelector('li.selected')?.classList.remove('selected');
+    li.classList.add('selected');
+}
+
+function onBrowserDoubleClick(event) {
+    const li = event.target.closest('li[data-path]');
+    if (li) loadBrowserDirectory(li.dataset.path);
+}
+
 function browserGoUp() {
     const parent = state.browserPath.split('/').slice(0, -1).join('/') || '/';
     loadBrowserDirectory(parent);
@@ -378,13 +753,10 @@ function renderSearchResults(results, type) {
     elements.searchResults.innerHTML = results.map((result, index) => {
         let title, meta, overview;
 
-        if (type === 'movie') {
-            title = result.title;
-            meta = `${result.year || 'Unknown year'} | Rating: ${result.vote_average}/10`;
-            overview = result.overview;
-        } else if (type === 'tv') {
-            title = result.name;
+        if (type === 'movie' || type === 'tv') {
+            title = type === 'movie' ? result.title : result.name;
             meta = `${result.year || 'Unknown year'} | Rating: ${result.vote_average}/10`;
+            if (result.confidence !== undefined) meta += ` | ${Math.round(result.confidence * 100)}% match`;
             overview = result.overview;
         } else {
             title = result.title;
@@ -422,37 +794,29 @@ async function selectSearchResult(index, result) {
         renameData.year = result.year;
         newName = `${result.title} (${result.year}).${file.extension}`;
     } else if (file.type === 'tv') {
-        // Get episode title
-        try {
-            const epResponse = await fetch('/api/search/tv/episode', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    show_id: result.id,
-                    season: file.detected_info.season,
-                    episode: file.detected_info.episode
-                })
-            });
-            const epData = await epResponse.json();
-
-            renameData.show_name = result.name;
-            renameData.season = file.detected_info.season;
-            renameData.episode = file.detected_info.episode;
-            renameData.episode_title = epData.title || '';
-
-            const season = String(parseInt(file.detected_info.season)).padStart(2, '0');
-            const episode = String(parseInt(file.detected_info.episode)).padStart(2, '0');
-            newName = epData.title
-                ? `${result.name} - S${season}E${episode} - ${epData.title}.${file.extension}`
-                : `${result.name} - S${season}E${episode}.${file.extension}`;
-        } catch (error) {
-            renameData.show_name = result.name;
-            renameData.season = file.detected_info.season;
-            renameData.episode = file.detected_info.episode;
-            const season = String(parseInt(file.detected_info.season)).padStart(2, '0');
-            const episode = String(parseInt(file.detected_info.episode)).padStart(2, '0');
-            newName = `${result.name} - S${season}E${episode}.${file.extension}`;
-        }
+        // Resolve this file and every other unmatched episode of the same
+        // detected show with one bulk episode lookup
+        const showName = file.detected_info.show_name;
+        const targets = state.files
+            .map((_, i) => i)
+            .filter(i => i === state.currentFile || (
+                state.files[i].type === 'tv' &&
+                !state.files[i].renameData &&
+                state.files[i].detected_info?.show_name === showName
+            ));
+        const titles = await fetchEpisodeTitles(result.id, targets.map(i => state.files[i]));
+
+        targets.forEach((i, n) => {
+            applyTvMatch(state.files[i], result.name, titles[n]);
+            state.selectedFiles.add(i);
+        });
+
+        elements.searchModal.classList.remove('active');
+        renderFiles();
+        showToast(targets.length > 1
+            ? `Selection applied to ${targets.length} episodes. Click "Rename" to apply changes.`
+            : 'Selection applied. Click "Rename" to apply changes.', 'info');
+        return;
     } else {
         renameData.artist = result.artist;
         renameData.title = result.title;
@@ -470,6 +834,126 @@ async function selectSearchResult(index, result) {
     showToast('Selection applied. Click "Rename" to apply changes.', 'info');
 }
 
+async function fetchEpisodeTitles(showId, files) {
+    try {
+        const response = await fetch('/api/search/tv/episodes', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                show_id: showId,
+                episodes: files.map(file => ({
+                    season: file.detected_info.season,
+                    episode: file.detected_info.episode
+                }))
+            })
+        });
+        const data = await response.json();
+        if (response.ok) {
+            return data.episodes.map(ep => ep.title || '');
+        }
+    } catch (error) {
+        console.error('Failed to fetch episode titles:', error);
+    }
+    return files.map(() => '');
+}
+
+function applyTvMatch(file, showName, episodeTitle) {
+    const season = String(parseInt(file.detected_info.season)).padStart(2, '0');
+    const episode = String(parseInt(file.detected_info.episode)).padStart(2, '0');
+
+    file.renameData = {
+        type: file.type,
+        filepath: file.filepath,
+        show_name: showName,
+        season: file.detected_info.season,
+        episode: file.detected_info.episode,
+        episode_title: episodeTitle
+    };
+    file.newName = episodeTitle
+        ? `${showName} - S${season}E${episode} - ${episodeTitle}.${file.extension}`
+        : `${showName} - S${season}E${episode}.${file.extension}`;
+}
+
+// Auto-match: resolve every scanned file on the server in one background job
+const MATCH_FIELDS = {
+    movie: ['title', 'year'],
+    tv: ['show_name', 'season', 'episode', 'episode_title'],
+    music: ['artist', 'title']
+};
+
+async function autoMatch() {
+    if (state.files.length === 0) {
+        showToast('Scan a directory first', 'warning');
+        return;
+    }
+
+    const files = state.files.map(({ filename, filepath, extension, type, detected_info }) =>
+        ({ filename, filepath, extension, type, detected_info }));
+
+    elements.autoMatch.disabled = true;
+    try {
+        const response = await fetch('/api/match/jobs', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ files })
+        });
+        let job = await response.json();
+
+        if (!response.ok) {
+            showToast(job.error || 'Auto-match failed', 'error');
+            return;
+        }
+
+        while (job.status === 'queued' || job.status === 'running') {
+            elements.autoMatch.textContent = `Matching ${job.done}/${job.total}`;
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const poll = await fetch(`/api/match/jobs/${job.id}`);
+            job = await poll.json();
+        }
+
+        if (job.status === 'completed') {
+            const { applied, accepted } = applyMatchPlan(job.plan);
+            renderFiles();
+            showToast(`Matched ${applied}/${job.total} files, ${accepted} confidently (selected). Review and click "Rename Selected".`, 'success');
+        } else {
+            showToast(job.error || 'Auto-match failed', 'error');
+        }
+    } catch (error) {
+        showToast('Auto-match failed', 'error');
+    } finally {
+        elements.autoMatch.disabled = false;
+        elements.autoMatch.textContent = 'Auto-Match';
+    }
+}
+
+function applyMatchPlan(plan) {
+    const indexByPath = new Map(state.files.map((file, index) => [file.filepath, index]));
+    let applied = 0;
+    let accepted = 0;
+
+    plan.forEach(entry => {
+        const index = indexByPath.get(entry.filepath);
+        if (entry.status !== 'matched' || index === undefined) return;
+
+        // Never overwrite a match the user picked by hand
+        const file = state.files[index];
+        if (file.renameData) return;
+
+        file.renameData = { type: entry.type, filepath: entry.filepath };
+        MATCH_FIELDS[entry.type].forEach(field => { file.renameData[field] = entry[field]; });
+        file.newName = entry.new_filename;
+        file.confidence = entry.confidence;
+        // Only confident matches are selected; the rest are left for review
+        if (entry.accepted) {
+            state.selectedFiles.add(index);
+            accepted++;
+        }
+        applied++;
+    });
+
+    return { applied, accepted };
+}
+
 // Rename files
 async function renameFile(index) {
     const file = state.files[index];
@@ -505,6 +989,12 @@ async function renameFile(index) {
 }
 
 async function renameSelected() {
+    // While a batch is running the button cancels it
+    if (state.batchRun) {
+        cancelBatch();
+        return;
+    }
+
     if (state.selectedFiles.size === 0) {
         showToast('No files selected', 'warning');
         return;
@@ -520,40 +1010,151 @@ async function renameSelected() {
     }
 
     const dryRun = elements.dryRun.checked;
+    // Organize moves the files into the library layout instead of renaming them in place
+    const organize = elements.organize.checked;
     const files = filesToRename.map(file => ({
         ...file.renameData,
         filepath: file.filepath
     }));
 
+    const controller = new AbortController();
+    state.batchRun = { batchId: null, controller };
+    const buttonLabel = elements.renameSelected.textContent;
+    elements.renameSelected.textContent = `Cancel (0/${files.length})`;
+
+    let summary = null;
     try {
-        const response = await fetch('/api/batch/rename', {
+        const response = await fetch(organize ? '/api/organize/stream' : '/api/batch/rename/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ files, dry_run: dryRun })
+            body: JSON.stringify({ files, dry_run: dryRun }),
+            signal: controller.signal
         });
 
-        const result = await response.json();
+        if (!response.ok) {
+            showToast('Batch rename failed', 'error');
+            return;
+        }
 
-        if (response.ok) {
-            // Update state for successful renames
-            result.results.forEach((res, idx) => {
-                if (res.success) {
-                    const file = filesToRename[idx];
+        // Progress arrives as Server-Sent Events, one per renamed file
+        await readEventStream(response, (event, data) => {
+            if (event === 'start') {
+                state.batchRun.batchId = data.batch_id;
+            } else if (event === 'result') {
+                if (data.success) {
+                    const file = filesToRename[data.index];
                     file.renamed = true;
-                    file.filename = res.new_filename;
-                    if (res.new_path) file.filepath = res.new_path;
+                    file.filename = data.new_filename;
+                    if (data.new_path) file.filepath = data.new_path;
                 }
-            });
-
-            renderFiles();
-            const msg = dryRun
-                ? `[Dry Run] Would rename ${result.success_count}/${result.total} files`
-                : `Renamed ${result.success_count}/${result.total} files`;
-            showToast(msg, result.success_count > 0 ? 'success' : 'warning');
-        } else {
+                elements.renameSelected.textContent =
+                    `Cancel (${data.counters.done}/${files.length})`;
+                scheduleRender();
+            } else if (event === 'done') {
+                summary = data;
+            }
+        });
+    } catch (error) {
+        if (error.name !== 'AbortError') {
             showToast('Batch rename failed', 'error');
         }
+    } finally {
+        const batchId = state.batchRun.batchId;
+        state.batchRun = null;
+        elements.renameSelected.textContent = buttonLabel;
+        renderFiles();
+
+        if (summary) {
+            setLastBatch(summary.batch_id);
+            const verb = dryRun ? `[Dry Run] Would ${organize ? 'move' : 'rename'}` : (organize ? 'Moved' : 'Renamed');
+            const msg = `${verb} ${summary.success_count}/${summary.total} files${summary.cancelled ? ' (cancelled)' : ''}`;
+            showToast(msg, summary.success_count > 0 ? 'success' : 'warning');
+        } else if (batchId && !dryRun) {
+            // Disconnected mid-batch: whatever completed can still be undone
+            setLastBatch(batchId);
+            showToast('Batch rename stopped', 'warning');
+        }
+    }
+}
+
+async function cancelBatch() {
+    const run = state.batchRun;
+    if (!run || !run.batchId) {
+        if (run) run.controller.abort();
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/batch/${run.batchId}/cancel`, { method: 'POST' });
+        if (!response.ok) run.controller.abort();
+    } catch (error) {
+        // Dropping the connection stops the batch too
+        run.controller.abort();
+    }
+}
+
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const dispatch = (block) => {
+        let event = 'message';
+        const data = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+        });
+        if (data.length) onEvent(event, JSON.parse(data.join('\n')));
+    };
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop();
+        blocks.forEach(dispatch);
+    }
+
+    buffer += decoder.decode();
+    if (buffer.trim()) dispatch(buffer);
+}
+
+function setLastBatch(batchId) {
+    state.lastBatchId = batchId || null;
+    elements.undoBatch.style.display = state.lastBatchId ? '' : 'none';
+}
+
+async function undoLastBatch() {
+    if (!state.lastBatchId) return;
+
+    try {
+        const response = await fetch(`/api/undo/${state.lastBatchId}`, { method: 'POST' });
+        const result = await response.json();
+
+        if (!response.ok) {
+            showToast(result.error || 'Undo failed', 'error');
+            return;
+        }
+
+        const indexByPath = new Map(state.files.map((file, index) => [file.filepath, index]));
+        result.results.forEach(res => {
+            const index = indexByPath.get(res.from_path);
+            if (!res.success || index === undefined) return;
+            const file = state.files[index];
+            file.renamed = false;
+            file.filepath = res.original_path;
+            file.filename = res.original_path.split('/').pop();
+            if (file.renameData) file.renameData.filepath = res.original_path;
+        });
+
+        setLastBatch(null);
+        renderFiles();
+        showToast(`Undid ${result.success_count}/${result.total} renames`,
+            result.success_count === result.total ? 'success' : 'warning');
     } catch (error) {
-        showToast('Batch rename failed', 'error');
+        showToast('Undo failed', 'error');
     }
 }
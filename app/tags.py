@@ -0,0 +1,271 @@
+"""
+Media Renamer - Embedded Audio Tags
+Reads artist/title/album from ID3, FLAC, Ogg and MP4 tags without third-party libraries
+"""
+
+import io
+import os
+
+# Largest tag block or frame read into memory; bigger ones (cover art) are skipped
+MAX_TAG_BYTES = 256 * 1024
+
+TAG_KEYS = ('artist', 'title', 'album')
+
+ID3_FRAMES = {
+    'TIT2': 'title', 'TPE1': 'artist', 'TALB': 'album', 'TPE2': 'album_artist',
+    # ID3v2.2 uses three-character frame ids
+    'TT2': 'title', 'TP1': 'artist', 'TAL': 'album', 'TP2': 'album_artist'
+}
+ID3_ENCODINGS = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')
+
+VORBIS_FIELDS = {'ARTIST': 'artist', 'TITLE': 'title', 'ALBUM': 'album',
+                 'ALBUMARTIST': 'album_artist', 'ALBUM ARTIST': 'album_artist'}
+
+MP4_ITEMS = {b'\xa9nam': 'title', b'\xa9ART': 'artist', b'\xa9alb': 'album', b'aART': 'album_artist'}
+
+
+def _clean(value):
+    """First value of a possibly multi-valued tag, with whitespace normalized."""
+    return ' '.join(value.split('\x00')[0].split())
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3_text(payload):
+    if not payload or payload[0] >= len(ID3_ENCODINGS):
+        return ''
+    return _clean(payload[1:].decode(ID3_ENCODINGS[payload[0]], errors='ignore'))
+
+
+def _read_id3v2(f, tags):
+    """Read ID3v2.2-2.4 text frames at the current position. Returns the offset after the tag."""
+    start = f.tell()
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3' or header[3] not in (2, 3, 4):
+        f.seek(start)
+        return start
+
+    major, flags = header[3], header[5]
+    size = _syncsafe(header[6:10])
+    tag_end = start + 10 + size
+
+    src, end = f, tag_end
+    if flags & 0x80 and major < 4:
+        # Whole-tag unsynchronisation: undo it in memory
+        data = f.read(min(size, MAX_TAG_BYTES)).replace(b'\xff\x00', b'\xff')
+        src, end = io.BytesIO(data), len(data)
+
+    if flags & 0x40 and major > 2:
+        raw = src.read(4)
+        # v2.3 counts the size field separately, v2.4 includes it
+        src.seek(_syncsafe(raw) - 4 if major == 4 else int.from_bytes(raw, 'big'), 1)
+
+    id_len, header_len = (3, 6) if major == 2 else (4, 10)
+    while src.tell() + header_len <= end and not all(k in tags for k in TAG_KEYS):
+        frame = src.read(header_len)
+        if len(frame) < header_len or frame[0] == 0:
+            break  # Padding
+
+        frame_id = frame[:id_len].decode('latin-1')
+        if major == 4:
+            frame_size = _syncsafe(frame[4:8])
+        else:
+            frame_size = int.from_bytes(frame[id_len:id_len * 2], 'big')
+
+        key = ID3_FRAMES.get(frame_id)
+        if key is None or key in tags or frame_size > MAX_TAG_BYTES:
+            src.seek(frame_size, 1)
+            continue
+
+        payload = src.read(frame_size)
+        format_flags = frame[9] if major > 2 else 0
+        if major == 4:
+            if format_flags & 0x0c:
+                continue  # Compressed or encrypted
+            if format_flags & 0x02:
+                payload = payload.replace(b'\xff\x00', b'\xff')
+            if format_flags & 0x01:
+                payload = payload[4:]
+        elif major == 3:
+            if format_flags & 0xc0:
+                continue  # Compressed or encrypted
+            if format_flags & 0x20:
+                payload = payload[1:]
+
+        value = _id3_text(payload)
+        if value:
+            tags[key] = value
+
+    f.seek(tag_end)
+    return tag_end
+
+
+def _read_id3v1(f, tags):
+    """Fill missing fields from a trailing 128-byte ID3v1 tag."""
+    f.seek(0, os.SEEK_END)
+    if f.tell() < 128:
+        return
+    f.seek(-128, os.SEEK_END)
+    data = f.read(128)
+    if data[:3] != b'TAG':
+        return
+
+    for key, field in (('title', data[3:33]), ('artist', data[33:63]), ('album', data[63:93])):
+        value = _clean(field.decode('latin-1').rstrip('\x00 '))
+        if value and key not in tags:
+            tags[key] = value
+
+
+def _parse_vorbis_comments(data, tags):
+    """Parse a Vorbis comment block (FLAC, Ogg Vorbis, Opus). Tolerates truncation."""
+    pos = 4 + int.from_bytes(data[:4], 'little')
+    count = int.from_bytes(data[pos:pos + 4], 'little')
+    pos += 4
+
+    for _ in range(count):
+        if pos + 4 > len(data):
+            break
+        length = int.from_bytes(data[pos:pos + 4], 'little')
+        comment = data[pos + 4:pos + 4 + length].decode('utf-8', errors='ignore')
+        pos += 4 + length
+
+        name, _, value = comment.partition('=')
+        key = VORBIS_FIELDS.get(name.upper())
+        value = _clean(value)
+        if key and value and key not in tags:
+            tags[key] = value
+
+
+def _read_flac(f, tags):
+    if f.read(4) != b'fLaC':
+        return
+
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return
+        block_type, length = header[0] & 0x7f, int.from_bytes(header[1:4], 'big')
+        if block_type == 4:
+            _parse_vorbis_comments(f.read(min(length, MAX_TAG_BYTES)), tags)
+            return
+        if header[0] & 0x80:
+            return  # Last metadata block
+        f.seek(length, 1)
+
+
+def _read_ogg(f, tags):
+    """Find the comment header in the first pages of an Ogg Vorbis or Opus stream."""
+    data = f.read(MAX_TAG_BYTES)
+    packets = bytearray()
+    pos = 0
+
+    while data[pos:pos + 4] == b'OggS' and pos + 27 <= len(data):
+        segments = data[pos + 26]
+        table = data[pos + 27:pos + 27 + segments]
+        body_start = pos + 27 + segments
+        body_end = body_start + sum(table)
+        packets += data[body_start:body_end]
+        pos = body_end
+
+    for marker in (b'\x03vorbis', b'OpusTags'):
+        at = packets.find(marker)
+        if at >= 0:
+            _parse_vorbis_comments(bytes(packets[at + len(marker):]), tags)
+            return
+
+
+def _mp4_atoms(f, start, end):
+    """Yield (type, body_start, atom_end) for the atoms between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind, header_len = int.from_bytes(header[:4], 'big'), header[4:], 8
+        if size == 1:
+            size, header_len = int.from_bytes(f.read(8), 'big'), 16
+        elif size == 0:
+            size = end - pos
+        if size < header_len:
+            return
+        yield kind, pos + header_len, pos + size
+        pos += size
+
+
+def _find_mp4_atom(f, start, end, path):
+    for kind, body, atom_end in _mp4_atoms(f, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return body, atom_end
+            # meta is a full atom: skip its version and flags
+            return _find_mp4_atom(f, body + 4 if kind == b'meta' else body, atom_end, path[1:])
+    return None
+
+
+def _read_mp4(f, tags):
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(4)
+    if f.read(4) != b'ftyp':
+        return
+
+    found = (_find_mp4_atom(f, 0, size, (b'moov', b'udta', b'meta', b'ilst'))
+             or _find_mp4_atom(f, 0, size, (b'moov', b'meta', b'ilst')))
+    if found is None:
+        return
+
+    for kind, body, item_end in _mp4_atoms(f, *found):
+        key = MP4_ITEMS.get(kind)
+        if key is None or key in tags:
+            continue
+        for data_kind, data_body, data_end in _mp4_atoms(f, body, item_end):
+            if data_kind == b'data' and data_end - data_body <= MAX_TAG_BYTES:
+                f.seek(data_body)
+                payload = f.read(data_end - data_body)
+                # Type indicator, then locale, then the value
+                value = _clean(payload[8:].decode('utf-8', errors='ignore'))
+                if value:
+                    tags[key] = value
+                break
+
+
+READERS = {
+    'flac': _read_flac,
+    'ogg': _read_ogg,
+    'opus': _read_ogg,
+    'm4a': _read_mp4,
+    'alac': _read_mp4,
+    'mp4': _read_mp4,
+}
+
+
+def read_tags(filepath):
+    """
+    Read artist, title and album from a file's embedded tags.
+
+    Only the tag blocks are read, with bounded reads and seeks over
+    everything else, so the cost does not grow with the file size.
+    Returns a dict with whichever of the keys were found; empty if the
+    file has no readable tags.
+    """
+    tags = {}
+    extension = os.path.splitext(filepath)[1][1:].lower()
+
+    try:
+        with open(filepath, 'rb') as f:
+            # ID3v2 can also prefix FLAC and ADTS streams
+            _read_id3v2(f, tags)
+            reader = READERS.get(extension)
+            if reader is not None:
+                reader(f, tags)
+            else:
+                _read_id3v1(f, tags)
+    except (OSError, ValueError, IndexError):
+        return {}
+
+    if 'artist' not in tags and 'album_artist' in tags:
+        tags['artist'] = tags['album_artist']
+    return {key: tags[key] for key in TAG_KEYS if key in tags}
@@ -0,0 +1,130 @@
+"""
+Media Renamer - Concurrent Directory Walker
+Lists many directories at once for network mounts, in the order a serial walk would
+"""
+
+import heapq
+import os
+import threading
+from concurrent.futures import Future
+
+from . import blocking, watcher
+
+_mount_slots = {}
+_mount_slots_lock = threading.Lock()
+
+
+def get_mount_slots(mount_point, limit):
+    """
+    Return this process's semaphore bounding concurrent listings on a
+    mount, shared by every walk. The limit only applies when it is created.
+    """
+    key = (os.getpid(), mount_point)
+    with _mount_slots_lock:
+        slots = _mount_slots.get(key)
+        if slots is None:
+            slots = _mount_slots[key] = threading.BoundedSemaphore(limit)
+    return slots
+
+
+class _Node:
+    __slots__ = ('path', 'order', 'future', 'children', 'scheduled')
+
+    def __init__(self, path, order):
+        self.path = path
+        # Position in a serial depth-first walk: child indexes from the root
+        self.order = order
+        self.future = Future()
+        self.children = []
+        self.scheduled = False
+
+
+class ConcurrentWalker:
+    """
+    Walks a directory tree with a pool of threads, so that on filesystems
+    where every listing or stat is a network round trip many of them are
+    in flight at once.
+
+    `visit(path)` is called on the pool for each directory and returns
+    (result, subdirectories in walk order). walk() yields (path, result)
+    in exactly the order a serial depth-first walk would, however the
+    listings complete. A directory's subdirectories are queued as soon as
+    it has been visited, and the pool always takes the queued directory
+    that comes first in walk order, so the one the caller is waiting for
+    is never stuck behind look-ahead. At most MAX_AHEAD directories are
+    visited ahead of the caller.
+
+    Each mount gets at most `per_mount` visits at once in this process,
+    across all walks, so one slow share cannot take every thread and
+    concurrent scans cannot overload a server.
+    """
+
+    MAX_AHEAD = 1024
+
+    def __init__(self, workers=16, per_mount=8):
+        self.workers = workers
+        self.per_mount = per_mount
+
+    def walk(self, root, visit, recursive=True):
+        mounts = watcher.read_mounts()
+        # Subdirectories are reached without following symlinks, so their
+        # real paths (for finding their mount) need no further lookups
+        real_root = os.path.realpath(root)
+        queue = []
+        cond = threading.Condition()
+        state = {'ahead': 0, 'stopped': False}
+
+        def schedule(node):
+            # Called with cond held
+            if not node.scheduled:
+                node.scheduled = True
+                state['ahead'] += 1
+                heapq.heappush(queue, (node.order, node))
+                cond.notify()
+
+        def work():
+            while True:
+                with cond:
+                    while not queue and not state['stopped']:
+                        cond.wait()
+                    if state['stopped']:
+                        return
+                    _, node = heapq.heappop(queue)
+
+                try:
+                    mount_point = watcher.mount_of(real_root + node.path[len(root):], mounts)[0]
+                    with get_mount_slots(mount_point, self.per_mount):
+                        result, subdirs = blocking.call(visit, node.path)
+                except BaseException as e:
+                    node.future.set_exception(e)
+                    continue
+
+                if recursive:
+                    node.children = [_Node(path, node.order + (i,)) for i, path in enumerate(subdirs)]
+                    with cond:
+                        for child in node.children:
+                            if state['ahead'] >= self.MAX_AHEAD:
+                                break
+                            schedule(child)
+                node.future.set_result(result)
+
+        threads = [threading.Thread(target=work, name='scan-walker', daemon=True)
+                   for _ in range(max(1, self.workers if recursive else 1))]
+        for thread in threads:
+            thread.start()
+
+        stack = [_Node(root, ())]
+        try:
+            while stack:
+                node = stack.pop()
+                with cond:
+                    schedule(node)
+                result = node.future.result()
+                with cond:
+                    state['ahead'] -= 1
+                yield node.path, result
+                stack.extend(reversed(node.children))
+        finally:
+            with cond:
+                state['stopped'] = True
+                cond.notify_all()
@@ -0,0 +1,624 @@
+"""
+Media Renamer - Watch Folders
+Notices new media files as they arrive and queues them for matching
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import json
+import logging
+import os
+import select
+import sqlite3
+import struct
+import threading
+import time
+
+from . import blocking, renamer
+
+MEDIA_EXTENSIONS = renamer.VIDEO_EXTENSIONS | renamer.AUDIO_EXTENSIONS
+
+# Filesystems where inotify does not see changes made by other hosts
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'ncpfs', 'afs', '9p',
+                       'fuse.sshfs', 'fuse.rclone', 'fuse.s3fs'}
+
+# inotify(7) constants
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_WATCH_MASK = (IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+                 | IN_DELETE_SELF | IN_ONLYDIR)
+IN_EVENT_HEADER = struct.Struct('iIII')
+
+QUEUE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS queue (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    info TEXT NOT NULL,
+    detected REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS queue_detected ON queue (detected);
+'''
+
+
+def is_candidate(name):
+    """Whether a directory entry could be a media file worth watching."""
+    return not name.startswith('.') and renamer.get_extension(name) in MEDIA_EXTENSIONS
+
+
+def read_mounts(mounts='/proc/mounts'):
+    """Return [(mount point, filesystem type)], longest mount point first, or [] if unknown."""
+    table = []
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    table.append((fields[1].replace('\\040', ' '), fields[2]))
+    except OSError:
+        return []
+    table.sort(key=lambda m: len(m[0]), reverse=True)
+    return table
+
+
+def mount_of(path, table):
+    """Return the (mount point, filesystem type) a real path is on, or ('', None)."""
+    for mount_point, fs_type in table:
+        if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+            return mount_point, fs_type
+    return '', None
+
+
+def is_network_filesystem(path, mounts='/proc/mounts'):
+    """Whether path is on a network filesystem, judged by its longest matching mount point."""
+    return mount_of(os.path.realpath(path), read_mounts(mounts))[1] in NETWORK_FILESYSTEMS
+
+
+class WatchQueue:
+    """
+    New media files waiting to be matched, kept in SQLite so every worker
+    process can read the queue the elected watcher process fills.
+
+    Safe to share between threads: each thread gets its own connection.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.executescript(QUEUE_SCHEMA)
+        conn.commit()
+
+    def _connect(self):
+        """Return this thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, file_info, root):
+        """Queue a scanned file, replacing any older entry for the same path."""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO queue (path, root, info, detected) VALUES (?, ?, ?, ?)',
+                (file_info['filepath'], root, json.dumps(file_info), time.time())
+            )
+
+    def remove(self, paths):
+        """
+        Drop entries by path. A path ending in a slash drops everything
+        below that directory. Returns how many were removed.
+        """
+        files = [(p,) for p in paths if not p.endswith('/')]
+        trees = [(len(p), p) for p in paths if p.endswith('/')]
+        conn = self._connect()
+        with conn:
+            removed = conn.executemany('DELETE FROM queue WHERE path = ?', files).rowcount
+            if trees:
+                removed += conn.executemany(
+                    'DELETE FROM queue WHERE substr(path, 1, ?) = ?', trees
+                ).rowcount
+        return removed
+
+    def take(self, paths):
+        """Drop entries by path like remove(), returning the paths that were dropped."""
+        taken = []
+        conn = self._connect()
+        with conn:
+            for path in paths:
+                if path.endswith('/'):
+                    rows = conn.execute(
+                        'SELECT path FROM queue WHERE substr(path, 1, ?) = ?', (len(path), path)
+                    ).fetchall()
+                    conn.execute('DELETE FROM queue WHERE substr(path, 1, ?) = ?', (len(path), path))
+                    taken.extend(row[0] for row in rows)
+                elif conn.execute('DELETE FROM queue WHERE path = ?', (path,)).rowcount:
+                    taken.append(path)
+        return taken
+
+    def clear(self):
+        """Drop every entry. Returns how many were removed."""
+        conn = self._connect()
+        with conn:
+            return conn.execute('DELETE FROM queue').rowcount
+
+    def count(self):
+        (count,) = self._connect().execute('SELECT COUNT(*) FROM queue').fetchone()
+        return count
+
+    def list(self, limit=None, offset=0):
+        """Return queued file info dicts, oldest first, each with its detection time."""
+        rows = self._connect().execute(
+            'SELECT info, detected FROM queue ORDER BY detected, path LIMIT ? OFFSET ?',
+            (-1 if limit is None else limit, offset)
+        )
+        files = []
+        for info, detected in rows:
+            file_info = json.loads(info)
+            file_info['detected'] = detected
+            files.append(file_info)
+        return files
+
+
+class PollingBackend:
+    """
+    Finds new files by re-listing only directories whose mtime changed
+    since the last poll. Works on any filesystem, including NFS.
+
+    A new name whose inode vanished elsewhere in the tree in the same
+    poll is a rename within the tree, not a new arrival, and is reported
+    as a move.
+    """
+
+    # A directory modified this recently is listed again on the next poll,
+    # in case it changes again within the filesystem's mtime granularity
+    RACY_WINDOW = 2.0
+
+    def __init__(self):
+        # directory -> (mtime_ns or None, {filename: inode}, [subdirectories])
+        self.dirs = {}
+
+    def add(self, root):
+        """Start watching a tree. Files already there are not reported."""
+        self._add_tree(root, {})
+
+    def _list(self, directory):
+        """Return (mtime_ns, {filename: inode}, [subdirs]) for a directory."""
+        mtime_ns = os.stat(directory).st_mtime_ns
+        if time.time() - mtime_ns / 1e9 < self.RACY_WINDOW:
+            mtime_ns = None
+
+        files, subdirs = {}, []
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.'):
+                            subdirs.append(entry.path)
+                    elif entry.is_file() and is_candidate(entry.name):
+                        files[entry.name] = entry.inode()
+                except OSError:
+                    continue
+        return mtime_ns, files, subdirs
+
+    def _add_tree(self, root, added):
+        """List a tree, recording every file found in `added` as path -> inode."""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                listing = self._list(directory)
+            except OSError:
+                continue
+            self.dirs[directory] = listing
+            for name, inode in listing[1].items():
+                added[os.path.join(directory, name)] = inode
+            stack.extend(listing[2])
+
+    def _forget_tree(self, root, removed):
+        """Stop tracking a tree, recording its files in `removed` as inode -> path."""
+        prefix = root.rstrip('/') + '/'
+        for directory in [d for d in self.dirs if d == root or d.startswith(prefix)]:
+            _, files, _ = self.dirs.pop(directory)
+            for name, inode in files.items():
+                removed[inode] = os.path.join(directory, name)
+
+    def poll(self):
+        """Return (new_paths, gone_paths, moved_pairs) since the last poll."""
+        added, removed = {}, {}
+
+        for directory in list(self.dirs):
+            if directory not in self.dirs:
+                # Forgotten along with a parent earlier in this poll
+                continue
+            old_mtime, old_files, old_subdirs = self.dirs[directory]
+            try:
+                if old_mtime is not None and os.stat(directory).st_mtime_ns == old_mtime:
+                    continue
+                listing = self._list(directory)
+            except OSError:
+                self._forget_tree(directory, removed)
+                continue
+
+            self.dirs[directory] = listing
+            _, files, subdirs = listing
+            for name, inode in files.items():
+                if old_files.get(name) != inode:
+                    added[os.path.join(directory, name)] = inode
+            for name, inode in old_files.items():
+                if files.get(name) != inode:
+                    removed[inode] = os.path.join(directory, name)
+
+            for subdir in set(old_subdirs) - set(subdirs):
+                self._forget_tree(subdir, removed)
+            for subdir in set(subdirs) - set(old_subdirs):
+                self._add_tree(subdir, added)
+
+        new, moved = [], []
+        for path, inode in added.items():
+            if inode in removed:
+                moved.append((removed.pop(inode), path))
+            else:
+                new.append(path)
+        return new, list(removed.values()), moved
+
+
+class InotifyBackend:
+    """
+    Watches trees with Linux inotify through libc, so new files are seen
+    as soon as they appear without re-listing anything.
+
+    Moves within the watched trees are paired by cookie and reported as
+    moves, not new arrivals. If the kernel event queue overflows, every
+    watched tree is re-listed and files changed since the last event are
+    reported.
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self.roots = []
+        self.paths = {}
+        self._last_event = time.time()
+
+    def close(self):
+        os.close(self.fd)
+
+    def _watch(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), directory)
+        self.paths[wd] = directory
+
+    def _watch_tree(self, root, found=None):
+        """Watch a directory and everything below it, collecting files into `found`."""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                self._watch(directory)
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith('.'):
+                                stack.append(entry.path)
+                        elif found is not None and is_candidate(entry.name):
+                            found.append(entry.path)
+            except OSError as e:
+                # Out of watches is fatal for this tree; a vanished directory is not
+                if e.errno in (errno.ENOSPC, errno.EMFILE):
+                    raise
+
+    def add(self, root):
+        """Start watching a tree. Files already there are not reported."""
+        self._watch_tree(root)
+        self.roots.append(root)
+
+    def _unwatch_tree(self, root):
+        prefix = root.rstrip('/') + '/'
+        for wd, path in list(self.paths.items()):
+            if path == root or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self.paths[wd]
+
+    def _rename_watches(self, old, new):
+        prefix = old.rstrip('/') + '/'
+        for wd, path in self.paths.items():
+            if path == old:
+                self.paths[wd] = new
+            elif path.startswith(prefix):
+                self.paths[wd] = new + path[len(old):]
+
+    def _rescan(self, since):
+        """Re-list every tree after an overflow, reporting files changed since `since`."""
+        found = []
+        for root in self.roots:
+            self._watch_tree(root, found)
+
+        new = []
+        for path in found:
+            try:
+                if os.stat(path).st_ctime >= since:
+                    new.append(path)
+            except OSError:
+                continue
+        return new
+
+    def read(self, timeout):
+        """
+        Wait up to timeout seconds for events. Returns (new_paths, gone_paths,
+        moved_pairs); directories in gone_paths and moved_pairs end in a slash.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], [], []
+
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return [], [], []
+        last_event, self._last_event = self._last_event, time.time()
+
+        events = []
+        offset = 0
+        while offset + IN_EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = IN_EVENT_HEADER.unpack_from(data, offset)
+            offset += IN_EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, cookie, name))
+
+        new, gone, moved = [], [], []
+        moved_to = {cookie for _, mask, cookie, _ in events if mask & IN_MOVED_TO}
+        renamed_files = {}
+        renamed_dirs = {}
+
+        for wd, mask, cookie, name in events:
+            if mask & IN_Q_OVERFLOW:
+                new.extend(self._rescan(last_event - 1))
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            directory = self.paths.get(wd)
+            if directory is None or not name:
+                continue
+
+            path = os.path.join(directory, name)
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & IN_MOVED_FROM:
+                if not is_dir:
+                    # Only a media file renamed to another name is not an arrival;
+                    # "Movie.mkv.part" -> "Movie.mkv" is how downloads finish
+                    if not is_candidate(name):
+                        continue
+                    if cookie in moved_to:
+                        renamed_files[cookie] = path
+                    else:
+                        # Moved out of the watched trees
+                        gone.append(path)
+                elif cookie in moved_to:
+                    renamed_dirs[cookie] = path
+                else:
+                    # Moved out of the watched trees
+                    self._unwatch_tree(path)
+                    gone.append(path + '/')
+            elif mask & IN_MOVED_TO and cookie in renamed_dirs:
+                old = renamed_dirs.pop(cookie)
+                self._rename_watches(old, path)
+                moved.append((old + '/', path + '/'))
+            elif mask & IN_MOVED_TO and cookie in renamed_files:
+                # Renamed within the watched trees, not a new arrival
+                old = renamed_files.pop(cookie)
+                if is_candidate(name):
+                    moved.append((old, path))
+                else:
+                    gone.append(old)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                if is_dir:
+                    if not name.startswith('.'):
+                        # Files may land before the new directory's watch is in place
+                        self._watch_tree(path, new)
+                elif is_candidate(name):
+                    new.append(path)
+            elif mask & IN_DELETE and not is_dir and is_candidate(name):
+                gone.append(path)
+
+        return new, gone, moved
+
+
+class Watcher:
+    """
+    Watches media roots and queues new files once they stop changing.
+
+    Local roots use inotify when the platform has it; network filesystems
+    such as NFS, where inotify misses changes made by other hosts, and any
+    root inotify cannot cover use the polling backend instead.
+
+    A file is debounced until its size and mtime have held still for
+    `settle` seconds, so copies in progress are not picked up half-written.
+    It is then parsed like a scan result and added to the queue.
+
+    With several worker processes, call start() in each: one becomes the
+    watcher by holding a lock file, and the others stand by to take over
+    if it exits.
+    """
+
+    # Seconds between attempts to become the watcher process
+    ELECTION_INTERVAL = 30
+
+    def __init__(self, roots, queue, mode='auto', settle=5.0, poll_interval=10.0,
+                 backend='auto', lock_path=None, logger=None):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.queue = queue
+        self.mode = mode
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.backend = backend
+        self.lock_path = lock_path
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.inotify = None
+        self.polling = None
+        # path -> (size, mtime_ns, unchanged since)
+        self.pending = {}
+        self._stop = threading.Event()
+
+    def start(self):
+        """Run the watcher in a background thread."""
+        thread = threading.Thread(target=self.run, name='watcher', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _elect(self):
+        """Hold the watcher lock, waiting our turn. Returns the fd, or None if stopped."""
+        if not self.lock_path:
+            return -1
+
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        while not self._stop.is_set():
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                self._stop.wait(self.ELECTION_INTERVAL)
+        os.close(fd)
+        return None
+
+    def _setup(self):
+        """Attach every root to a backend."""
+        for root in self.roots:
+            if not os.path.isdir(root):
+                self.logger.warning('Watch folder %s does not exist, skipping it', root)
+                continue
+
+            use_inotify = self.backend == 'inotify' or (
+                self.backend == 'auto' and not is_network_filesystem(root)
+            )
+            if use_inotify:
+                try:
+                    if self.inotify is None:
+                        self.inotify = InotifyBackend()
+                    self.inotify.add(root)
+                    self.logger.info('Watching %s with inotify', root)
+                    continue
+                except (OSError, AttributeError) as e:
+                    self.logger.warning('inotify unavailable for %s (%s), polling instead', root, e)
+
+            if self.polling is None:
+                self.polling = PollingBackend()
+            self.polling.add(root)
+            self.logger.info('Watching %s by polling every %ss', root, self.poll_interval)
+
+    def _root_of(self, path):
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip('/') + '/'):
+                return root
+        return os.path.dirname(path)
+
+    def _handle(self, new, gone, moved):
+        now = time.monotonic()
+        for path in new:
+            self.pending[path] = (None, None, now)
+        if gone:
+            for path in gone:
+                if path.endswith('/'):
+                    for pending in [p for p in self.pending if p.startswith(path)]:
+                        del self.pending[pending]
+                else:
+                    self.pending.pop(path, None)
+            self.queue.remove(gone)
+        if moved:
+            # A renamed file that was still settling carries on under its new
+            # name; one already queued is parsed and queued again under it
+            def renamed(path):
+                for old, new_path in moved:
+                    if path == old or (old.endswith('/') and path.startswith(old)):
+                        return new_path + path[len(old):]
+                return None
+
+            for path in list(self.pending):
+                new_path = renamed(path)
+                if new_path is not None:
+                    self.pending[new_path] = self.pending.pop(path)
+            for path in self.queue.take([old for old, _ in moved]):
+                self.pending[renamed(path)] = (None, None, now)
+
+    def _settle_pending(self):
+        """Queue pending files whose size and mtime have held still long enough."""
+        now = time.monotonic()
+        for path, (size, mtime_ns, since) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now)
+                continue
+            if now - since < self.settle:
+                continue
+
+            del self.pending[path]
+            file_info = renamer.build_file_info(os.path.basename(path), path, self.mode)
+            if file_info is not None:
+                self.queue.add(file_info, self._root_of(path))
+                self.logger.info('Queued new file %s', path)
+
+    def run(self):
+        """Elect a watcher process, then watch until stopped."""
+        lock_fd = self._elect()
+        if lock_fd is None:
+            return
+
+        try:
+            blocking.call(self._setup)
+            next_poll = time.monotonic() + self.poll_interval
+            while not self._stop.is_set():
+                try:
+                    if self.inotify is not None:
+                        blocking.call(self._handle, *self.inotify.read(1.0))
+                    else:
+                        self._stop.wait(1.0)
+
+                    if self.polling is not None and time.monotonic() >= next_poll:
+                        blocking.call(self._handle, *blocking.call(self.polling.poll))
+                        next_poll = time.monotonic() + self.poll_interval
+
+                    if self.pending:
+                        blocking.call(self._settle_pending)
+                except (OSError, sqlite3.Error) as e:
+                    self.logger.warning('Watcher error: %s', e)
+                    self._stop.wait(1.0)
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+            if lock_fd >= 0:
+                os.close(lock_fd)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Cross-filesystem organize benchmark
+
+Creates files of random data in --source and moves them into --library,
+which should be on another filesystem (e.g. /tmp and /dev/shm), first
+one at a time with shutil.move (a read/write copy), then with
+organize.execute_moves: zero-copy transfers, several files at once,
+each verified before its source is removed.
+
+    python benchmarks/bench_organize.py --source /tmp --library /dev/shm --files 16 --size-mb 64
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import organize
+
+
+def make_files(directory, count, size):
+    block = os.urandom(1024 * 1024)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'movie{i}.mkv')
+        with open(path, 'wb') as f:
+            f.writelines(block for _ in range(size // len(block)))
+            f.write(os.urandom(size % len(block) + i))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source', default=tempfile.gettempdir(), help='directory to create the files in')
+    parser.add_argument('--library', required=True, help='directory on another filesystem to move them to')
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--size-mb', type=float, default=64)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--no-verify', action='store_true', help='compare sizes instead of contents')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    source = tempfile.mkdtemp(prefix='media-renamer-organize-', dir=args.source)
+    library = tempfile.mkdtemp(prefix='media-renamer-organize-', dir=args.library)
+    results = {'files': args.files, 'size_mb': args.size_mb, 'workers': args.workers,
+               'cross_device': os.stat(source).st_dev != os.stat(library).st_dev}
+
+    try:
+        paths = make_files(source, args.files, size)
+        start = time.perf_counter()
+        for path in paths:
+            shutil.move(path, os.path.join(library, os.path.basename(path)))
+        results['shutil_move_s'] = time.perf_counter() - start
+
+        # Move them back and time organize on the same files
+        for path in paths:
+            shutil.move(os.path.join(library, os.path.basename(path)), path)
+        plan = organize.OrganizePlan(
+            (path, os.path.join(library, 'Movies', os.path.basename(path))) for path in paths)
+        start = time.perf_counter()
+        moved = list(organize.execute_moves(plan, workers=args.workers, verify=not args.no_verify))
+        results['organize_s'] = time.perf_counter() - start
+        results['failed'] = sum(1 for _, result in moved if not result['success'])
+    finally:
+        shutil.rmtree(source, ignore_errors=True)
+        shutil.rmtree(library, ignore_errors=True)
+
+    total_mb = args.files * args.size_mb
+    for key in ('shutil_move_s', 'organize_s'):
+        results[key] = round(results[key], 3)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{args.files} files of {args.size_mb:g} MB, "
+              f"{'across filesystems' if results['cross_device'] else 'same filesystem'}")
+        print(f"  shutil.move, serial:       {results['shutil_move_s']:8.3f}s "
+              f"({total_mb / results['shutil_move_s']:.0f} MB/s)")
+        print(f"  organize, {args.workers} workers{', verified' if not args.no_verify else ''}: "
+              f"{results['organize_s']:8.3f}s ({total_mb / results['organize_s']:.0f} MB/s)")
+        print(f"  failed:                    {results['failed']}")
+
+    return 1 if results['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Filename parsing microbenchmark
+
+Times the per-file cost of parsing scene-style names with the original
+per-pattern re.sub parser and with the precompiled engine in renamer,
+and checks that both produce the same results.
+
+    python benchmarks/bench_parse.py --count 100000
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import renamer
+from benchmarks.names import generate_names
+
+# Original implementation, kept verbatim as the baseline
+
+def legacy_detect_tv_show(filename):
+    """
+    Detect if a filename is a TV show and extract season/episode info.
+    Returns dict with show_name, season, episode or None if not a TV show.
+    """
+    name = os.path.splitext(filename)[0]
+
+    # Pattern 1: S01E02 format (most common)
+    match = re.search(r'[Ss](\d{1,2})[Ee](\d{1,2})', name)
+    if match:
+        season = match.group(1)
+        episode = match.group(2)
+        show_name = re.sub(r'[._-]?[Ss]\d{1,2}[Ee]\d{1,2}.*', '', name)
+        show_name = re.sub(r'[._-]+', ' ', show_name).strip()
+        return {'show_name': show_name, 'season': season, 'episode': episode}
+
+    # Pattern 2: 1x02 format
+    match = re.search(r'(\d{1,2})x(\d{1,2})', name)
+    if match:
+        season = match.group(1)
+        episode = match.group(2)
+        show_name = re.sub(r'[._-]?\d{1,2}x\d{1,2}.*', '', name)
+        show_name = re.sub(r'[._-]+', ' ', show_name).strip()
+        return {'show_name': show_name, 'season': season, 'episode': episode}
+
+    # Pattern 3: Season 1 Episode 2 format
+    match = re.search(r'[Ss]eason[._\s-]?(\d{1,2})[._\s-]?[Ee]pisode[._\s-]?(\d{1,2})', name)
+    if match:
+        season = match.group(1)
+        episode = match.group(2)
+        show_name = re.sub(r'[._-]?[Ss]eason.*', '', name, flags=re.IGNORECASE)
+        show_name = re.sub(r'[._-]+', ' ', show_name).strip()
+        return {'show_name': show_name, 'season': season, 'episode': episode}
+
+    return None
+
+
+def legacy_clean_movie_name(filename):
+    """Extract searchable movie name from filename."""
+    name = os.path.splitext(filename)[0]
+
+    # Replace common separators with spaces
+    name = re.sub(r'[._-]+', ' ', name)
+
+    # Extract year if present
+    year_match = re.search(r'\b(19|20)\d{2}\b', name)
+    year = year_match.group(0) if year_match else None
+
+    # Remove quality indicators
+    patterns = [
+        r'\b(720p|1080p|2160p|4k|uhd|hdr)\b',
+        r'\b(bluray|brrip|bdrip|dvdrip|webrip|web-dl|webdl|hdtv)\b',
+        r'\b(xvid|divx|x264|x265|h264|h265|hevc)\b',
+        r'\b(aac|ac3|dts|5\.1|7\.1)\b',
+        r'\b(proper|repack|extended|unrated|directors\s*cut|theatrical|remastered)\b',
+        r'\b(yify|yts|rarbg|eztv|ettv|sparks|axxo|fgt|ctrlhd|ntb|mtb|publichd)\b',
+    ]
+
+    for pattern in patterns:
+        name = re.sub(pattern, '', name, flags=re.IGNORECASE)
+
+    # Remove year from search string (will use separately)
+    if year:
+        name = re.sub(r'\b' + year + r'\b', '', name)
+
+    # Clean up whitespace
+    name = re.sub(r'\s+', ' ', name).strip()
+
+    return {'name': name, 'year': year}
+
+
+def legacy_clean_show_name(name):
+    """Clean a TV show name for searching."""
+    # Replace common separators with spaces
+    name = re.sub(r'[._-]+', ' ', name)
+
+    # Remove year in parentheses/brackets
+    name = re.sub(r'\([0-9]{4}\)', '', name)
+    name = re.sub(r'\[[0-9]{4}\]', '', name)
+
+    # Remove quality indicators
+    patterns = [
+        r'\b(720p|1080p|2160p|4k|uhd|hdr)\b',
+        r'\b(bluray|brrip|bdrip|dvdrip|webrip|web-dl|webdl|hdtv)\b',
+        r'\b(xvid|divx|x264|x265|h264|h265|hevc)\b',
+        r'\b(aac|ac3|dts|5\.1|7\.1|proper|repack)\b',
+    ]
+
+    for pattern in patterns:
+        name = re.sub(pattern, '', name, flags=re.IGNORECASE)
+
+    # Remove common group names
+    name = re.sub(r'\s+(yify|yts|rarbg|eztv|ettv|sparks|axxo|fgt|ctrlhd|ntb|mtb|publichd|lol|dimension|fleet|killers|fov|bamboozle).*$', '', name, flags=re.IGNORECASE)
+
+    # Clean up whitespace
+    name = re.sub(r'\s+', ' ', name).strip()
+
+    return name
+
+
+def legacy_clean_music_filename(filename):
+    """Extract artist and track info from music filename."""
+    name = os.path.splitext(filename)[0]
+
+    # Replace common separators with spaces
+    name = re.sub(r'[._-]+', ' ', name)
+
+    # Remove track numbers at start
+    name = re.sub(r'^[\d]{1,3}[\.\-\s]*', '', name)
+
+    # Remove quality/format tags
+    name = re.sub(r'\b(320kbps|256kbps|192kbps|128kbps|flac|mp3|wav|aac|ogg|lossless|cd|vinyl|remaster|remastered)\b', '', name, flags=re.IGNORECASE)
+
+    # Remove brackets content
+    name = re.sub(r'\[[^\]]*\]', '', name)
+    name = re.sub(r'\([^\)]*\)', '', name)
+
+    # Clean up whitespace
+    name = re.sub(r'\s+', ' ', name).strip()
+
+    return name
+
+
+def legacy_parse(filename, mode='auto'):
+    """Original scan_directory detection logic for one filename."""
+    if mode in ('auto', 'movies', 'tv') and renamer.is_video_file(filename):
+        tv_info = legacy_detect_tv_show(filename)
+        if tv_info and mode != 'movies':
+            return 'tv', {
+                'show_name': legacy_clean_show_name(tv_info['show_name']),
+                'season': tv_info['season'],
+                'episode': tv_info['episode']
+            }
+        if mode != 'tv':
+            return 'movie', legacy_clean_movie_name(filename)
+        return None, None
+    if mode in ('auto', 'music') and renamer.is_audio_file(filename):
+        return 'music', {'query': legacy_clean_music_filename(filename)}
+    return None, None
+
+
+def clear_caches():
+    renamer._parse_filename_cached.cache_clear()
+    renamer.clean_show_name.cache_clear()
+
+
+def timed(func, names, repeat, warm=False):
+    """
+    Best-of-`repeat` wall time for func(names), in seconds. Memo caches
+    are cleared first, then primed with one untimed pass if warm.
+    """
+    best = None
+    for _ in range(repeat):
+        clear_caches()
+        if warm:
+            func(names)
+        start = time.perf_counter()
+        func(names)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000, help='number of filenames')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    names = generate_names(args.count, seed=args.seed)
+
+    expected = [legacy_parse(name) for name in names]
+    clear_caches()
+    actual = renamer.parse_many(names)
+    mismatches = [(n, e, a) for n, e, a in zip(names, expected, actual) if e != a]
+
+    results = {
+        'count': len(names),
+        'unique': len(set(names)),
+        'mismatches': len(mismatches),
+        'legacy_us_per_file': timed(lambda b: [legacy_parse(n) for n in b], names, args.repeat),
+        'engine_us_per_file': timed(renamer.parse_many, names, args.repeat),
+        'engine_warm_us_per_file': timed(renamer.parse_many, names, args.repeat, warm=True),
+    }
+    for key in ('legacy_us_per_file', 'engine_us_per_file', 'engine_warm_us_per_file'):
+        results[key] = round(results[key] / len(names) * 1e6, 3)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{results['count']} names ({results['unique']} unique)")
+        print(f"  legacy parser:        {results['legacy_us_per_file']:8.3f} us/file")
+        print(f"  engine, cold memo:    {results['engine_us_per_file']:8.3f} us/file")
+        print(f"  engine, warm memo:    {results['engine_warm_us_per_file']:8.3f} us/file")
+        print(f"  mismatches:           {results['mismatches']}")
+        for name, want, got in mismatches[:5]:
+            print(f'    {name!r}: {want} != {got}')
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Candidate ranking benchmark
+
+Times scoring of file/candidate pairs with the original per-pair
+SequenceMatcher scorer and with the batch Ranker. Each search hides the
+file's real title and year among look-alike candidates, and the accuracy
+of both at picking it is reported.
+
+    python benchmarks/bench_ranking.py --pairs 50000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ranking, renamer
+from benchmarks.names import SHOWS, TITLES, generate_names
+
+EXTRA_TITLES = [
+    'The Matrix Reloaded', 'Inception: The Cobol Job', 'Blade Runner 2049', 'The Dark Knight Rises',
+    'Aliens', 'Alien 3', 'Mad Max', 'Mad Max 2', 'Moonlight', 'Drive My Car', 'Her Smell',
+    'Old Boy', 'Zodiac Killer', 'Sicario: Day of the Soldado', 'Amelie from Montmartre',
+    'Breaking Away', 'The Wire Room', 'Dark Matter', 'Fargo (1996)', 'Twin Peaks: Fire Walk with Me',
+]
+
+
+# Original implementation, kept verbatim as the baseline
+
+def legacy_normalize_title(title):
+    """Lowercase a title and reduce it to words, for comparisons."""
+    return ' '.join(re.findall(r'\w+', (title or '').casefold()))
+
+
+def legacy_score_candidate(query, year, title, candidate_year):
+    """
+    Score how well a search result matches what was parsed from a filename.
+    Returns confidence between 0 and 1.
+    """
+    score = SequenceMatcher(None, legacy_normalize_title(query), legacy_normalize_title(title)).ratio()
+
+    if year and candidate_year:
+        distance = abs(int(year) - int(candidate_year))
+        score *= 1.0 if distance == 0 else 0.9 if distance == 1 else 0.6
+
+    return round(score, 3)
+
+
+def generate_searches(pairs, per_search, seed):
+    """
+    Build searches of per_search candidates each from parsed synthetic
+    filenames, as (query, year, results, answer) tuples where answer is
+    the index of the real title in results.
+    """
+    rng = random.Random(seed)
+    pool = TITLES + SHOWS + EXTRA_TITLES
+    titles = {legacy_normalize_title(title): title for title in TITLES + SHOWS}
+    searches = []
+
+    for name in generate_names(pairs // per_search * 2, seed=seed):
+        file_type, info = renamer.parse_filename(name)
+        if file_type == 'movie':
+            query, year = info['name'], info.get('year')
+        elif file_type == 'tv':
+            query, year = info['show_name'], None
+        else:
+            continue
+        real_title = titles.get(legacy_normalize_title(query))
+        if real_title is None:
+            continue
+
+        results = []
+        for _ in range(per_search - 1):
+            title = rng.choice(pool)
+            # Remakes share the title but not the year
+            if title == real_title and year:
+                release = f'{int(year) + rng.choice([-30, -20, 20])}-01-01'
+            else:
+                release = f'{rng.randint(1950, 2024)}-01-01' if rng.random() < 0.9 else ''
+            results.append({'title': title, 'release_date': release,
+                            'popularity': round(rng.expovariate(0.05), 3)})
+
+        answer = rng.randrange(per_search)
+        results.insert(answer, {'title': real_title, 'release_date': f'{year}-06-01' if year else '',
+                                'popularity': round(rng.expovariate(0.05), 3)})
+        searches.append((query, year, results, answer))
+        if len(searches) * per_search >= pairs:
+            break
+
+    return searches
+
+
+def legacy_rank(searches):
+    best = []
+    for query, year, results, _ in searches:
+        scores = [legacy_score_candidate(query, year, r['title'], ranking.year_of(r['release_date'])) for r in results]
+        best.append(max(range(len(results)), key=scores.__getitem__))
+    return best
+
+
+def ranker_rank(ranker, searches):
+    ranked = ranker.rank_batch([(q, y, results, 'title', 'release_date') for q, y, results, _ in searches])
+    return [results.index(r[0][1]) for (_, _, results, _), r in zip(searches, ranked)]
+
+
+def accuracy(searches, picks):
+    return round(sum(pick == answer for (_, _, _, answer), pick in zip(searches, picks)) / len(searches), 3)
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=50000, help='number of file/candidate pairs')
+    parser.add_argument('--per-search', type=int, default=10, help='candidates per search')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    searches = generate_searches(args.pairs, args.per_search, args.seed)
+    pairs = sum(len(results) for _, _, results, _ in searches)
+
+    legacy_best = legacy_rank(searches)
+    ranker_best = ranker_rank(ranking.Ranker(), searches)
+    warm_ranker = ranking.Ranker()
+    ranker_rank(warm_ranker, searches)
+
+    results = {
+        'pairs': pairs,
+        'searches': len(searches),
+        'legacy_accuracy': accuracy(searches, legacy_best),
+        'ranker_accuracy': accuracy(searches, ranker_best),
+        'legacy_pairs_per_s': pairs / timed(lambda: legacy_rank(searches), args.repeat),
+        'ranker_pairs_per_s': pairs / timed(lambda: ranker_rank(ranking.Ranker(), searches), args.repeat),
+        'ranker_warm_pairs_per_s': pairs / timed(lambda: ranker_rank(warm_ranker, searches), args.repeat),
+    }
+    for key in ('legacy_pairs_per_s', 'ranker_pairs_per_s', 'ranker_warm_pairs_per_s'):
+        results[key] = round(results[key])
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{results['pairs']} pairs in {results['searches']} searches")
+        print(f"  legacy scorer:        {results['legacy_pairs_per_s']:10d} pairs/s")
+        print(f"  ranker, cold memo:    {results['ranker_pairs_per_s']:10d} pairs/s")
+        print(f"  ranker, warm memo:    {results['ranker_warm_pairs_per_s']:10d} pairs/s")
+        print(f"  legacy accuracy:      {results['legacy_accuracy']:10.1%}")
+        print(f"  ranker accuracy:      {results['ranker_accuracy']:10.1%}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Scan result memory and payload benchmark
+
+Builds the file info dicts a scan of a nested synthetic library would
+produce (no files are created) and compares holding them as a list of
+dicts against ScanColumns, and the /api/scan JSON payload as a list of
+objects against the columnar format, raw and gzipped.
+
+    python benchmarks/bench_scan_memory.py --count 500000
+"""
+
+import argparse
+import gc
+import gzip
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import renamer
+from app.scan_columns import ScanColumns
+from benchmarks.generate_tree import _nested_file
+
+ROOT = '/media/library'
+
+
+def generate_paths(count, seed):
+    rng = random.Random(seed)
+    kinds = ['movie', 'tv', 'music']
+    return [
+        os.path.join(ROOT, *_nested_file(rng, rng.choices(kinds, weights=(0.3, 0.5, 0.2))[0]))
+        for _ in range(count)
+    ]
+
+
+def iter_file_infos(paths):
+    for path in paths:
+        file_info = renamer.build_file_info(os.path.basename(path), path)
+        if file_info:
+            yield file_info
+
+
+def measure(build):
+    """Return (result, bytes allocated by build that are still held)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000, help='number of scanned files')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    paths = generate_paths(args.count, args.seed)
+    # Fill the parse memo first, so neither measurement includes it
+    for _ in iter_file_infos(paths):
+        pass
+
+    dicts, dicts_bytes = measure(lambda: list(iter_file_infos(paths)))
+    columns, columns_bytes = measure(lambda: ScanColumns(iter_file_infos(paths)))
+    if list(columns) != dicts:
+        print('ScanColumns rows differ from the scanned dicts', file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    rows_json = json.dumps({'files': dicts, 'count': len(dicts)}, separators=(',', ':')).encode()
+    rows_s = time.perf_counter() - start
+    start = time.perf_counter()
+    columnar_json = json.dumps(columns.to_json(), separators=(',', ':')).encode()
+    columnar_s = time.perf_counter() - start
+
+    results = {
+        'files': len(dicts),
+        'dicts_bytes_per_file': round(dicts_bytes / len(dicts), 1),
+        'columns_bytes_per_file': round(columns_bytes / len(dicts), 1),
+        'rows_payload_bytes': len(rows_json),
+        'columnar_payload_bytes': len(columnar_json),
+        'rows_gzip_bytes': len(gzip.compress(rows_json, 6)),
+        'columnar_gzip_bytes': len(gzip.compress(columnar_json, 6)),
+        'rows_encode_s': round(rows_s, 3),
+        'columnar_encode_s': round(columnar_s, 3),
+    }
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        mb = 1024 * 1024
+        print(f"{results['files']} scanned files")
+        print(f"  memory, list of dicts:  {results['dicts_bytes_per_file']:8.1f} bytes/file")
+        print(f"  memory, ScanColumns:    {results['columns_bytes_per_file']:8.1f} bytes/file")
+        print(f"  payload, rows:          {results['rows_payload_bytes'] / mb:8.2f} MB "
+              f"({results['rows_gzip_bytes'] / mb:.2f} MB gzipped, encoded in {results['rows_encode_s']}s)")
+        print(f"  payload, columnar:      {results['columnar_payload_bytes'] / mb:8.2f} MB "
+              f"({results['columnar_gzip_bytes'] / mb:.2f} MB gzipped, encoded in {results['columnar_encode_s']}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
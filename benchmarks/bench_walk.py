@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Network filesystem scan benchmark
+
+Times serial and concurrent scans of a generated library with a
+simulated round-trip delay added to every directory listing and stat, as
+on NFS/SMB mounts, with and without the scan index, and checks that the
+concurrent walk yields exactly what the serial one does.
+
+    python benchmarks/bench_walk.py --count 5000 --rtt 0.002 --workers 16
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import renamer, walker
+from app.scan_index import ScanIndex
+from benchmarks.generate_tree import LAYOUTS, generate_tree
+
+
+class SlowEntry:
+    """A DirEntry whose stat() costs a round trip."""
+
+    def __init__(self, entry, rtt):
+        self._entry = entry
+        self._rtt = rtt
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_file(self, follow_symlinks=True):
+        return self._entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_dir(self, follow_symlinks=True):
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def stat(self, follow_symlinks=True):
+        time.sleep(self._rtt)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+
+class SlowScandir:
+    def __init__(self, path, rtt):
+        time.sleep(rtt)
+        self._it = REAL_SCANDIR(path)
+        self._rtt = rtt
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._it.close()
+
+    def __iter__(self):
+        return (SlowEntry(entry, self._rtt) for entry in self._it)
+
+
+REAL_SCANDIR = os.scandir
+REAL_STAT = os.stat
+
+
+def simulate_latency(rtt):
+    """Add rtt seconds to every os.scandir, os.stat and DirEntry.stat call."""
+    def slow_stat(path, *args, **kwargs):
+        time.sleep(rtt)
+        return REAL_STAT(path, *args, **kwargs)
+
+    os.scandir = lambda path='.': SlowScandir(path, rtt)
+    os.stat = slow_stat
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=5000, help='files in the generated library')
+    parser.add_argument('--layout', choices=LAYOUTS, default='nested')
+    parser.add_argument('--rtt', type=float, default=0.002, help='simulated round trip in seconds')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--per-mount', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='media-renamer-walk-')
+    try:
+        tree = os.path.join(workdir, 'library')
+        generated = generate_tree(tree, args.count, args.layout, args.seed)
+        simulate_latency(args.rtt)
+        concurrent = walker.ConcurrentWalker(workers=args.workers, per_mount=args.per_mount)
+
+        results = {'files': generated['files'], 'directories': generated['directories'], 'rtt': args.rtt,
+                   'workers': args.workers}
+        serial_files, results['serial_s'] = timed(lambda: renamer.scan_directory(tree, recursive=True))
+        concurrent_files, results['concurrent_s'] = timed(
+            lambda: renamer.scan_directory(tree, recursive=True, walker=concurrent))
+        mismatches = int(serial_files != concurrent_files)
+
+        # The scan index: a first scan lists everything, a re-scan only stats directories
+        for name, scan_walker in (('serial', None), ('concurrent', concurrent)):
+            db_path = os.path.join(workdir, f'{name}.db')
+            for run in ('cold', 'warm'):
+                with ScanIndex(db_path) as index:
+                    files, seconds = timed(
+                        lambda index=index, scan_walker=scan_walker:
+                        list(index.iter_media_files(tree, 'auto', True, scan_walker)))
+                results[f'index_{run}_{name}_s'] = seconds
+                mismatches += int(files != serial_files)
+
+        results['mismatches'] = mismatches
+        for key in list(results):
+            if key.endswith('_s'):
+                results[key] = round(results[key], 3)
+    finally:
+        os.scandir, os.stat = REAL_SCANDIR, REAL_STAT
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{results['files']} files in {results['directories']} directories, "
+              f"{args.rtt * 1000:g}ms per round trip, {args.workers} workers")
+        print(f"  scan_directory:     serial {results['serial_s']:8.3f}s   concurrent {results['concurrent_s']:8.3f}s")
+        for run in ('cold', 'warm'):
+            print(f"  index, {run}:        serial {results[f'index_{run}_serial_s']:8.3f}s   "
+                  f"concurrent {results[f'index_{run}_concurrent_s']:8.3f}s")
+        print(f"  mismatches:         {results['mismatches']}")
+
+    return 1 if results['mismatches'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
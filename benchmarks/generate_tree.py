@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Synthetic media library generator
+
+Creates a tree of empty files with scene-style names for movies, TV
+episodes and music tracks, either all in one directory or nested the way
+libraries usually are:
+
+    flat:    ROOT/<file>
+    nested:  ROOT/Movies/<Title> (<Year>)/<file>
+             ROOT/TV/<Show>/Season NN/<file>
+             ROOT/Music/<Artist>/<Album>/<file>
+
+    python benchmarks/generate_tree.py /tmp/library --count 100000 --layout nested
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.names import (
+    ARTISTS,
+    SHOWS,
+    TITLES,
+    episode_name,
+    movie_name,
+    track_name,
+)
+
+LAYOUTS = ('flat', 'nested')
+ALBUMS = ['Greatest Hits', 'Live', 'Debut', 'Sessions', 'Rarities', 'Remasters']
+
+
+def _nested_file(rng, kind):
+    """Return (relative directory, filename) for one file of a nested library."""
+    if kind == 'movie':
+        title = rng.choice(TITLES)
+        year = rng.randint(1950, 2024)
+        name = movie_name(rng, title=title, year=year)
+        return os.path.join('Movies', f'{title} ({year})'), name
+    if kind == 'tv':
+        show = rng.choice(SHOWS)
+        season = rng.randint(1, 12)
+        name = episode_name(rng, show=show, season=season)
+        return os.path.join('TV', show, f'Season {season:02d}'), name
+    artist = rng.choice(ARTISTS)
+    return os.path.join('Music', artist, rng.choice(ALBUMS)), track_name(rng, artist=artist)
+
+
+def generate_tree(root, count, layout='nested', seed=0, mix=(0.3, 0.5, 0.2)):
+    """
+    Create `count` empty media files under root, mixing movies, episodes
+    and tracks in the given proportions. Names that come up twice in the
+    same directory get a numeric suffix so every file is distinct.
+    Returns {'files', 'directories'}.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f'Unknown layout: {layout}')
+
+    rng = random.Random(seed)
+    makers = {'movie': movie_name, 'tv': episode_name, 'music': track_name}
+    kinds = list(makers)
+    directories = set()
+    seen = set()
+
+    for _ in range(count):
+        kind = rng.choices(kinds, weights=mix)[0]
+        if layout == 'flat':
+            directory, name = root, makers[kind](rng)
+        else:
+            relative, name = _nested_file(rng, kind)
+            directory = os.path.join(root, relative)
+
+        if directory not in directories:
+            os.makedirs(directory, exist_ok=True)
+            directories.add(directory)
+
+        path = os.path.join(directory, name)
+        if path in seen:
+            base, ext = os.path.splitext(name)
+            n = 2
+            while f'{os.path.join(directory, base)} ({n}){ext}' in seen:
+                n += 1
+            path = f'{os.path.join(directory, base)} ({n}){ext}'
+        seen.add(path)
+
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o644))
+
+    return {'files': len(seen), 'directories': len(directories)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('root', help='directory to create the library in')
+    parser.add_argument('--count', type=int, default=10000, help='number of files (10k-1M is typical)')
+    parser.add_argument('--layout', choices=LAYOUTS, default='nested')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mix', default='0.3,0.5,0.2', help='movie,tv,music proportions')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    mix = tuple(float(p) for p in args.mix.split(','))
+    if len(mix) != 3:
+        parser.error('--mix takes three proportions')
+
+    started = time.perf_counter()
+    results = generate_tree(args.root, args.count, args.layout, args.seed, mix)
+    results['seconds'] = round(time.perf_counter() - started, 3)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{results['files']} files in {results['directories']} directories "
+              f"under {args.root} ({results['seconds']}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Mock TMDB and MusicBrainz server
+
+Answers the API endpoints used by TMDBClient and MusicBrainzClient with
+made-up but stable results, after a configurable delay, and turns away a
+share of requests with 429 Too Many Requests. Point the app at it with
+
+    TMDB_BASE_URL=http://127.0.0.1:8765/3
+    MUSICBRAINZ_BASE_URL=http://127.0.0.1:8765/ws/2
+
+    python benchmarks/mock_server.py --port 8765 --latency 0.05 --rate-429 0.02
+
+Searches return the query's own title among look-alikes, so matching
+against the mock behaves much like matching against the real APIs.
+Request counts are served as JSON at /stats.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.names import ARTISTS
+
+SEASON_RE = re.compile(r'^/3/tv/(\d+)/season/(\d+)$')
+EPISODE_RE = re.compile(r'^/3/tv/(\d+)/season/(\d+)/episode/(\d+)$')
+
+# Look-alike titles added to every search, as real searches return
+LOOKALIKES = ('{} II', 'The {} Story', 'Return to {}', '{}: The Beginning')
+
+
+def stable_id(*parts):
+    """A positive id that is the same for the same parts on every run."""
+    return zlib.crc32('\0'.join(map(str, parts)).lower().encode()) & 0x7fffffff
+
+
+def _year(*parts):
+    return 1950 + stable_id('year', *parts) % 75
+
+
+def _popularity(*parts):
+    return round((stable_id('popularity', *parts) % 10000) / 100, 2)
+
+
+def search_movie(query, year=None):
+    year = int(year) if year and str(year).isdigit() else _year(query)
+    titles = [query] + [pattern.format(query) for pattern in LOOKALIKES]
+    results = [
+        {'id': stable_id('movie', title), 'title': title, 'original_title': title,
+         'release_date': f'{year if i == 0 else _year(title)}-06-01',
+         'popularity': _popularity(title), 'overview': ''}
+        for i, title in enumerate(titles)
+    ]
+    return {'page': 1, 'results': results, 'total_results': len(results), 'total_pages': 1}
+
+
+def search_tv(query):
+    titles = [query] + [pattern.format(query) for pattern in LOOKALIKES]
+    results = [
+        {'id': stable_id('tv', title), 'name': title, 'original_name': title,
+         'first_air_date': f'{_year(title)}-01-15', 'popularity': _popularity(title), 'overview': ''}
+        for title in titles
+    ]
+    return {'page': 1, 'results': results, 'total_results': len(results), 'total_pages': 1}
+
+
+def season(show_id, number):
+    episodes = [
+        {'episode_number': n, 'season_number': number, 'name': f'Episode {n} of Show {show_id}'}
+        for n in range(1, 25)
+    ]
+    return {'season_number': number, 'episodes': episodes}
+
+
+def search_recording(query):
+    artist = next((a for a in ARTISTS if query.lower().startswith(a.lower())), query.split(' ')[0])
+    title = query[len(artist):].strip() or query
+    recordings = [
+        {'id': f'{stable_id("recording", artist, title, n):08x}-mock', 'score': 100 - n * 10,
+         'title': title if n == 0 else f'{title} ({kind})',
+         'artist-credit': [{'name': artist}]}
+        for n, kind in enumerate(('', 'Live', 'Remix', 'Demo', 'Edit'))
+    ]
+    return {'created': '2000-01-01T00:00:00Z', 'count': len(recordings), 'offset': 0,
+            'recordings': recordings}
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    The mock API server. latency is the mean delay in seconds before each
+    response, spread by +/- jitter; rate_429 is the share of requests
+    answered with 429 and a Retry-After of retry_after seconds.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, jitter=0.0, rate_429=0.0,
+                 retry_after=0, seed=0):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'by_endpoint': {}}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def tmdb_url(self):
+        return f'{self.url}/3'
+
+    @property
+    def musicbrainz_url(self):
+        return f'{self.url}/ws/2'
+
+    def start(self):
+        """Serve on a background thread. Returns the server."""
+        threading.Thread(target=self.serve_forever, name='mock-api', daemon=True).start()
+        return self
+
+    def count(self, endpoint, throttled):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            self.stats['throttled'] += throttled
+            by_endpoint = self.stats['by_endpoint']
+            by_endpoint[endpoint] = by_endpoint.get(endpoint, 0) + 1
+
+    def draw(self):
+        """Return (delay, throttled) for one request."""
+        with self.stats_lock:
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            return delay, self.rng.random() < self.rate_429
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, path, params):
+        """Return (endpoint name, response body) or (None, None) for an unknown path."""
+        query = params.get('query', '')
+        if path == '/3/search/movie':
+            return 'tmdb_search_movie', search_movie(query, params.get('year'))
+        if path == '/3/search/tv':
+            return 'tmdb_search_tv', search_tv(query)
+        match = SEASON_RE.match(path)
+        if match:
+            return 'tmdb_season', season(int(match.group(1)), int(match.group(2)))
+        match = EPISODE_RE.match(path)
+        if match:
+            show_id, number, episode = map(int, match.groups())
+            return 'tmdb_episode', {'episode_number': episode, 'season_number': number,
+                                    'name': f'Episode {episode} of Show {show_id}'}
+        if path == '/ws/2/recording':
+            return 'musicbrainz_recording', search_recording(query)
+        return None, None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/stats':
+            with self.server.stats_lock:
+                return self._send(200, self.server.stats)
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint, body = self._route(url.path, params)
+        if endpoint is None:
+            return self._send(404, {'status_message': 'The resource you requested could not be found.'})
+
+        delay, throttled = self.server.draw()
+        if delay:
+            time.sleep(delay)
+        self.server.count(endpoint, throttled)
+        if throttled:
+            return self._send(429, {'status_message': 'Too many requests'},
+                              [('Retry-After', str(self.server.retry_after))])
+        self._send(200, body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='mean response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='delay spread in seconds')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), args.latency, args.jitter, args.rate_429,
+                        args.retry_after, args.seed)
+    print(f'TMDB_BASE_URL={server.tmdb_url}')
+    print(f'MUSICBRAINZ_BASE_URL={server.musicbrainz_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Synthetic scene-style media filenames for benchmarks
+"""
+
+import random
+
+TITLES = [
+    'The Matrix', 'Inception', 'Blade Runner', 'The Dark Knight', 'Heat',
+    'Alien', 'Arrival', 'Parasite', 'Spirited Away', 'Mad Max Fury Road',
+    'No Country for Old Men', 'The Social Network', 'Amelie', 'Oldboy',
+    'Children of Men', 'Zodiac', 'Moon', 'Drive', 'Her', 'Sicario',
+]
+SHOWS = [
+    'Breaking Bad', 'The Wire', 'Better Call Saul', 'The Office US',
+    'Doctor Who 2005', 'Game of Thrones', 'The Expanse', 'Dark',
+    'Stranger Things', 'Mr Robot', 'Fargo', 'Severance', 'The Americans',
+    'Battlestar Galactica', 'Twin Peaks', 'Succession',
+]
+ARTISTS = [
+    'Queen', 'Led Zeppelin', 'Radiohead', 'Daft Punk', 'Bjork',
+    'Miles Davis', 'Pink Floyd', 'Massive Attack', 'Portishead', 'Boards of Canada',
+]
+TRACKS = [
+    'Bohemian Rhapsody', 'Stairway to Heaven', 'Paranoid Android',
+    'Around the World', 'Hyperballad', 'So What', 'Time', 'Teardrop',
+    'Glory Box', 'Roygbiv',
+]
+RESOLUTIONS = ['720p', '1080p', '2160p', '4K', '']
+SOURCES = ['BluRay', 'BRRip', 'WEBRip', 'WEB-DL', 'HDTV', 'DVDRip', '']
+CODECS = ['x264', 'x265', 'H264', 'HEVC', 'XviD', '']
+AUDIO = ['AAC', 'AC3', 'DTS', '5.1', '']
+EXTRAS = ['PROPER', 'REPACK', 'EXTENDED', 'UNRATED', 'REMASTERED', '', '', '']
+GROUPS = ['YIFY', 'RARBG', 'SPARKS', 'FGT', 'CtrlHD', 'NTb', 'LOL', 'DIMENSION',
+          'KILLERS', 'FLEET', 'EZTV', 'aXXo']
+VIDEO_EXTENSIONS = ['mkv', 'mp4', 'avi', 'm4v']
+AUDIO_EXTENSIONS = ['mp3', 'flac', 'm4a', 'ogg']
+AUDIO_TAGS = ['320kbps', 'FLAC', 'V0', '[Remastered]', '(Live)', '']
+
+
+def _join(rng, words):
+    separator = rng.choice(['.', '.', ' ', '_'])
+    return separator.join(w.replace(' ', separator) for w in words if w)
+
+
+def movie_name(rng, title=None, year=None):
+    """Return a scene-style movie filename."""
+    year = str(year or rng.randint(1950, 2024))
+    words = [title or rng.choice(TITLES), year, rng.choice(EXTRAS), rng.choice(RESOLUTIONS),
+             rng.choice(SOURCES), rng.choice(CODECS), rng.choice(AUDIO)]
+    return f'{_join(rng, words)}-{rng.choice(GROUPS)}.{rng.choice(VIDEO_EXTENSIONS)}'
+
+
+def episode_name(rng, show=None, season=None, episode=None):
+    """Return a scene-style TV episode filename."""
+    show = show or rng.choice(SHOWS)
+    season = season or rng.randint(1, 12)
+    episode = episode or rng.randint(1, 24)
+    marker = rng.choice([
+        f'S{season:02d}E{episode:02d}',
+        f's{season:02d}e{episode:02d}',
+        f'{season}x{episode:02d}',
+    ])
+    words = [show, marker, rng.choice(RESOLUTIONS), rng.choice(SOURCES), rng.choice(CODECS)]
+    return f'{_join(rng, words)}-{rng.choice(GROUPS)}.{rng.choice(VIDEO_EXTENSIONS)}'
+
+
+def track_name(rng, artist=None, number=None):
+    """Return a music track filename."""
+    artist = artist or rng.choice(ARTISTS)
+    number = number or rng.randint(1, 20)
+    tag = rng.choice(AUDIO_TAGS)
+    return f'{number:02d} - {artist} - {rng.choice(TRACKS)} {tag}'.strip() + f'.{rng.choice(AUDIO_EXTENSIONS)}'
+
+
+def generate_names(count, seed=0, mix=(0.3, 0.5, 0.2)):
+    """
+    Return a list of `count` filenames, mixing movies, episodes and tracks
+    in the given proportions.
+    """
+    rng = random.Random(seed)
+    makers = [movie_name, episode_name, track_name]
+    return [rng.choices(makers, weights=mix)[0](rng) for _ in range(count)]
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite
+
+Generates a synthetic library, starts the mock metadata server and times
+filename parsing, scan_directory, /api/scan (with and without the scan
+index), auto-matching a whole library through /api/match/jobs and
+/api/batch/rename, all in a throwaway DATA_DIR. Results are written as
+JSON so runs on different versions can be compared.
+
+    python benchmarks/run.py --count 20000 --latency 0.02 --rate-429 0.01 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generate_tree import LAYOUTS, generate_tree
+from benchmarks.mock_server import MockServer
+
+
+def environment():
+    """Describe what the benchmark ran on, so results can be compared fairly."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10, check=False).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def best_of(func, repeat, before=None):
+    """Best wall time of `repeat` calls of func, calling before (untimed) ahead of each."""
+    best = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def timed(func):
+    """Return (result, seconds) of one call."""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+
+def bench_parse(renamer, names, repeat):
+    seconds = best_of(lambda: renamer.parse_many(names), repeat,
+                      before=renamer._parse_filename_cached.cache_clear)
+    return {'files': len(names), 'seconds': round(seconds, 4),
+            'us_per_file': round(seconds / len(names) * 1e6, 3)}
+
+
+def bench_scan_directory(renamer, tree, repeat):
+    files = []
+    seconds = best_of(lambda: files.append(len(renamer.scan_directory(tree, recursive=True))), repeat,
+                      before=renamer._parse_filename_cached.cache_clear)
+    return {'files': files[-1], 'seconds': round(seconds, 4), 'files_per_s': rate(files[-1], seconds)}
+
+
+def bench_api_scan(client, tree):
+    results = {}
+    runs = [
+        ('no_index', {'incremental': False}),
+        ('index_cold', {}),
+        ('index_warm', {}),
+        ('stream', {'stream': True}),
+    ]
+    for name, options in runs:
+        def scan(options=options):
+            # Reading the body inside the timing, as streamed scans run while it is read
+            response = client.post('/api/scan', json={'directory': tree, 'recursive': True, **options})
+            return response, response.get_data()
+
+        (response, body), seconds = timed(scan)
+        count = body.count(b'\n') if options.get('stream') else response.get_json()['count']
+        results[name] = {'status': response.status_code, 'files': count, 'seconds': round(seconds, 4),
+                         'files_per_s': rate(count, seconds), 'bytes': len(body)}
+    return results
+
+
+def bench_match(client, tree, server, timeout):
+    before = dict(server.stats)
+    start = time.perf_counter()
+    response = client.post('/api/match/jobs', json={'directory': tree, 'recursive': True})
+    job = response.get_json()
+    if response.status_code != 202:
+        raise RuntimeError(f'Match job failed to start: {job}')
+
+    while job['status'] in ('queued', 'running'):
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError(f'Match job still {job["status"]} after {timeout}s')
+        time.sleep(0.05)
+        job = client.get(f"/api/match/jobs/{job['id']}").get_json()
+    seconds = time.perf_counter() - start
+
+    plan = job.get('plan') or []
+    return job, {
+        'status': job['status'],
+        'files': len(plan),
+        'matched': sum(1 for e in plan if e['status'] == 'matched'),
+        'accepted': sum(1 for e in plan if e.get('accepted')),
+        'seconds': round(seconds, 4),
+        'files_per_s': rate(len(plan), seconds),
+        'upstream_requests': server.stats['requests'] - before['requests'],
+        'upstream_throttled': server.stats['throttled'] - before['throttled'],
+    }
+
+
+def bench_batch_rename(client, job):
+    matched = [e for e in job.get('plan') or [] if e['status'] == 'matched']
+    results = {}
+    for name, payload in [
+        ('dry_run', {'files': matched, 'dry_run': True}),
+        ('accepted_dry_run', {'job_id': job['id'], 'dry_run': True}),
+        ('rename', {'files': matched}),
+    ]:
+        response, seconds = timed(lambda payload=payload: client.post('/api/batch/rename', json=payload))
+        body = response.get_json()
+        results[name] = {'status': response.status_code, 'files': body.get('total'),
+                         'succeeded': body.get('success_count'), 'seconds': round(seconds, 4),
+                         'files_per_s': rate(body.get('total') or 0, seconds)}
+    return results
+
+
+def run(args, workdir):
+    tree = args.tree or os.path.join(workdir, 'library')
+    data_dir = os.path.join(workdir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+
+    results = {'config': vars(args).copy(), 'environment': environment()}
+    if not args.tree:
+        generated, seconds = timed(lambda: generate_tree(tree, args.count, args.layout, args.seed))
+        results['generate'] = {**generated, 'seconds': round(seconds, 3)}
+
+    server = MockServer(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+                        retry_after=args.retry_after, seed=args.seed).start()
+
+    os.environ.update({
+        'MEDIA_DIR': tree,
+        'DATA_DIR': data_dir,
+        'TMDB_API_KEY': 'benchmark',
+        'TMDB_BASE_URL': server.tmdb_url,
+        'MUSICBRAINZ_BASE_URL': server.musicbrainz_url,
+        'MUSICBRAINZ_RATE': str(args.musicbrainz_rate),
+        'WATCH_ENABLED': 'false',
+    })
+
+    from app import create_app, renamer
+
+    app = create_app()
+    client = app.test_client()
+
+    names = [name for _, _, files in os.walk(tree) for name in files]
+    results['parse'] = bench_parse(renamer, names, args.repeat)
+    results['scan_directory'] = bench_scan_directory(renamer, tree, args.repeat)
+    results['api_scan'] = bench_api_scan(client, tree)
+    if not args.skip_match:
+        job, results['match'] = bench_match(client, tree, server, args.match_timeout)
+        if not args.tree:
+            # Renames only ever touch a generated tree
+            results['batch_rename'] = bench_batch_rename(client, job)
+
+    server.shutdown()
+    server.server_close()
+    return results
+
+
+def summary(results):
+    lines = [f"commit {results['environment']['commit']}, Python {results['environment']['python']}"]
+    if 'generate' in results:
+        g = results['generate']
+        lines.append(f"generated {g['files']} files in {g['directories']} directories ({g['seconds']}s)")
+    lines.append(f"parse:                  {results['parse']['us_per_file']:10.3f} us/file")
+    lines.append(f"scan_directory:         {results['scan_directory']['files_per_s']:10.1f} files/s")
+    for name, r in results['api_scan'].items():
+        lines.append(f"/api/scan {name + ':':13s}{r['files_per_s']:10.1f} files/s  ({r['bytes']} bytes)")
+    if 'match' in results:
+        m = results['match']
+        lines.append(f"match:                  {m['files_per_s']:10.1f} files/s  ({m['matched']}/{m['files']} "
+                     f"matched, {m['accepted']} accepted, {m['upstream_requests']} upstream requests, "
+                     f"{m['upstream_throttled']} throttled)")
+    for name, r in results.get('batch_rename', {}).items():
+        lines.append(f"/api/batch/rename {name + ':':17s}{r['files_per_s']:10.1f} files/s  "
+                     f"({r['succeeded']}/{r['files']})")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000, help='files in the generated library')
+    parser.add_argument('--layout', choices=LAYOUTS, default='nested')
+    parser.add_argument('--tree', help='benchmark an existing library instead (it is never renamed)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of the in-process timings')
+    parser.add_argument('--latency', type=float, default=0.02, help='mock API mean response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='mock API delay spread in seconds')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='share of mock API requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--musicbrainz-rate', type=float, default=50.0,
+                        help='MusicBrainz requests per second allowed (the real API allows 1)')
+    parser.add_argument('--match-timeout', type=float, default=600)
+    parser.add_argument('--skip-match', action='store_true', help='only time parsing and scanning')
+    parser.add_argument('--workdir', help='keep the library and DATA_DIR here instead of a temp directory')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='media-renamer-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = run(args, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results) if args.json else summary(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""
+Media Renamer - Gunicorn Settings
+Worker model chosen from the environment: threads (default) or gevent
+"""
+
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WORKERS', 2))
+
+# threads: each worker serves THREADS requests at once, and a request
+# waiting on TMDB or MusicBrainz holds one of them for the whole wait.
+# gevent: each request is a greenlet and network waits (including rate
+# limiter sleeps) yield to the others, so a worker can hold up to
+# WORKER_CONNECTIONS requests, most of them waiting on upstream APIs.
+# Upstream concurrency per host is still capped by UPSTREAM_CONCURRENCY.
+# Filesystem and SQLite work (scans, listings, copies) is handed to real
+# threads in gevent mode, BLOCKING_THREADS per worker, so it does not
+# stall the worker's other greenlets.
+async_mode = os.environ.get('ASYNC_MODE', 'threads').lower()
+
+if async_mode == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+elif async_mode == 'threads':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('THREADS', 4))
+else:
+    raise ValueError(f'ASYNC_MODE must be "threads" or "gevent", not {async_mode!r}')
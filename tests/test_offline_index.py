@@ -0,0 +1,91 @@
+"""
+Offline TMDB index built from the sample exports in benchmarks/fixtures
+"""
+
+import os
+
+import pytest
+
+from app import offline_index
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures')
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp('offline') / 'tmdb_index.db')
+    exports = [
+        ('movie', os.path.join(FIXTURES, 'movie_ids_sample.json.gz')),
+        ('tv', os.path.join(FIXTURES, 'tv_series_ids_sample.json.gz'))
+    ]
+    counts = offline_index.build_index(db_path, exports)
+    assert counts['movie'] > 0 and counts['tv'] > 0
+    return offline_index.OfflineIndex(db_path)
+
+
+def search(index, kind, query, year=None):
+    results = index.search(kind, query, year)
+    return results, offline_index.is_confident(kind, results, query, year)
+
+
+@pytest.mark.parametrize('kind, query, title', [
+    ('movie', 'Fight Club', 'Fight Club'),
+    ('movie', 'the matrix', 'The Matrix'),
+    ('tv', 'Breaking Bad', 'Breaking Bad'),
+])
+def test_exact_title_is_confident(index, kind, query, title):
+    results, confident = search(index, kind, query)
+    assert results[0][offline_index.KINDS[kind][2]] == title
+    assert results[0]['match_score'] == 1.0
+    assert confident
+
+
+def test_close_title_with_year_is_confident(index):
+    results, confident = search(index, 'movie', 'Fight Clubb', 1999)
+    assert results[0]['title'] == 'Fight Club'
+    assert confident
+
+
+def test_close_title_without_year_is_not_confident(index):
+    results, confident = search(index, 'movie', 'Fight Clubb')
+    assert results[0]['title'] == 'Fight Club'
+    assert not confident
+
+
+def test_unknown_title_is_a_miss(index):
+    results, confident = search(index, 'movie', 'Zzyzx Qwerty')
+    assert results == []
+    assert not confident
+
+
+@pytest.mark.parametrize('kind, query, year', [
+    ('movie', 'The Lion King', None),
+    ('movie', 'The Lion King', 1994),
+    ('tv', 'The Office', None),
+])
+def test_shared_title_is_not_confident(index, kind, query, year):
+    # Remakes share a title and the exports carry no dates to tell them apart
+    results, confident = search(index, kind, query, year)
+    title_key = offline_index.KINDS[kind][2]
+    norm = offline_index.normalize(query)
+    assert sum(1 for result in results if offline_index.normalize(result[title_key]) == norm) > 1
+    assert not confident
+
+
+def test_shared_title_with_one_dated_match_is_confident():
+    results = [
+        {'id': 2, 'title': 'Dune', 'release_date': '2021-09-15', 'match_score': 1.0},
+        {'id': 1, 'title': 'Dune', 'release_date': '1984-12-14', 'match_score': 1.0},
+    ]
+    assert offline_index.is_confident('movie', results, 'Dune', 2021)
+    assert not offline_index.is_confident('movie', results, 'Dune', 1984)
+    assert not offline_index.is_confident('movie', results, 'Dune')
+
+
+def test_bad_export_lines_are_skipped(tmp_path):
+    export = tmp_path / 'movie_ids_test.json'
+    export.write_text('{"id": 1, "original_title": "Heat", "popularity": 1}\nnot json\n'
+                      '{"id": 2, "original_title": "Adult", "adult": true}\n')
+    db_path = str(tmp_path / 'index.db')
+    assert offline_index.build_index(db_path, [(offline_index.kind_of(str(export)), str(export))]) == {'movie': 1}
+    assert offline_index.OfflineIndex(db_path).search('movie', 'Heat')[0]['id'] == 1
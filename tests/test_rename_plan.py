@@ -0,0 +1,95 @@
+"""
+Batch rename planning, journaling and undo
+"""
+
+import os
+
+from app import rename_plan
+
+
+def make_files(directory, contents):
+    for name, data in contents.items():
+        (directory / name).write_text(data)
+
+
+def read_files(directory):
+    return {path.name: path.read_text() for path in directory.iterdir()}
+
+
+def run(directory, journal_dir, renames):
+    plan = rename_plan.RenamePlan([(str(directory / src), str(directory / dst)) for src, dst in renames])
+    journal = rename_plan.RenameJournal(str(journal_dir), plan.batch_id)
+    results = dict(rename_plan.execute_plan(plan, journal))
+    return plan, [results[i] for i in range(len(renames))]
+
+
+def test_chain_is_ordered_so_nothing_is_overwritten(tmp_path):
+    media, journal_dir = tmp_path / 'media', tmp_path / 'journal'
+    media.mkdir()
+    make_files(media, {'a.mkv': 'A', 'b.mkv': 'B'})
+
+    plan, results = run(media, journal_dir, [('a.mkv', 'b.mkv'), ('b.mkv', 'c.mkv')])
+
+    assert all(result['success'] for result in results)
+    assert [os.path.basename(step['dst']) for step in plan.steps] == ['c.mkv', 'b.mkv']
+    assert read_files(media) == {'b.mkv': 'A', 'c.mkv': 'B'}
+
+
+def test_cycle_goes_through_a_temporary_name_and_undoes(tmp_path):
+    media, journal_dir = tmp_path / 'media', tmp_path / 'journal'
+    media.mkdir()
+    make_files(media, {'a.mkv': 'A', 'b.mkv': 'B', 'c.mkv': 'C'})
+
+    plan, results = run(media, journal_dir, [('a.mkv', 'b.mkv'), ('b.mkv', 'c.mkv'), ('c.mkv', 'a.mkv')])
+
+    assert all(result['success'] for result in results)
+    assert sum(1 for step in plan.steps if step.get('temp')) == 1
+    assert read_files(media) == {'a.mkv': 'C', 'b.mkv': 'A', 'c.mkv': 'B'}
+    assert not rename_plan.RenameJournal.running(str(journal_dir), plan.batch_id)
+
+    undone = rename_plan.undo_batch(str(journal_dir), plan.batch_id)
+
+    assert len(undone) == 3 and all(result['success'] for result in undone)
+    assert read_files(media) == {'a.mkv': 'A', 'b.mkv': 'B', 'c.mkv': 'C'}
+    # Undoing again finds nothing left to undo
+    assert rename_plan.undo_batch(str(journal_dir), plan.batch_id) == []
+
+
+def test_conflicts_are_refused_before_anything_moves(tmp_path):
+    media, journal_dir = tmp_path / 'media', tmp_path / 'journal'
+    media.mkdir()
+    make_files(media, {'a.mkv': 'A', 'b.mkv': 'B', 'taken.mkv': 'T'})
+
+    _, results = run(media, journal_dir, [('a.mkv', 'new.mkv'), ('b.mkv', 'new.mkv'),
+                                          ('missing.mkv', 'x.mkv'), ('b.mkv', 'taken.mkv')])
+
+    assert results[0]['success']
+    assert results[1]['message'] == 'Another file in this batch has the same new name'
+    assert results[2]['message'] == 'File not found'
+    assert results[3]['message'] == 'Destination file already exists'
+    assert read_files(media) == {'new.mkv': 'A', 'b.mkv': 'B', 'taken.mkv': 'T'}
+
+
+def test_undo_after_an_interrupted_batch_trusts_the_filesystem(tmp_path):
+    media, journal_dir = tmp_path / 'media', tmp_path / 'journal'
+    media.mkdir()
+    make_files(media, {'a.mkv': 'A', 'b.mkv': 'B'})
+
+    plan = rename_plan.RenamePlan([(str(media / 'a.mkv'), str(media / 'x.mkv')),
+                                   (str(media / 'b.mkv'), str(media / 'y.mkv'))])
+    journal = rename_plan.RenameJournal(str(journal_dir), plan.batch_id)
+    journal.write_plan(plan)
+    # A crash right after the first rename, before its record was written
+    os.rename(plan.steps[0]['src'], plan.steps[0]['dst'])
+    journal._file.close()
+    assert rename_plan.RenameJournal.running(str(journal_dir), plan.batch_id)
+
+    undone = rename_plan.undo_batch(str(journal_dir), plan.batch_id)
+
+    assert [result['success'] for result in undone] == [True]
+    assert read_files(media) == {'a.mkv': 'A', 'b.mkv': 'B'}
+
+
+def test_unknown_batch_cannot_be_undone(tmp_path):
+    assert rename_plan.undo_batch(str(tmp_path), 'f' * 32) is None
+    assert rename_plan.undo_batch(str(tmp_path), '../etc') is None